@@ -3,9 +3,11 @@ AI Model Adapters
 
 Unified interface for all AI model providers.
 Each adapter implements the BaseAdapter interface.
+chat() streams text; chat_events() streams structured events (events.py).
 """
 
 from .base import BaseAdapter
+from .events import ChatError, ChatEvent, Finish, TextDelta, TimingMark, TokenUsage, UsageReport
 from .openai import OpenAIAdapter
 from .anthropic import AnthropicAdapter
 from .google import GoogleAdapter
@@ -13,6 +15,13 @@ from .xai import XAIAdapter
 
 __all__ = [
     "BaseAdapter",
+    "TokenUsage",
+    "ChatEvent",
+    "TextDelta",
+    "UsageReport",
+    "Finish",
+    "TimingMark",
+    "ChatError",
     "OpenAIAdapter",
     "AnthropicAdapter",
     "GoogleAdapter",
@@ -4,9 +4,17 @@ Anthropic Adapter
 Implements BaseAdapter for Anthropic models (Claude 3.5 Sonnet, etc.)
 """
 
-from typing import AsyncIterator, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 import anthropic
+from utils.http import get_http_client
+from utils.tokenizer import tokenizer_service
 from .base import BaseAdapter
+from .events import ChatEvent, Finish, TextDelta, TokenUsage, UsageReport
+from .prompt_cache import prompt_cache_planner
+
+
+# Prompt caching beta (needed by the pinned SDK / API version)
+PROMPT_CACHING_BETA = "prompt-caching-2024-07-31"
 
 
 class AnthropicAdapter(BaseAdapter):
@@ -14,9 +22,19 @@ class AnthropicAdapter(BaseAdapter):
 
     def __init__(self, api_key: str, **kwargs):
         super().__init__(api_key, **kwargs)
-        self.client = anthropic.AsyncAnthropic(api_key=api_key)
+        base_url = kwargs.get("base_url", "https://api.anthropic.com")
+        # The SDK sends the key per request, so the pooled client is shared across workspaces
+        self.client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=get_http_client(base_url)
+        )
 
-    async def chat(
+    # Cache reads cost 10% of the input price, cache writes 125%
+    CACHE_READ_PRICE_RATIO = 0.1
+    CACHE_WRITE_PRICE_RATIO = 1.25
+
+    async def _chat_events(
         self,
         messages: List[Dict[str, str]],
         model: str,
@@ -24,49 +42,81 @@ class AnthropicAdapter(BaseAdapter):
         temperature: float = 0.7,
         max_tokens: Optional[int] = 1024,
         **kwargs
-    ) -> AsyncIterator[str]:
-        """Send chat request to Anthropic API"""
+    ) -> AsyncIterator[ChatEvent]:
+        """
+        Send chat request to Anthropic API.
 
+        Stable prefixes (a repeated system prompt, the history of a
+        continuing conversation) are marked for prompt caching.
+        """
         # Anthropic requires max_tokens
         if max_tokens is None:
             max_tokens = 4096
 
-        # Extract system message if present
-        system_message = None
+        # Extract system messages (e.g. the prompt plus a history summary)
+        system_parts = []
         user_messages = []
 
         for msg in messages:
             if msg["role"] == "system":
-                system_message = msg["content"]
+                system_parts.append(msg["content"])
             else:
                 user_messages.append(msg)
+        system_message = "\n\n".join(system_parts) if system_parts else None
+
+        plan = prompt_cache_planner.plan(model, system_message, user_messages)
+        if plan.system or plan.messages:
+            kwargs.setdefault("extra_headers", {}).update({"anthropic-beta": PROMPT_CACHING_BETA})
+        system = system_message
+        if plan.system:
+            system = [_cached_text_block(system_message)]
+        for index in plan.messages:
+            msg = user_messages[index]
+            user_messages[index] = {"role": msg["role"], "content": [_cached_text_block(msg["content"])]}
 
         response = await self.client.messages.create(
             model=model,
             messages=user_messages,
             max_tokens=max_tokens,
             temperature=temperature,
-            system=system_message,
+            system=system,
             stream=stream,
             **kwargs
         )
 
         if stream:
-            async for chunk in response:
-                if chunk.type == "content_block_delta":
-                    if hasattr(chunk.delta, "text"):
-                        yield chunk.delta.text
+            usage = None
+            stop_reason = None
+            try:
+                async for chunk in response:
+                    if chunk.type == "content_block_delta":
+                        if hasattr(chunk.delta, "text"):
+                            yield TextDelta(text=chunk.delta.text)
+                    elif chunk.type == "message_start":
+                        usage = _token_usage(chunk.message.usage)
+                    elif chunk.type == "message_delta":
+                        # Output tokens so far; the last delta has the total
+                        if usage is not None:
+                            usage.output_tokens = chunk.usage.output_tokens
+                        stop_reason = chunk.delta.stop_reason or stop_reason
+            finally:
+                # Stops the upstream generation if the consumer went away
+                await response.close()
+            if usage is not None:
+                yield UsageReport(usage=usage)
+            yield Finish(reason=stop_reason)
         else:
-            yield response.content[0].text
+            yield TextDelta(text=response.content[0].text)
+            yield UsageReport(usage=_token_usage(response.usage))
+            yield Finish(reason=response.stop_reason)
 
     async def count_tokens(self, text: str, model: str) -> int:
         """
-        Count tokens using Anthropic's method.
-        Note: Anthropic uses a different tokenizer than OpenAI.
+        Estimate tokens for Claude.
+        Note: Anthropic's tokenizer is not available locally, so this is the
+        cl100k count scaled by the calibrated Anthropic ratio.
         """
-        # Rough estimate: ~4 chars per token for Claude
-        # For accurate counting, use Anthropic's tokenizer when available
-        return len(text) // 4
+        return await tokenizer_service.count_async(text, provider="anthropic")
 
     async def list_models(self) -> List[Dict[str, any]]:
         """List available Anthropic models"""
@@ -113,3 +163,19 @@ class AnthropicAdapter(BaseAdapter):
             "claude-3-5-haiku-20241022": {"input": 0.025, "output": 0.125},
             "claude-3-opus-20240229": {"input": 1.50, "output": 7.50},
         }
+
+
+def _cached_text_block(text: str) -> Dict[str, Any]:
+    """Text content block marked as a prompt-cache breakpoint"""
+    return {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+
+
+def _token_usage(reported: Any) -> TokenUsage:
+    """Anthropic usage as TokenUsage (cache fields are absent when nothing was cached)"""
+    return TokenUsage(
+        input_tokens=reported.input_tokens,
+        cache_write_input_tokens=getattr(reported, "cache_creation_input_tokens", None) or 0,
+        cache_read_input_tokens=getattr(reported, "cache_read_input_tokens", None) or 0,
+        output_tokens=reported.output_tokens,
+        reported=True
+    )
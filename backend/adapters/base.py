@@ -8,6 +8,10 @@ This ensures Lucidia can route to any provider with the same interface.
 from abc import ABC, abstractmethod
 from typing import AsyncIterator, Dict, List, Optional
 from datetime import datetime
+import time
+
+from utils.metrics import PROVIDER_COMPLETION_SECONDS, PROVIDER_FIRST_CHUNK_SECONDS, PROVIDER_REQUESTS
+from .events import ChatError, ChatEvent, TextDelta, TimingMark, TokenUsage
 
 
 class BaseAdapter(ABC):
@@ -29,7 +33,6 @@ class BaseAdapter(ABC):
         self.api_key = api_key
         self.config = kwargs
 
-    @abstractmethod
     async def chat(
         self,
         messages: List[Dict[str, str]],
@@ -42,17 +45,120 @@ class BaseAdapter(ABC):
         """
         Send a chat request to the AI model.
 
+        Text-only view of chat_events(): errors are raised instead of
+        yielded.
+
         Args:
             messages: List of message dicts with 'role' and 'content'
             model: Model identifier (e.g., 'gpt-4o', 'claude-3-5-sonnet')
             stream: Whether to stream the response
             temperature: Sampling temperature (0-2)
             max_tokens: Maximum tokens to generate
-            **kwargs: Provider-specific parameters
+            **kwargs: Provider-specific parameters; `usage` (a TokenUsage)
+                receives the provider-reported usage where supported
 
         Yields:
             str: Response chunks (if streaming) or full response
         """
+        usage: Optional[TokenUsage] = kwargs.pop("usage", None)
+        events = self.chat_events(
+            messages, model, stream=stream, temperature=temperature, max_tokens=max_tokens, **kwargs
+        )
+        try:
+            async for event in events:
+                if event.type == "text":
+                    yield event.text
+                elif event.type == "usage" and usage is not None:
+                    for field in TokenUsage.model_fields:
+                        setattr(usage, field, getattr(event.usage, field))
+                elif event.type == "error":
+                    raise event.exception
+        finally:
+            await events.aclose()
+
+    async def chat_events(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        stream: bool = True,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> AsyncIterator[ChatEvent]:
+        """
+        Send a chat request and stream structured events.
+
+        Yields the adapter's text, usage and finish events, plus timing
+        marks: "first_chunk" before the first text and "completed" with
+        the total time and inter-chunk gaps. A failure becomes a final
+        ChatError event (cancellation still propagates). The same timings
+        and the request's outcome go to the provider metrics.
+
+        Args: as for chat()
+
+        Yields:
+            ChatEvent: See adapters/events.py
+        """
+        provider = self.get_provider_name()
+        outcome = "cancelled"
+        started = time.perf_counter()
+        last_chunk_at = None
+        chunks = 0
+        total_gap = 0.0
+        max_gap = 0.0
+
+        events = self._chat_events(
+            messages, model, stream=stream, temperature=temperature, max_tokens=max_tokens, **kwargs
+        )
+        try:
+            async for event in events:
+                if event.type == "text":
+                    now = time.perf_counter()
+                    if last_chunk_at is None:
+                        PROVIDER_FIRST_CHUNK_SECONDS.observe(now - started, provider, model)
+                        yield TimingMark(mark="first_chunk", elapsed_seconds=now - started)
+                    else:
+                        gap = now - last_chunk_at
+                        total_gap += gap
+                        max_gap = max(max_gap, gap)
+                    last_chunk_at = now
+                    chunks += 1
+                yield event
+            outcome = "ok"
+        except Exception as e:
+            outcome = "error"
+            yield ChatError.from_exception(e)
+            return
+        finally:
+            PROVIDER_REQUESTS.inc(provider, model, outcome)
+            # Closing the provider stream stops generation if we stopped early
+            await events.aclose()
+
+        elapsed = time.perf_counter() - started
+        PROVIDER_COMPLETION_SECONDS.observe(elapsed, provider, model)
+        yield TimingMark(
+            mark="completed",
+            elapsed_seconds=elapsed,
+            chunks=chunks,
+            mean_gap_seconds=total_gap / (chunks - 1) if chunks > 1 else 0.0,
+            max_gap_seconds=max_gap
+        )
+
+    @abstractmethod
+    async def _chat_events(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        stream: bool = True,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        **kwargs
+    ) -> AsyncIterator[ChatEvent]:
+        """
+        Provider-specific request: yield TextDelta per chunk, then a
+        UsageReport and a Finish when the provider reports them.
+        Exceptions propagate; chat_events() adds timing and errors.
+        """
         pass
 
     @abstractmethod
@@ -89,15 +195,39 @@ class BaseAdapter(ABC):
         """
         pass
 
+    # Whether embed() is implemented (used by the semantic cache)
+    supports_embeddings = False
+
+    async def embed(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """
+        Embed texts for semantic search.
+
+        Optional: providers without an embeddings API leave
+        supports_embeddings False and raise NotImplementedError.
+
+        Args:
+            texts: Texts to embed
+            model: Embedding model (provider default if None)
+
+        Returns:
+            One vector per text
+        """
+        raise NotImplementedError(f"{self.get_provider_name()} does not support embeddings")
+
     def get_provider_name(self) -> str:
         """Get the provider name (e.g., 'openai', 'anthropic')"""
         return self.__class__.__name__.replace("Adapter", "").lower()
 
+    # Prompt-cache input prices relative to the normal input price
+    CACHE_READ_PRICE_RATIO = 1.0
+    CACHE_WRITE_PRICE_RATIO = 1.0
+
     def estimate_cost(
         self,
         input_tokens: int,
         output_tokens: int,
-        model: str
+        model: str,
+        usage: Optional[TokenUsage] = None
     ) -> float:
         """
         Estimate cost in RoadCoin for a request.
@@ -106,6 +236,8 @@ class BaseAdapter(ABC):
             input_tokens: Number of input tokens
             output_tokens: Number of output tokens
             model: Model identifier
+            usage: Provider-reported usage; when reported, it replaces the
+                token counts and prices prompt-cache reads/writes
 
         Returns:
             float: Estimated cost in RoadCoin
@@ -115,6 +247,14 @@ class BaseAdapter(ABC):
         pricing = self._get_model_pricing()
         model_price = pricing.get(model, {"input": 0, "output": 0})
 
+        if usage is not None and usage.reported:
+            input_tokens = (
+                usage.input_tokens +
+                usage.cache_read_input_tokens * self.CACHE_READ_PRICE_RATIO +
+                usage.cache_write_input_tokens * self.CACHE_WRITE_PRICE_RATIO
+            )
+            output_tokens = usage.output_tokens
+
         cost = (
             (input_tokens / 1000) * model_price["input"] +
             (output_tokens / 1000) * model_price["output"]
@@ -0,0 +1,80 @@
+"""
+Chat Stream Events
+
+Structured events from BaseAdapter.chat_events():
+
+- TextDelta: a chunk of response text
+- UsageReport: provider-reported token usage (once, near the end)
+- Finish: why the model stopped (provider's own reason string)
+- TimingMark: "first_chunk" (time to first text) and "completed" (total
+  time plus inter-chunk gaps)
+- ChatError: the request failed; always the last event
+
+TokenUsage (carried by UsageReport) is also what chat(usage=...) fills in.
+
+Every event has a `type` literal, so a stream serializes directly (e.g.
+to SSE) with model_dump().
+"""
+
+from typing import Literal, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field
+
+
+class TokenUsage(BaseModel):
+    """
+    Provider-reported token usage for one chat request.
+
+    Pass one to chat() as `usage=`; adapters that report usage fill it in.
+    input_tokens excludes prompt-cache reads and writes.
+    """
+    input_tokens: int = 0
+    cache_write_input_tokens: int = 0
+    cache_read_input_tokens: int = 0
+    output_tokens: int = 0
+    reported: bool = False
+
+    @property
+    def total_input_tokens(self) -> int:
+        return self.input_tokens + self.cache_write_input_tokens + self.cache_read_input_tokens
+
+
+class TextDelta(BaseModel):
+    type: Literal["text"] = "text"
+    text: str
+
+
+class UsageReport(BaseModel):
+    type: Literal["usage"] = "usage"
+    usage: TokenUsage
+
+
+class Finish(BaseModel):
+    type: Literal["finish"] = "finish"
+    reason: Optional[str] = None
+
+
+class TimingMark(BaseModel):
+    type: Literal["timing"] = "timing"
+    mark: Literal["first_chunk", "completed"]
+    elapsed_seconds: float
+    chunks: int = 0
+    mean_gap_seconds: float = 0.0
+    max_gap_seconds: float = 0.0
+
+
+class ChatError(BaseModel):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    type: Literal["error"] = "error"
+    error_type: str
+    message: str
+    # The original exception, for callers that re-raise (not serialized)
+    exception: Optional[BaseException] = Field(None, exclude=True)
+
+    @classmethod
+    def from_exception(cls, exc: BaseException) -> "ChatError":
+        return cls(error_type=type(exc).__name__, message=str(exc), exception=exc)
+
+
+ChatEvent = Union[TextDelta, UsageReport, Finish, TimingMark, ChatError]
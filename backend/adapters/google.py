@@ -2,11 +2,81 @@
 Google Adapter
 
 Implements BaseAdapter for Google models (Gemini)
+
+genai.configure() sets process-wide credentials, so workspaces with
+different keys would overwrite each other. Instead every key gets its own
+API clients (shared by adapters with the same key), and GenerativeModel
+handles are cached per (key, model, generation config) on top of them.
 """
 
-from typing import AsyncIterator, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import google.ai.generativelanguage as glm
 import google.generativeai as genai
+from utils.cache import LRUCache
+from utils.tokenizer import tokenizer_service
 from .base import BaseAdapter
+from .events import ChatEvent, Finish, TextDelta, TokenUsage, UsageReport
+
+
+class _KeyClients:
+    """API clients bound to one API key, plus that key's model handles"""
+
+    def __init__(self, api_key: str):
+        self.client_options = {"api_key": api_key}
+        self.models = LRUCache(maxsize=64)
+        self._generative = None
+        self._generative_async = None
+        self._model_service = None
+
+    @property
+    def generative(self) -> glm.GenerativeServiceClient:
+        if self._generative is None:
+            self._generative = glm.GenerativeServiceClient(client_options=self.client_options)
+        return self._generative
+
+    @property
+    def generative_async(self) -> glm.GenerativeServiceAsyncClient:
+        # Created on first use, inside the event loop it will run on
+        if self._generative_async is None:
+            self._generative_async = glm.GenerativeServiceAsyncClient(client_options=self.client_options)
+        return self._generative_async
+
+    @property
+    def model_service(self) -> glm.ModelServiceClient:
+        if self._model_service is None:
+            self._model_service = glm.ModelServiceClient(client_options=self.client_options)
+        return self._model_service
+
+    def model(
+        self,
+        model: str,
+        generation_config: Optional[Dict[str, Any]] = None
+    ) -> genai.GenerativeModel:
+        """Cached GenerativeModel for this key, model and generation config"""
+        config = generation_config or {}
+        cache_key = (model, tuple(sorted(config.items())))
+        handle = self.models.get(cache_key)
+        if handle is None:
+            handle = genai.GenerativeModel(model, generation_config=config or None)
+            # GenerativeModel falls back to the global (configure()) clients
+            # only when these are unset
+            handle._client = self.generative
+            handle._async_client = self.generative_async
+            self.models.set(cache_key, handle)
+        return handle
+
+
+# Clients per API key, so adapters built for the same key share connections
+_key_clients = LRUCache(maxsize=256)
+
+
+def _clients_for(api_key: str) -> _KeyClients:
+    clients = _key_clients.get(api_key)
+    if clients is None:
+        clients = _KeyClients(api_key)
+        _key_clients.set(api_key, clients)
+    return clients
 
 
 class GoogleAdapter(BaseAdapter):
@@ -14,9 +84,9 @@ class GoogleAdapter(BaseAdapter):
 
     def __init__(self, api_key: str, **kwargs):
         super().__init__(api_key, **kwargs)
-        genai.configure(api_key=api_key)
+        self.clients = _clients_for(api_key)
 
-    async def chat(
+    async def _chat_events(
         self,
         messages: List[Dict[str, str]],
         model: str,
@@ -24,7 +94,7 @@ class GoogleAdapter(BaseAdapter):
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         **kwargs
-    ) -> AsyncIterator[str]:
+    ) -> AsyncIterator[ChatEvent]:
         """Send chat request to Google Gemini API"""
 
         # Convert messages to Gemini format
@@ -38,37 +108,51 @@ class GoogleAdapter(BaseAdapter):
         if messages:
             current_message = messages[-1]["content"]
 
-        # Create model
-        model_instance = genai.GenerativeModel(model)
+        # Cached model handle for this key and generation config
+        model_instance = self.clients.model(model, {
+            "temperature": temperature,
+            "max_output_tokens": max_tokens,
+        })
 
         # Start chat
         chat = model_instance.start_chat(history=history)
 
         # Send message
-        response = await chat.send_message_async(
-            current_message,
-            stream=stream,
-            generation_config={
-                "temperature": temperature,
-                "max_output_tokens": max_tokens,
-            }
-        )
+        response = await chat.send_message_async(current_message, stream=stream)
 
+        last = response
         if stream:
             async for chunk in response:
-                yield chunk.text
+                yield TextDelta(text=chunk.text)
+                last = chunk
         else:
-            yield response.text
+            yield TextDelta(text=response.text)
+
+        # Usage metadata arrives with the final chunk (newer API versions only)
+        usage = getattr(last, "usage_metadata", None)
+        if usage:
+            cached = getattr(usage, "cached_content_token_count", 0) or 0
+            yield UsageReport(usage=TokenUsage(
+                input_tokens=usage.prompt_token_count - cached,
+                cache_read_input_tokens=cached,
+                output_tokens=usage.candidates_token_count,
+                reported=True
+            ))
+        candidates = getattr(last, "candidates", None)
+        reason = getattr(candidates[0].finish_reason, "name", None) if candidates else None
+        yield Finish(reason=reason)
 
     async def count_tokens(self, text: str, model: str) -> int:
-        """Count tokens using Gemini's method"""
-        model_instance = genai.GenerativeModel(model)
-        result = await model_instance.count_tokens_async(text)
-        return result.total_tokens
+        """
+        Estimate tokens for Gemini.
+        Note: Gemini's exact count is a network call, so this is the local
+        cl100k count scaled by the calibrated Google ratio.
+        """
+        return await tokenizer_service.count_async(text, provider="google")
 
     async def list_models(self) -> List[Dict[str, any]]:
         """List available Gemini models"""
-        models = genai.list_models()
+        models = await asyncio.to_thread(self._list_models)
         return [
             {
                 "id": model.name.replace("models/", ""),
@@ -82,11 +166,15 @@ class GoogleAdapter(BaseAdapter):
     async def validate_key(self) -> bool:
         """Validate Google API key"""
         try:
-            list(genai.list_models())
+            await asyncio.to_thread(self._list_models)
             return True
         except Exception:
             return False
 
+    def _list_models(self) -> list:
+        """Blocking model listing with this adapter's key (run off the event loop)"""
+        return list(genai.list_models(client=self.clients.model_service))
+
     def _get_model_pricing(self) -> Dict[str, Dict[str, float]]:
         """
         Google Gemini pricing in RoadCoin (per 1K tokens)
@@ -4,19 +4,35 @@ OpenAI Adapter
 Implements BaseAdapter for OpenAI models (GPT-4o, o1, etc.)
 """
 
-from typing import AsyncIterator, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 import openai
+from utils.http import get_http_client
+from utils.tokenizer import tokenizer_service
 from .base import BaseAdapter
+from .events import ChatEvent, Finish, TextDelta, TokenUsage, UsageReport
 
 
 class OpenAIAdapter(BaseAdapter):
     """OpenAI model adapter (GPT-4o, GPT-4o-mini, o1, etc.)"""
 
+    # 1536 dimensions, matching MessageEmbedding.embedding
+    EMBEDDING_MODEL = "text-embedding-3-small"
+    supports_embeddings = True
+
     def __init__(self, api_key: str, **kwargs):
         super().__init__(api_key, **kwargs)
-        self.client = openai.AsyncOpenAI(api_key=api_key)
+        base_url = kwargs.get("base_url", "https://api.openai.com/v1")
+        # The SDK sends the key per request, so the pooled client is shared across workspaces
+        self.client = openai.AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url,
+            http_client=get_http_client(base_url)
+        )
+
+    # Cached prompt tokens are billed at half the input price
+    CACHE_READ_PRICE_RATIO = 0.5
 
-    async def chat(
+    async def _chat_events(
         self,
         messages: List[Dict[str, str]],
         model: str,
@@ -24,8 +40,17 @@ class OpenAIAdapter(BaseAdapter):
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         **kwargs
-    ) -> AsyncIterator[str]:
-        """Send chat request to OpenAI API"""
+    ) -> AsyncIterator[ChatEvent]:
+        """
+        Send chat request to OpenAI API.
+
+        OpenAI caches long prompt prefixes automatically; cached input
+        tokens are reported in the usage event.
+        """
+        if stream:
+            # The final chunk then carries usage (stream_options is newer than the pinned SDK)
+            # A new dict: the caller's extra_body is left as it was
+            kwargs["extra_body"] = {**(kwargs.get("extra_body") or {}), "stream_options": {"include_usage": True}}
 
         response = await self.client.chat.completions.create(
             model=model,
@@ -37,22 +62,41 @@ class OpenAIAdapter(BaseAdapter):
         )
 
         if stream:
-            async for chunk in response:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
+            finish_reason = None
+            usage = None
+            try:
+                async for chunk in response:
+                    if chunk.choices:
+                        choice = chunk.choices[0]
+                        if choice.delta.content:
+                            yield TextDelta(text=choice.delta.content)
+                        finish_reason = choice.finish_reason or finish_reason
+                    if getattr(chunk, "usage", None):
+                        usage = _token_usage(chunk.usage)
+            finally:
+                # Stops the upstream generation if the consumer went away
+                await response.close()
+            if usage is not None:
+                yield UsageReport(usage=usage)
+            yield Finish(reason=finish_reason)
         else:
-            yield response.choices[0].message.content
-
-    async def count_tokens(self, text: str, model: str) -> int:
-        """Count tokens using tiktoken"""
-        import tiktoken
+            choice = response.choices[0]
+            yield TextDelta(text=choice.message.content or "")
+            if response.usage:
+                yield UsageReport(usage=_token_usage(response.usage))
+            yield Finish(reason=choice.finish_reason)
 
-        try:
-            encoding = tiktoken.encoding_for_model(model)
-        except KeyError:
-            encoding = tiktoken.get_encoding("cl100k_base")
+    async def embed(self, texts: List[str], model: Optional[str] = None) -> List[List[float]]:
+        """Embed texts with OpenAI embeddings (one batched request)"""
+        response = await self.client.embeddings.create(
+            model=model or self.EMBEDDING_MODEL,
+            input=texts
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
 
-        return len(encoding.encode(text))
+    async def count_tokens(self, text: str, model: str) -> int:
+        """Count tokens with the model's tiktoken encoding"""
+        return await tokenizer_service.count_async(text, model=model)
 
     async def list_models(self) -> List[Dict[str, any]]:
         """List available OpenAI models"""
@@ -87,3 +131,28 @@ class OpenAIAdapter(BaseAdapter):
             "o1": {"input": 1.50, "output": 6.00},
             "o1-mini": {"input": 0.30, "output": 1.20},
         }
+
+
+def _token_usage(reported: Any) -> TokenUsage:
+    """OpenAI usage as TokenUsage (prompt_tokens includes the cached ones)"""
+    details = _field(reported, "prompt_tokens_details")
+    cached = _field(details, "cached_tokens") or 0
+    prompt_tokens = _field(reported, "prompt_tokens") or 0
+    return TokenUsage(
+        input_tokens=prompt_tokens - cached,
+        cache_read_input_tokens=cached,
+        output_tokens=_field(reported, "completion_tokens") or 0,
+        reported=True
+    )
+
+
+def _field(value: Any, name: str) -> Any:
+    """
+    Attribute of an SDK object, or key of a plain dict.
+
+    Fields newer than the pinned SDK (streamed chunk usage, prompt token
+    details) arrive as dicts.
+    """
+    if isinstance(value, dict):
+        return value.get(name)
+    return getattr(value, name, None)
@@ -0,0 +1,92 @@
+"""
+Prompt Cache Planning
+
+Chooses where to put provider prompt-cache breakpoints.
+
+Providers with explicit prompt caching (Anthropic) only reuse a prefix
+that a request marked. Marking costs extra on the first write, so only
+prefixes that are likely to be sent again are marked:
+
+- the system prompt, once the same system prompt was seen recently
+- the history so far, once a request turns out to continue an earlier
+  one (its prefix up to the previous user turn is a prompt sent before)
+
+Prefix digests of recent requests are kept for about as long as the
+provider keeps a cache entry, and include the model, since caches are
+per model.
+"""
+
+from typing import Dict, List, NamedTuple, Optional
+import hashlib
+
+from utils.cache import TTLCache
+
+
+# Provider cache entries live ~5 minutes after their last use
+PROMPT_CACHE_TTL_SECONDS = 300.0
+
+
+class CachePlan(NamedTuple):
+    """Breakpoints for one request"""
+    system: bool
+    messages: List[int]
+
+
+class PromptCachePlanner:
+    """Remembers recent prompt prefixes and marks the stable ones"""
+
+    def __init__(self, ttl: float = PROMPT_CACHE_TTL_SECONDS, maxsize: int = 16384):
+        self.seen = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def plan(
+        self,
+        model: str,
+        system: Optional[str],
+        messages: List[Dict[str, str]]
+    ) -> CachePlan:
+        """
+        Breakpoints for a request, and record its prefixes for later ones.
+
+        Args:
+            model: Model the request goes to
+            system: System prompt (None if there is none)
+            messages: Conversation messages (no system messages), the new
+                user turn last
+
+        Returns:
+            Whether to mark the system prompt, and the message indexes to
+            mark (each caches the prompt up to and including that message)
+        """
+        prefixes = _prefix_digests(model, system, messages)
+        system_digest, full_digest = prefixes[0], prefixes[-1]
+
+        cache_system = system is not None and system_digest in self.seen
+        marks = []
+        # A continuation re-sends the previous request plus (reply, new turn):
+        # cache everything up to the reply for the next turn
+        if len(messages) >= 3 and prefixes[len(messages) - 2] in self.seen:
+            marks.append(len(messages) - 2)
+
+        if system is not None:
+            self.seen.set(system_digest, True)
+        self.seen.set(full_digest, True)
+        return CachePlan(cache_system, marks)
+
+
+def _prefix_digests(model: str, system: Optional[str], messages: List[Dict[str, str]]) -> List[bytes]:
+    """Digest of (model, system) and of every message prefix after it"""
+    digest = hashlib.sha256()
+    digest.update(model.encode())
+    digest.update(b"\0")
+    digest.update((system or "").encode())
+    prefixes = [digest.digest()]
+    for msg in messages:
+        digest.update(b"\0")
+        digest.update(msg["role"].encode())
+        digest.update(b"\0")
+        digest.update(str(msg["content"]).encode())
+        prefixes.append(digest.digest())
+    return prefixes
+
+
+prompt_cache_planner = PromptCachePlanner()
@@ -4,9 +4,12 @@ xAI Adapter
 Implements BaseAdapter for xAI models (Grok)
 """
 
-from typing import AsyncIterator, Dict, List, Optional
-import httpx
+from typing import Any, AsyncIterator, Dict, List, Optional
+import json
+from utils.http import get_http_client
+from utils.tokenizer import tokenizer_service
 from .base import BaseAdapter
+from .events import ChatEvent, Finish, TextDelta, TokenUsage, UsageReport
 
 
 class XAIAdapter(BaseAdapter):
@@ -15,12 +18,10 @@ class XAIAdapter(BaseAdapter):
     def __init__(self, api_key: str, **kwargs):
         super().__init__(api_key, **kwargs)
         self.base_url = kwargs.get("base_url", "https://api.x.ai/v1")
-        self.client = httpx.AsyncClient(
-            headers={"Authorization": f"Bearer {api_key}"},
-            timeout=60.0
-        )
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.client = get_http_client(self.base_url)
 
-    async def chat(
+    async def _chat_events(
         self,
         messages: List[Dict[str, str]],
         model: str,
@@ -28,7 +29,7 @@ class XAIAdapter(BaseAdapter):
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         **kwargs
-    ) -> AsyncIterator[str]:
+    ) -> AsyncIterator[ChatEvent]:
         """
         Send chat request to xAI API.
 
@@ -46,40 +47,57 @@ class XAIAdapter(BaseAdapter):
             payload["max_tokens"] = max_tokens
 
         if stream:
+            payload["stream_options"] = {"include_usage": True}
+            finish_reason = None
+            usage = None
             async with self.client.stream(
                 "POST",
                 f"{self.base_url}/chat/completions",
-                json=payload
+                json=payload,
+                headers=self.headers
             ) as response:
+                # An error status would otherwise read as an empty stream
+                response.raise_for_status()
                 async for line in response.aiter_lines():
                     if line.startswith("data: "):
                         data = line[6:]
                         if data == "[DONE]":
                             break
 
-                        import json
                         try:
                             chunk = json.loads(data)
-                            if chunk["choices"][0]["delta"].get("content"):
-                                yield chunk["choices"][0]["delta"]["content"]
-                        except:
+                        except ValueError:
                             continue
+                        if chunk.get("choices"):
+                            choice = chunk["choices"][0]
+                            if choice.get("delta", {}).get("content"):
+                                yield TextDelta(text=choice["delta"]["content"])
+                            finish_reason = choice.get("finish_reason") or finish_reason
+                        if chunk.get("usage"):
+                            usage = _token_usage(chunk["usage"])
+            if usage is not None:
+                yield UsageReport(usage=usage)
+            yield Finish(reason=finish_reason)
         else:
             response = await self.client.post(
                 f"{self.base_url}/chat/completions",
-                json=payload
+                json=payload,
+                headers=self.headers
             )
+            response.raise_for_status()
             result = response.json()
-            yield result["choices"][0]["message"]["content"]
+            choice = result["choices"][0]
+            yield TextDelta(text=choice["message"]["content"])
+            if result.get("usage"):
+                yield UsageReport(usage=_token_usage(result["usage"]))
+            yield Finish(reason=choice.get("finish_reason"))
 
     async def count_tokens(self, text: str, model: str) -> int:
         """
         Count tokens for Grok.
         Uses similar tokenizer to GPT models.
         """
-        import tiktoken
-        encoding = tiktoken.get_encoding("cl100k_base")
-        return len(encoding.encode(text))
+        return await tokenizer_service.count_async(text, provider="xai")
 
     async def list_models(self) -> List[Dict[str, any]]:
         """List available xAI models"""
@@ -95,7 +113,7 @@ class XAIAdapter(BaseAdapter):
     async def validate_key(self) -> bool:
         """Validate xAI API key"""
         try:
-            response = await self.client.get(f"{self.base_url}/models")
+            response = await self.client.get(f"{self.base_url}/models", headers=self.headers)
             return response.status_code == 200
         except Exception:
             return False
@@ -110,5 +128,15 @@ class XAIAdapter(BaseAdapter):
         }
 
     async def close(self):
-        """Close the HTTP client"""
-        await self.client.aclose()
+        """No-op: the pooled HTTP client is shared and closed at shutdown"""
+
+
+def _token_usage(reported: Dict[str, Any]) -> TokenUsage:
+    """xAI (OpenAI-format) usage as TokenUsage"""
+    cached = (reported.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    return TokenUsage(
+        input_tokens=reported.get("prompt_tokens", 0) - cached,
+        cache_read_input_tokens=cached,
+        output_tokens=reported.get("completion_tokens", 0),
+        reported=True
+    )
@@ -0,0 +1,7 @@
+"""
+Benchmarks
+
+Micro-benchmarks for hot paths. Run from backend/:
+
+- bench_router.py: Lucidia analyze_task / route / scoring, adapter estimate_cost
+"""
@@ -0,0 +1,309 @@
+"""
+Lucidia Router Benchmarks
+
+Exercises LucidiaRouter.analyze_task, route, _score_model and adapter
+estimate_cost against synthetic workloads (short chats, pasted code,
+100 KB documents, long histories) and reports ops/sec, latency
+percentiles and allocations per call.
+
+Usage (from backend/):
+
+    python -m benchmarks.bench_router                   # run, save JSON
+    python -m benchmarks.bench_router --filter route    # subset
+    python -m benchmarks.bench_router --compare a.json b.json
+
+Results are written to benchmarks/results/<timestamp>-<commit>.json so
+runs can be compared across commits.
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import gc
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from lucidia import LucidiaRouter, ModelProvider
+
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+WORDS = (
+    "the a to of and in is it you that for on with as this be are can how what "
+    "please help me my we need our team should would could about from into when "
+    "model data request response latency error user service time first token"
+).split()
+
+CODE_LINES = [
+    "def handle_request(self, payload: Dict[str, Any]) -> Response:",
+    "    result = await self.client.post(url, json=payload, timeout=30)",
+    "    if result.status_code != 200:",
+    "        raise HTTPException(status_code=502, detail=result.text)",
+    "for index, item in enumerate(items):",
+    "    total += item.price * item.quantity  # TODO: handle discounts",
+    "class CacheEntry(NamedTuple):",
+    "    return {k: v for k, v in mapping.items() if v is not None}",
+    "const response = await fetch(`/api/v1/chat`, { method: 'POST' });",
+    "SELECT id, content FROM messages WHERE conversation_id = $1 ORDER BY created_at;",
+]
+
+LOG_LINES = [
+    "2026-10-18T12:00:{:02d}Z INFO worker-{} accepted connection from 10.0.{}.{}",
+    "2026-10-18T12:00:{:02d}Z WARN worker-{} slow upstream response ({} ms) retry={}",
+    "2026-10-18T12:00:{:02d}Z ERROR worker-{} upstream reset: errno={} attempt={}",
+]
+
+
+# Synthetic corpora
+
+def short_chat(rng: random.Random) -> str:
+    """A one-line chat message"""
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 20))) + "?"
+
+
+def pasted_code(rng: random.Random, lines: int = 150) -> str:
+    """A question with a pasted code block (~8 KB)"""
+    body = "\n".join(rng.choice(CODE_LINES) for _ in range(lines))
+    return f"Can you debug this function?\n```python\n{body}\n```"
+
+
+def document(rng: random.Random, size: int = 100_000) -> str:
+    """A pasted log/document of about `size` characters"""
+    lines = []
+    length = 0
+    while length < size:
+        line = rng.choice(LOG_LINES).format(
+            rng.randint(0, 59), rng.randint(1, 32), rng.randint(0, 255), rng.randint(0, 255)
+        )
+        lines.append(line)
+        length += len(line) + 1
+    return "Summarize the errors in this log:\n" + "\n".join(lines)
+
+
+def long_history(rng: random.Random, turns: int = 300) -> List[Dict[str, str]]:
+    """A support conversation with `turns` user/assistant pairs"""
+    history = []
+    for _ in range(turns):
+        history.append({"role": "user", "content": short_chat(rng)})
+        history.append({
+            "role": "assistant",
+            "content": " ".join(rng.choice(WORDS) for _ in range(rng.randint(30, 120))),
+        })
+    return history
+
+
+# Measurement
+
+def measure(
+    fn: Callable[[], Any],
+    iterations: int,
+    warmup: int = 5,
+    alloc_samples: int = 20
+) -> Dict[str, float]:
+    """
+    Time `fn` call by call.
+
+    Returns ops/sec, latency percentiles (microseconds) and the mean peak
+    traced allocation per call (bytes, from a separate tracemalloc pass so
+    tracing overhead does not skew the timings).
+    """
+    for _ in range(warmup):
+        fn()
+
+    gc.collect()
+    gc.disable()
+    try:
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter_ns()
+            fn()
+            samples.append(time.perf_counter_ns() - start)
+    finally:
+        gc.enable()
+
+    tracemalloc.start()
+    try:
+        peaks = []
+        for _ in range(min(alloc_samples, iterations)):
+            tracemalloc.reset_peak()
+            baseline, _ = tracemalloc.get_traced_memory()
+            fn()
+            _, peak = tracemalloc.get_traced_memory()
+            peaks.append(peak - baseline)
+    finally:
+        tracemalloc.stop()
+
+    samples.sort()
+    total_s = sum(samples) / 1e9
+
+    def percentile(p: float) -> float:
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))] / 1000
+
+    return {
+        "iterations": iterations,
+        "ops_per_sec": iterations / total_s if total_s else float("inf"),
+        "mean_us": statistics.fmean(samples) / 1000,
+        "p50_us": percentile(50),
+        "p90_us": percentile(90),
+        "p99_us": percentile(99),
+        "max_us": samples[-1] / 1000,
+        "alloc_peak_bytes": statistics.fmean(peaks) if peaks else 0.0,
+    }
+
+
+# Benchmarks
+
+def build_benchmarks(router: LucidiaRouter, seed: int) -> Dict[str, Callable[[], Any]]:
+    """Named zero-argument callables to measure"""
+    rng = random.Random(seed)
+    chats = [short_chat(rng) for _ in range(256)]
+    code = pasted_code(rng)
+    doc = document(rng)
+    history = long_history(rng)
+    next_turn = short_chat(rng)
+    providers = [ModelProvider.OPENAI, ModelProvider.ANTHROPIC, ModelProvider.GOOGLE]
+
+    chat_analyses = [router.analyze_task(chat) for chat in chats]
+    doc_analysis = router.analyze_task(doc)
+    capability = router.model_capabilities["gpt-4o"]
+    chat_cycle = _cycle(chats)
+    analysis_cycle = _cycle(chat_analyses)
+
+    def analyze_uncached_doc() -> Any:
+        router.token_count_cache.clear()
+        return router.analyze_task(doc)
+
+    def route_uncached() -> Any:
+        router.decision_cache.clear()
+        return router.route(next(analysis_cycle), providers)
+
+    benchmarks = {
+        "analyze_task/short_chat": lambda: router.analyze_task(next(chat_cycle)),
+        "analyze_task/pasted_code": lambda: router.analyze_task(code),
+        "analyze_task/document_100kb": lambda: router.analyze_task(doc),
+        "analyze_task/document_100kb_uncached": analyze_uncached_doc,
+        "analyze_task/history_300_turns": lambda: router.analyze_task(next_turn, history),
+        "analyze_task/history_300_turns_running_total": lambda: router.analyze_task(
+            next_turn, history, conversation_id="bench"
+        ),
+        "classify/document_100kb": lambda: router.keyword_classifier.classify(doc),
+        "route/short_chat_cached": lambda: router.route(next(analysis_cycle), providers),
+        "route/short_chat_uncached": route_uncached,
+        "route/document_100kb": lambda: router.route(doc_analysis, providers),
+        "route_many/256_chats": lambda: router.route_many(chat_analyses, providers),
+        "score_model/single": lambda: router._score_model(chat_analyses[0], capability, None),
+        "catalog/score_all": lambda: router.catalog.score(chat_analyses[0], None),
+    }
+
+    for name, adapter in _adapters().items():
+        model = next(iter(adapter._get_model_pricing()))
+        benchmarks[f"estimate_cost/{name}"] = (
+            lambda adapter=adapter, model=model: adapter.estimate_cost(1200, 400, model)
+        )
+
+    return benchmarks
+
+
+def _adapters() -> Dict[str, Any]:
+    """Adapters constructed with dummy keys (estimate_cost never calls out)"""
+    from adapters import AnthropicAdapter, OpenAIAdapter
+
+    return {
+        "openai": OpenAIAdapter("sk-benchmark"),
+        "anthropic": AnthropicAdapter("sk-ant-benchmark"),
+    }
+
+
+def _cycle(items: List[Any]):
+    while True:
+        yield from items
+
+
+# Reporting
+
+def run(filter_text: Optional[str], iterations: int, seed: int) -> Dict[str, Any]:
+    """Run the suite and return the results document"""
+    router = LucidiaRouter()
+    router.tokenizer.load()  # measure the real encoder, not the warm-up estimate
+
+    results = {}
+    for name, fn in build_benchmarks(router, seed).items():
+        if filter_text and filter_text not in name:
+            continue
+        slow = "uncached" in name or "100kb" in name or "300_turns" in name
+        results[name] = measure(fn, iterations=max(20, iterations // 20) if slow else iterations)
+        _print_row(name, results[name])
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": seed,
+        "results": results,
+    }
+
+
+def compare(baseline_path: Path, candidate_path: Path) -> None:
+    """Print per-benchmark p50 / ops/sec ratios between two result files"""
+    baseline = json.loads(baseline_path.read_text())["results"]
+    candidate = json.loads(candidate_path.read_text())["results"]
+
+    print(f"{'benchmark':48} {'p50 before':>12} {'p50 after':>12} {'speedup':>9}")
+    for name in sorted(set(baseline) & set(candidate)):
+        before, after = baseline[name]["p50_us"], candidate[name]["p50_us"]
+        speedup = before / after if after else float("inf")
+        flag = "  ⚠️" if speedup < 0.9 else ""
+        print(f"{name:48} {before:10.1f}us {after:10.1f}us {speedup:8.2f}x{flag}")
+
+
+def _print_row(name: str, result: Dict[str, float]) -> None:
+    print(
+        f"{name:48} {result['ops_per_sec']:>12,.0f} ops/s  "
+        f"p50 {result['p50_us']:>9.1f}us  p99 {result['p99_us']:>9.1f}us  "
+        f"alloc {result['alloc_peak_bytes'] / 1024:>8.1f} KiB"
+    )
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Lucidia router micro-benchmarks")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this")
+    parser.add_argument("--iterations", type=int, default=2000, help="Calls per fast benchmark")
+    parser.add_argument("--seed", type=int, default=1618, help="Synthetic corpus seed")
+    parser.add_argument("--output", type=Path, help="Result file (default: benchmarks/results/)")
+    parser.add_argument("--compare", nargs=2, type=Path, metavar=("BASELINE", "CANDIDATE"))
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return 0
+
+    report = run(args.filter, args.iterations, args.seed)
+    output = args.output or RESULTS_DIR / (
+        f"{datetime.utcnow():%Y%m%dT%H%M%S}-{report['commit']}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2))
+    print(f"\n✅ Results saved to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -56,6 +56,7 @@ class Workspace(Base):
     user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=False)
     name = Column(String, nullable=False)
     settings = Column(JSONB, default={})
+    encrypted_data_key = Column(Text, nullable=True)  # Data key for this workspace's secrets, wrapped by the master key
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
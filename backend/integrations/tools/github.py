@@ -5,7 +5,7 @@ Tool for interacting with GitHub repositories.
 """
 
 from typing import Dict, List, Optional
-import httpx
+from utils.http import get_http_client
 
 
 class GitHubIntegration:
@@ -14,16 +14,15 @@ class GitHubIntegration:
     def __init__(self, access_token: str):
         self.token = access_token
         self.base_url = "https://api.github.com"
-        self.client = httpx.AsyncClient(
-            headers={
-                "Authorization": f"Bearer {access_token}",
-                "Accept": "application/vnd.github.v3+json"
-            }
-        )
+        self.headers = {
+            "Authorization": f"Bearer {access_token}",
+            "Accept": "application/vnd.github.v3+json"
+        }
+        self.client = get_http_client(self.base_url)
 
     async def get_repo(self, owner: str, repo: str) -> Dict:
         """Get repository details"""
-        response = await self.client.get(f"{self.base_url}/repos/{owner}/{repo}")
+        response = await self.client.get(f"{self.base_url}/repos/{owner}/{repo}", headers=self.headers)
         return response.json()
 
     async def list_issues(
@@ -35,7 +34,8 @@ class GitHubIntegration:
         """List repository issues"""
         response = await self.client.get(
             f"{self.base_url}/repos/{owner}/{repo}/issues",
-            params={"state": state}
+            params={"state": state},
+            headers=self.headers
         )
         return response.json()
 
@@ -49,10 +49,10 @@ class GitHubIntegration:
         """Create a new issue"""
         response = await self.client.post(
             f"{self.base_url}/repos/{owner}/{repo}/issues",
-            json={"title": title, "body": body}
+            json={"title": title, "body": body},
+            headers=self.headers
         )
         return response.json()
 
     async def close(self):
-        """Close HTTP client"""
-        await self.client.aclose()
+        """No-op: the pooled HTTP client is shared and closed at shutdown"""
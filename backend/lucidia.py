@@ -9,10 +9,18 @@ Named after the Latin "lucidus" (clear, bright) - making clear decisions
 about which AI to use for each task.
 """
 
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, List, NamedTuple, Optional, Any, Tuple
 from enum import Enum
+import hashlib
+import re
 from pydantic import BaseModel
-import tiktoken
+import numpy as np
+
+from services.circuit_breaker import CircuitBreakerRegistry
+from services.latency import LatencyTracker
+from utils.cache import ThreadSafeLRUCache
+from utils.metrics import ROUTING_STAGE_SECONDS
+from utils.tokenizer import approximate_token_count, tokenizer_service
 
 
 class TaskComplexity(str, Enum):
@@ -57,6 +65,23 @@ class ModelCapability(BaseModel):
     quality_tier: str  # "basic", "good", "excellent", "expert"
 
 
+# Scoring tables shared by _score_model and the compiled catalog
+QUALITY_SCORES = {"basic": 1, "good": 2, "excellent": 3, "expert": 4}
+SPEED_SCORES = {"fast": 5, "medium": 3, "slow": 0}
+COMPLEXITY_REQUIREMENTS = {
+    TaskComplexity.TRIVIAL: 1,
+    TaskComplexity.SIMPLE: 1,
+    TaskComplexity.MODERATE: 2,
+    TaskComplexity.COMPLEX: 3,
+    TaskComplexity.EXPERT: 4
+}
+
+# Bit positions for the catalog's provider and capability masks
+PROVIDER_BITS = {provider: 1 << i for i, provider in enumerate(ModelProvider)}
+VISION_BIT = 1
+TOOLS_BIT = 2
+
+
 class TaskAnalysis(BaseModel):
     """Lucidia's analysis of a task"""
     complexity: TaskComplexity
@@ -78,6 +103,307 @@ class RoutingDecision(BaseModel):
     confidence_score: float
 
 
+# Keyword signals, in classification precedence order
+TASK_TYPE_KEYWORDS: List[Tuple[TaskType, List[str]]] = [
+    (TaskType.CODE, ["code", "function", "debug", "implement", "program"]),
+    (TaskType.ANALYSIS, ["analyze", "data", "compare", "evaluate"]),
+    (TaskType.CREATIVE, ["write", "create", "story", "poem", "article"]),
+    (TaskType.MULTIMODAL, ["image", "picture", "video", "audio"]),
+    (TaskType.REASONING, ["solve", "calculate", "prove", "logic"]),
+    (TaskType.REALTIME, ["current", "latest", "today", "news"]),
+]
+VISION_KEYWORDS = ["image", "picture", "photo", "visual", "diagram"]
+TOOLS_KEYWORDS = ["search", "web", "current", "latest", "today"]
+
+
+class KeywordSignals(NamedTuple):
+    """Everything analyze_task reads from message keywords"""
+    task_type: TaskType
+    requires_vision: bool
+    requires_tools: bool
+
+
+class KeywordClassifier:
+    """
+    Single-pass keyword matcher for task classification.
+
+    All keyword sets are compiled into trie-shaped regexes, so the text is
+    scanned once in C rather than once per keyword. The matcher is a small
+    automaton over (best task type so far, vision seen, tools seen): after
+    each hit it resumes with a pattern holding only the keywords that can
+    still change the result, and stops as soon as nothing can.
+    """
+
+    def __init__(
+        self,
+        task_type_keywords: List[Tuple[TaskType, List[str]]] = TASK_TYPE_KEYWORDS,
+        vision_keywords: List[str] = VISION_KEYWORDS,
+        tools_keywords: List[str] = TOOLS_KEYWORDS
+    ):
+        self.task_types = [task_type for task_type, _ in task_type_keywords]
+        self.default_rank = len(self.task_types)  # TaskType.CHAT
+
+        # keyword -> (task type rank, vision, tools)
+        signals: Dict[str, Tuple[int, bool, bool]] = {}
+        for rank, (_, words) in enumerate(task_type_keywords):
+            for word in words:
+                signals.setdefault(word, (rank, False, False))
+        for word in vision_keywords:
+            rank, _, tools = signals.get(word, (self.default_rank, False, False))
+            signals[word] = (rank, True, tools)
+        for word in tools_keywords:
+            rank, vision, _ = signals.get(word, (self.default_rank, False, False))
+            signals[word] = (rank, vision, True)
+        self.signals = signals
+
+        # A match also implies every keyword that is a prefix of it, since
+        # the search resumes one character after the match start
+        self.match_signals: Dict[str, Tuple[int, bool, bool]] = {}
+        for word in signals:
+            implied = [signals[other] for other in signals if word.startswith(other)]
+            self.match_signals[word] = (
+                min(rank for rank, _, _ in implied),
+                any(vision for _, vision, _ in implied),
+                any(tools for _, _, tools in implied),
+            )
+
+        self._patterns: Dict[Tuple[int, bool, bool], Optional[re.Pattern]] = {}
+
+    def classify(self, message: str) -> KeywordSignals:
+        """Classify a message in one pass over its lowercased text"""
+        text = message.lower()
+        rank, vision, tools = self.default_rank, False, False
+        pos = 0
+
+        while True:
+            pattern = self._pattern_for(rank, vision, tools)
+            if pattern is None:
+                break
+            match = pattern.search(text, pos)
+            if match is None:
+                break
+            hit_rank, hit_vision, hit_tools = self.match_signals[match.group()]
+            rank = min(rank, hit_rank)
+            vision = vision or hit_vision
+            tools = tools or hit_tools
+            pos = match.start() + 1
+
+        task_type = self.task_types[rank] if rank < self.default_rank else TaskType.CHAT
+        return KeywordSignals(task_type, vision, tools)
+
+    def _pattern_for(self, rank: int, vision: bool, tools: bool) -> Optional[re.Pattern]:
+        """Compiled pattern for the keywords still useful in this state"""
+        state = (rank, vision, tools)
+        if state not in self._patterns:
+            useful = [
+                word
+                for word, (word_rank, word_vision, word_tools) in self.signals.items()
+                if word_rank < rank
+                or (word_vision and not vision)
+                or (word_tools and not tools)
+            ]
+            self._patterns[state] = re.compile(_trie_pattern(useful)) if useful else None
+        return self._patterns[state]
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """Build a regex alternation shaped like a trie of the given words"""
+    trie: Dict[str, dict] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # Longer words are tried first; a shorter word ending here still matches
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+
+class CapabilityRegistry(dict):
+    """
+    Model capability database that tracks its own mutations.
+
+    Behaves like a plain dict of model_id -> ModelCapability, but bumps
+    `version` on every write so compiled views can tell when to rebuild.
+    Replace entries rather than mutating a ModelCapability in place.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.version = 0
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.version += 1
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.version += 1
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.version += 1
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.version += 1
+        return super().setdefault(key, default)
+
+    def pop(self, key, *args):
+        if key in self:
+            self.version += 1
+        return super().pop(key, *args)
+
+    def popitem(self):
+        item = super().popitem()
+        self.version += 1
+        return item
+
+    def clear(self):
+        super().clear()
+        self.version += 1
+
+
+class CompiledCatalog:
+    """
+    Struct-of-arrays view of the capability database.
+
+    Built once per CapabilityRegistry version so that routing can filter
+    by provider/requirements with bitmasks and score every model in a
+    single vectorized pass instead of a Python loop.
+    """
+
+    def __init__(self, capabilities: Dict[str, ModelCapability]):
+        self.model_ids: List[str] = list(capabilities.keys())
+        self.capabilities: List[ModelCapability] = list(capabilities.values())
+        self.upstream_ids: List[str] = [c.model_id for c in self.capabilities]
+        self.positions: Dict[str, int] = {model_id: i for i, model_id in enumerate(self.model_ids)}
+
+        caps = self.capabilities
+        self.context_window = np.array([c.context_window for c in caps], dtype=np.int64)
+        self.sorted_context_windows = np.unique(self.context_window)
+        self.cost = np.array([c.cost_per_1k_tokens for c in caps], dtype=np.float64)
+        self.quality = np.array([QUALITY_SCORES[c.quality_tier] for c in caps], dtype=np.int64)
+        self.speed = np.array([SPEED_SCORES.get(c.speed_tier, 0) for c in caps], dtype=np.float64)
+        self.provider_bits = np.array([PROVIDER_BITS[c.provider] for c in caps], dtype=np.int64)
+        self.capability_bits = np.array(
+            [
+                (VISION_BIT if c.supports_vision else 0)
+                | (TOOLS_BIT if c.supports_function_calling else 0)
+                for c in caps
+            ],
+            dtype=np.int64
+        )
+
+    def __len__(self) -> int:
+        return len(self.model_ids)
+
+    @staticmethod
+    def provider_bitset(providers: Iterable[ModelProvider]) -> int:
+        """Bitset of the given providers (unknown values are ignored)"""
+        bits = 0
+        for provider in providers:
+            try:
+                bits |= PROVIDER_BITS[ModelProvider(provider)]
+            except ValueError:
+                continue
+        return bits
+
+    def provider_mask(self, providers: Iterable[ModelProvider]) -> np.ndarray:
+        """Boolean mask of models served by any of the given providers"""
+        return self.bitset_mask(self.provider_bitset(providers))
+
+    def bitset_mask(self, provider_bitset: int) -> np.ndarray:
+        """Boolean mask of models whose provider is in the bitset"""
+        return (self.provider_bits & provider_bitset) != 0
+
+    def context_bucket(self, context_length: int) -> int:
+        """
+        Number of distinct context windows smaller than context_length.
+
+        Two tasks in the same bucket exceed exactly the same models'
+        windows, so they score identically on context.
+        """
+        return int(np.searchsorted(self.sorted_context_windows, context_length, side="left"))
+
+    def live_speed(self, bonuses: Dict[str, float]) -> np.ndarray:
+        """Speed bonuses with live estimates (by upstream model_id) applied"""
+        if not bonuses:
+            return self.speed
+        speed = self.speed.copy()
+        for i, upstream_id in enumerate(self.upstream_ids):
+            bonus = bonuses.get(upstream_id)
+            if bonus is not None:
+                speed[i] = bonus
+        return speed
+
+    def circuit_mask(self, open_circuits: Iterable[Tuple[str, str]]) -> np.ndarray:
+        """Boolean mask of models whose (provider, model_id) circuit is open"""
+        open_circuits = set(open_circuits)
+        return np.array(
+            [(c.provider.value, c.model_id) in open_circuits for c in self.capabilities],
+            dtype=bool
+        )
+
+    def requirement_mask(self, task: TaskAnalysis) -> np.ndarray:
+        """Boolean mask of models supporting everything the task requires"""
+        required = 0
+        if task.requires_vision:
+            required |= VISION_BIT
+        if task.requires_tools:
+            required |= TOOLS_BIT
+        return (self.capability_bits & required) == required
+
+    def score(
+        self,
+        task: TaskAnalysis,
+        preferences: Optional[Dict[str, Any]],
+        speed: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        Score every model in the catalog for a task.
+
+        Vectorized equivalent of LucidiaRouter._score_model, applying the
+        terms in the same order so results match it exactly. `speed`
+        overrides the static speed bonuses (see live_speed).
+        """
+        required_quality = COMPLEXITY_REQUIREMENTS[task.complexity]
+        sufficient = self.quality >= required_quality
+        exact = self.quality == required_quality
+
+        score = np.where(sufficient, 10.0, -10.0)
+        score += np.where(exact, 5.0, 0.0)
+        score += np.where(exact, (0.01 - self.cost) * 100, 0.0)
+        score += self.speed if speed is None else speed
+        score -= np.where(task.context_length > self.context_window, 50.0, 0.0)
+
+        if preferences:
+            prefer_provider = preferences.get("preferred_provider")
+            if prefer_provider is not None:
+                score += np.where(self.provider_mask([prefer_provider]), 8.0, 0.0)
+
+        return score
+
+
+# Routing decisions kept in the LRU decision cache
+DECISION_CACHE_SIZE = 4096
+
+# Messages tokenized per batch in analyze_many (bounded so the batch
+# stays well inside the token count cache)
+ANALYZE_BATCH_SIZE = 1024
+
+
 class LucidiaRouter:
     """
     The brain of CarPool - intelligently routes tasks to optimal AI models.
@@ -90,10 +416,36 @@ class LucidiaRouter:
     """
 
     def __init__(self):
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        # Shared with the adapters; loaded on first use / warmed at startup,
+        # approximate counts until then
+        self.tokenizer = tokenizer_service.encoding("cl100k_base")
+        self.keyword_classifier = KeywordClassifier()
+
+        # Caches are shared with sync endpoints (route:batch) running in
+        # the threadpool, so they lock
+        # Token counts by content digest, so history is never re-encoded
+        self.token_count_cache = ThreadSafeLRUCache(maxsize=16384)
+        # Running history totals: conversation_id -> (messages counted, last message digest, total)
+        self.conversation_token_totals = ThreadSafeLRUCache(maxsize=4096)
+        # Routing decisions by (task features, providers, preferred provider);
+        # cleared whenever the catalog is rebuilt or live speeds change
+        self.decision_cache = ThreadSafeLRUCache(maxsize=DECISION_CACHE_SIZE)
+
+        # Measured TTFT / throughput, replacing static speed tiers once known
+        self.latency = LatencyTracker()
+        self._latency_version = 0
+        self._live_speed: Optional[np.ndarray] = None
+
+        # Per provider/model circuit breakers; open circuits are not routed to
+        self.circuit_breakers = CircuitBreakerRegistry()
+        self._circuit_version = 0
+
+        # Compiled view of model_capabilities, rebuilt when it changes
+        self._catalog: Optional[CompiledCatalog] = None
+        self._catalog_version = -1
 
         # Model capability database
-        self.model_capabilities: Dict[str, ModelCapability] = {
+        self.model_capabilities = {
             "gpt-4o": ModelCapability(
                 provider=ModelProvider.OPENAI,
                 model_id="gpt-4o",
@@ -166,42 +518,191 @@ class LucidiaRouter:
             )
         }
 
+    @property
+    def model_capabilities(self) -> CapabilityRegistry:
+        """Model capability database (mutations trigger a catalog rebuild)"""
+        return self._model_capabilities
+
+    @model_capabilities.setter
+    def model_capabilities(self, capabilities: Dict[str, ModelCapability]):
+        self._model_capabilities = CapabilityRegistry(capabilities)
+
+    @property
+    def catalog(self) -> CompiledCatalog:
+        """Compiled catalog for the current model_capabilities"""
+        registry = self._model_capabilities
+        if self._catalog is None or self._catalog_version != registry.version:
+            self._catalog = CompiledCatalog(registry)
+            self._catalog_version = registry.version
+            self._live_speed = None
+            self.decision_cache.clear()
+        return self._catalog
+
+    @ROUTING_STAGE_SECONDS.timed("analyze_task")
     def analyze_task(
         self,
         message: str,
-        conversation_history: List[Dict[str, str]] = None
+        conversation_history: List[Dict[str, str]] = None,
+        conversation_id: Optional[str] = None
     ) -> TaskAnalysis:
         """
         Analyze a task to understand its requirements.
 
+        Pass conversation_id to keep a running token total for the history,
+        so each turn only counts the messages added since the last one.
+
         Returns TaskAnalysis with complexity, type, and requirements.
         """
         # Count tokens
-        tokens = len(self.tokenizer.encode(message))
+        tokens = self.count_tokens(message)
         if conversation_history:
-            for msg in conversation_history:
-                tokens += len(self.tokenizer.encode(msg.get("content", "")))
+            tokens += self.count_history_tokens(conversation_history, conversation_id)
 
-        # Detect task type (simple keyword matching for MVP)
-        task_type = self._classify_task_type(message)
+        # Detect task type and special requirements in one keyword pass
+        signals = self.keyword_classifier.classify(message)
 
         # Estimate complexity
         complexity = self._estimate_complexity(message, tokens)
 
-        # Detect special requirements
-        requires_vision = any(word in message.lower() for word in ["image", "picture", "photo", "visual", "diagram"])
-        requires_tools = any(word in message.lower() for word in ["search", "web", "current", "latest", "today"])
-
         return TaskAnalysis(
             complexity=complexity,
-            task_type=task_type,
+            task_type=signals.task_type,
             estimated_tokens=tokens,
-            requires_vision=requires_vision,
-            requires_tools=requires_tools,
-            requires_realtime=requires_tools,
+            requires_vision=signals.requires_vision,
+            requires_tools=signals.requires_tools,
+            requires_realtime=signals.requires_tools,
             context_length=tokens
         )
 
+    def analyze_many(
+        self,
+        messages: List[str],
+        conversation_histories: Optional[List[Optional[List[Dict[str, str]]]]] = None,
+        conversation_ids: Optional[List[Optional[str]]] = None,
+        num_threads: int = 8
+    ) -> List[TaskAnalysis]:
+        """
+        Analyze a batch of tasks.
+
+        Uncached texts are tokenized with tiktoken's batch encoder on a
+        thread pool, then each task is analyzed from the warm token cache.
+
+        Returns one TaskAnalysis per message, in order.
+        """
+        histories = conversation_histories or [None] * len(messages)
+        ids = conversation_ids or [None] * len(messages)
+        if len(histories) != len(messages) or len(ids) != len(messages):
+            raise ValueError("conversation_histories and conversation_ids must match messages")
+
+        analyses = []
+        for start in range(0, len(messages), ANALYZE_BATCH_SIZE):
+            end = start + ANALYZE_BATCH_SIZE
+            texts = list(messages[start:end])
+            for history, conversation_id in zip(histories[start:end], ids[start:end]):
+                # Running totals already cover conversations we have seen
+                if history and conversation_id is None:
+                    texts.extend(
+                        msg.get("content", "") for msg in history
+                        if not isinstance(msg.get("tokens_used"), int)
+                    )
+            self.prime_token_counts(texts, num_threads=num_threads)
+
+            analyses.extend(
+                self.analyze_task(message, history, conversation_id)
+                for message, history, conversation_id
+                in zip(messages[start:end], histories[start:end], ids[start:end])
+            )
+        return analyses
+
+    def prime_token_counts(self, texts: List[str], num_threads: int = 8) -> None:
+        """Batch-encode any texts missing from the token count cache"""
+        if not self.tokenizer.ready:
+            self.tokenizer.warm()
+            return
+
+        pending: Dict[bytes, str] = {}
+        for text in texts:
+            key = _content_digest(text)
+            if key not in self.token_count_cache:
+                pending.setdefault(key, text)
+        if not pending:
+            return
+
+        counts = tokenizer_service.count_many(list(pending.values()), num_threads=num_threads)
+        for key, tokens in zip(pending, counts):
+            self.token_count_cache.set(key, tokens)
+
+    def count_tokens(self, text: str) -> int:
+        """
+        Count tokens in text, encoding each distinct content only once.
+
+        While the tokenizer is still loading, returns an approximate count
+        (not cached) and makes sure loading has started.
+        """
+        key = _content_digest(text)
+        tokens = self.token_count_cache.get(key)
+        if tokens is None:
+            if not self.tokenizer.ready:
+                self.tokenizer.warm()
+                return approximate_token_count(text)
+            tokens = tokenizer_service.count(text)
+            self.token_count_cache.set(key, tokens)
+        return tokens
+
+    def count_message_tokens(self, message: Dict[str, Any]) -> int:
+        """
+        Count tokens in a history message.
+
+        Uses a stored count when the message carries one (e.g. populated
+        from Message.tokens_used), otherwise the content cache.
+        """
+        tokens = message.get("tokens_used")
+        if isinstance(tokens, int):
+            return tokens
+        return self.count_tokens(message.get("content", ""))
+
+    def count_history_tokens(
+        self,
+        conversation_history: List[Dict[str, Any]],
+        conversation_id: Optional[str] = None
+    ) -> int:
+        """
+        Total tokens across a conversation history.
+
+        With a conversation_id, the total is kept as a running sum. Histories
+        are treated as append-only: if the message we last counted up to is
+        still in place, only the messages appended since then are counted.
+        A truncated history or a replaced last message falls back to a full
+        recount from the content cache.
+        """
+        if not conversation_history:
+            return 0
+        if conversation_id is None:
+            return sum(self.count_message_tokens(msg) for msg in conversation_history)
+
+        exact = self.tokenizer.ready
+        start, total = 0, 0
+        entry = self.conversation_token_totals.get(conversation_id)
+        if entry is not None:
+            counted, last_digest, counted_total = entry
+            if 0 < counted <= len(conversation_history) and \
+                    _message_digest(conversation_history[counted - 1]) == last_digest:
+                start, total = counted, counted_total
+
+        for msg in conversation_history[start:]:
+            total += self.count_message_tokens(msg)
+
+        # Never bake approximate counts into the running total
+        if not exact:
+            return total
+
+        self.conversation_token_totals.set(
+            conversation_id,
+            (len(conversation_history), _message_digest(conversation_history[-1]), total)
+        )
+        return total
+
+    @ROUTING_STAGE_SECONDS.timed("route")
     def route(
         self,
         task_analysis: TaskAnalysis,
@@ -213,74 +714,151 @@ class LucidiaRouter:
 
         This is the core CarPool logic - picking the right vehicle for the journey.
         """
-        # Filter models by availability
-        available_models = {
-            model_id: cap
-            for model_id, cap in self.model_capabilities.items()
-            if cap.provider in available_providers
-        }
+        catalog = self.catalog
+        return self._route_cached(
+            task_analysis,
+            catalog,
+            catalog.provider_bitset(available_providers),
+            user_preferences
+        )
 
-        if not available_models:
-            raise ValueError("No models available for routing")
+    def route_many(
+        self,
+        task_analyses: List[TaskAnalysis],
+        available_providers: List[ModelProvider],
+        user_preferences: Optional[Dict[str, Any]] = None
+    ) -> List[RoutingDecision]:
+        """
+        Route a batch of tasks against the same providers and preferences.
 
-        # Filter by requirements
-        candidates = available_models.copy()
+        The catalog and provider bitset are resolved once, and tasks with the
+        same routing features share one scoring pass via the decision cache.
 
-        if task_analysis.requires_vision:
-            candidates = {k: v for k, v in candidates.items() if v.supports_vision}
+        Returns one RoutingDecision per task, in order.
+        """
+        catalog = self.catalog
+        providers = catalog.provider_bitset(available_providers)
+        return [
+            self._route_cached(task, catalog, providers, user_preferences)
+            for task in task_analyses
+        ]
+
+    def _route_cached(
+        self,
+        task_analysis: TaskAnalysis,
+        catalog: CompiledCatalog,
+        providers: int,
+        user_preferences: Optional[Dict[str, Any]]
+    ) -> RoutingDecision:
+        """Route through the decision cache, scoring only on a miss"""
+        _, latency_version = self.latency.speed_bonuses()
+        if latency_version != self._latency_version:
+            self._latency_version = latency_version
+            self._live_speed = None
+            self.decision_cache.clear()
+
+        _, circuit_version = self.circuit_breakers.open_circuits()
+        if circuit_version != self._circuit_version:
+            self._circuit_version = circuit_version
+            self.decision_cache.clear()
+
+        preferred = None
+        if user_preferences:
+            preferred = user_preferences.get("preferred_provider")
+        key = self._routing_features(task_analysis, catalog) + (
+            providers,
+            catalog.provider_bitset([preferred]) if preferred is not None else 0,
+        )
 
-        if task_analysis.requires_tools:
-            candidates = {k: v for k, v in candidates.items() if v.supports_function_calling}
+        cached = self.decision_cache.get(key)
+        if cached is None:
+            available = catalog.bitset_mask(providers)
+            if not available.any():
+                raise ValueError("No models available for routing")
+            cached = self._decide(task_analysis, catalog, available, user_preferences)
+            self.decision_cache.set(key, cached)
+
+        # Only the cost depends on the exact token count
+        selected_cap = catalog.capabilities[catalog.positions[cached.selected_model]]
+        return cached.model_copy(update={
+            "alternatives": list(cached.alternatives),
+            "estimated_cost": self._estimate_cost(task_analysis, selected_cap),
+        })
+
+    def _routing_features(self, task: TaskAnalysis, catalog: CompiledCatalog) -> tuple:
+        """
+        Task features a routing decision depends on.
 
-        if not candidates:
-            # Fallback to best available
-            candidates = available_models
+        Everything except estimated_cost is a function of this tuple (plus
+        providers and preferences), so decisions can be shared across it.
+        """
+        return (
+            task.complexity,
+            task.task_type,
+            task.requires_vision,
+            task.requires_tools,
+            task.requires_realtime,
+            catalog.context_bucket(task.context_length),
+        )
 
-        # Score each model
-        scored_models = []
-        for model_id, capability in candidates.items():
-            score = self._score_model(task_analysis, capability, user_preferences)
-            scored_models.append((model_id, capability, score))
+    def _decide(
+        self,
+        task_analysis: TaskAnalysis,
+        catalog: CompiledCatalog,
+        available: np.ndarray,
+        user_preferences: Optional[Dict[str, Any]]
+    ) -> RoutingDecision:
+        """Filter, score and rank the catalog for one task"""
+        # Route around open circuits, unless every available model is open
+        open_circuits, _ = self.circuit_breakers.open_circuits()
+        if open_circuits:
+            healthy = available & ~catalog.circuit_mask(open_circuits)
+            if healthy.any():
+                available = healthy
+
+        # Filter by requirements
+        candidates = available & catalog.requirement_mask(task_analysis)
 
-        # Sort by score (descending)
-        scored_models.sort(key=lambda x: x[2], reverse=True)
+        if not candidates.any():
+            # Fallback to best available
+            candidates = available
+
+        # Score every model in one pass, then rank the candidates.
+        # A stable sort keeps catalog order for ties, like the old loop did.
+        if self._live_speed is None:
+            self._live_speed = catalog.live_speed(self.latency.speed_bonuses()[0])
+        scores = catalog.score(task_analysis, user_preferences, self._live_speed)
+        indices = np.flatnonzero(candidates)
+        ranked = indices[np.argsort(-scores[indices], kind="stable")]
 
         # Select winner
-        selected_id, selected_cap, selected_score = scored_models[0]
+        selected = ranked[0]
+        selected_id = catalog.model_ids[selected]
+        selected_cap = catalog.capabilities[selected]
+        selected_score = float(scores[selected])
 
         # Build reasoning
         reasoning = self._build_reasoning(task_analysis, selected_cap, selected_score)
 
         # Alternatives
-        alternatives = [model_id for model_id, _, _ in scored_models[1:4]]
+        alternatives = [catalog.model_ids[i] for i in ranked[1:4]]
 
         return RoutingDecision(
             selected_model=selected_id,
             selected_provider=selected_cap.provider,
             reasoning=reasoning,
             alternatives=alternatives,
-            estimated_cost=task_analysis.estimated_tokens * selected_cap.cost_per_1k_tokens / 1000,
+            estimated_cost=self._estimate_cost(task_analysis, selected_cap),
             confidence_score=selected_score
         )
 
+    def _estimate_cost(self, task: TaskAnalysis, capability: ModelCapability) -> float:
+        """Estimated cost of running a task on a model"""
+        return task.estimated_tokens * capability.cost_per_1k_tokens / 1000
+
     def _classify_task_type(self, message: str) -> TaskType:
         """Classify task type from message content"""
-        msg_lower = message.lower()
-
-        if any(word in msg_lower for word in ["code", "function", "debug", "implement", "program"]):
-            return TaskType.CODE
-        if any(word in msg_lower for word in ["analyze", "data", "compare", "evaluate"]):
-            return TaskType.ANALYSIS
-        if any(word in msg_lower for word in ["write", "create", "story", "poem", "article"]):
-            return TaskType.CREATIVE
-        if any(word in msg_lower for word in ["image", "picture", "video", "audio"]):
-            return TaskType.MULTIMODAL
-        if any(word in msg_lower for word in ["solve", "calculate", "prove", "logic"]):
-            return TaskType.REASONING
-        if any(word in msg_lower for word in ["current", "latest", "today", "news"]):
-            return TaskType.REALTIME
-
-        return TaskType.CHAT
+        return self.keyword_classifier.classify(message).task_type
 
     def _estimate_complexity(self, message: str, tokens: int) -> TaskComplexity:
         """Estimate task complexity"""
@@ -309,17 +887,8 @@ class LucidiaRouter:
         score = 0.0
 
         # Quality match
-        quality_scores = {"basic": 1, "good": 2, "excellent": 3, "expert": 4}
-        complexity_requirements = {
-            TaskComplexity.TRIVIAL: 1,
-            TaskComplexity.SIMPLE: 1,
-            TaskComplexity.MODERATE: 2,
-            TaskComplexity.COMPLEX: 3,
-            TaskComplexity.EXPERT: 4
-        }
-
-        required_quality = complexity_requirements[task.complexity]
-        model_quality = quality_scores[capability.quality_tier]
+        required_quality = COMPLEXITY_REQUIREMENTS[task.complexity]
+        model_quality = QUALITY_SCORES[capability.quality_tier]
 
         if model_quality >= required_quality:
             score += 10
@@ -334,9 +903,12 @@ class LucidiaRouter:
             # Normalize cost (lower is better)
             score += (0.01 - capability.cost_per_1k_tokens) * 100
 
-        # Speed bonus
-        speed_scores = {"fast": 5, "medium": 3, "slow": 0}
-        score += speed_scores.get(capability.speed_tier, 0)
+        # Speed bonus (live latency estimate when available, else static tier)
+        live_bonus = self.latency.speed_bonus(capability.model_id)
+        if live_bonus is not None:
+            score += live_bonus
+        else:
+            score += SPEED_SCORES.get(capability.speed_tier, 0)
 
         # Context window check
         if task.context_length > capability.context_window:
@@ -365,5 +937,15 @@ class LucidiaRouter:
         )
 
 
+def _content_digest(text: str) -> bytes:
+    """Stable digest of message content for token count caching"""
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def _message_digest(message: Dict[str, Any]) -> bytes:
+    """Digest of a history message's role and content"""
+    return _content_digest(f"{message.get('role', '')}\0{message.get('content', '')}")
+
+
 # Singleton instance
 lucidia = LucidiaRouter()
@@ -5,23 +5,101 @@ Multi-AI Orchestration Platform
 Main FastAPI application entry point.
 """
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from pydantic import BaseModel
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field
 from typing import Optional, List, Dict, Any
+import asyncio
+import json
 import os
 from datetime import datetime
 
+from database import SessionLocal, engine
+from lucidia import lucidia, ModelProvider, RoutingDecision
+from middleware.metrics import MetricsMiddleware
+from services.conversations import load_history, save_message, start_conversation
+from services.executor import ChatExecutor, ExecutionResult
+from services.embedding_pipeline import EmbeddingPipeline, submit_on_commit
+from services.providers import adapter_cache, get_adapter, invalidate_on_key_changes, load_adapters, store_api_key
+from services.semantic_cache import SemanticCache
+from services.vector_index import VectorIndex, attach_to_sessions
+from services.workspaces import load_settings
+from utils.http import http_clients, provider_base_urls
+from utils.metrics import instrument_database, render as render_metrics
+from utils.tokenizer import tokenizer_service
+
+# The semantic cache needs Postgres with pgvector, so it is enabled per deployment.
+# The in-process vector index serves its neighbour search without a Postgres round trip.
+semantic_cache_enabled = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+vector_index = None
+if semantic_cache_enabled and os.getenv("VECTOR_INDEX_ENABLED", "false").lower() == "true":
+    vector_index = VectorIndex()
+    attach_to_sessions(vector_index)
+
+# Background MessageEmbedding ingestion (batched embeddings calls with each workspace's OpenAI key),
+# fed with every stored user / assistant message
+embedding_pipeline = None
+if os.getenv("EMBEDDING_PIPELINE_ENABLED", "false").lower() == "true":
+    embedding_pipeline = EmbeddingPipeline(
+        embedder_for=lambda workspace_id: get_adapter(workspace_id, ModelProvider.OPENAI),
+        index=vector_index
+    )
+    submit_on_commit(embedding_pipeline)
+
+semantic_cache = None
+if semantic_cache_enabled:
+    semantic_cache = SemanticCache(index=vector_index, pipeline=embedding_pipeline)
+
+# Drop cached adapters when a workspace's API keys change
+invalidate_on_key_changes()
+
+# Time SQL statements and session transactions for /metrics
+instrument_database(engine, SessionLocal)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Startup / shutdown hooks"""
+    # Load the tokenizer off the request path; Lucidia approximates until ready
+    lucidia.tokenizer.warm()
+    if vector_index is not None:
+        # Index the stored embeddings this node is missing (all of them on its first start,
+        # those added since the last save after a crash) in the background
+        app.state.vector_backfill = asyncio.ensure_future(asyncio.to_thread(vector_index.backfill))
+        app.state.vector_backfill.add_done_callback(_record_backfill_failure)
+    if embedding_pipeline is not None:
+        embedding_pipeline.start()
+    # Connect to the configured providers now so the first chat skips the TLS handshake
+    app.state.http_prewarm = asyncio.ensure_future(http_clients.prewarm(provider_base_urls()))
+    yield
+    if embedding_pipeline is not None:
+        await embedding_pipeline.stop()
+    if vector_index is not None:
+        vector_index.save()
+    app.state.http_prewarm.cancel()
+    await http_clients.aclose()
+    tokenizer_service.close()
+
+def _record_backfill_failure(task: asyncio.Future) -> None:
+    """Report a failed background backfill under /api/v1/lucidia/status (retrieving the exception)"""
+    if not task.cancelled() and task.exception() is not None:
+        exc = task.exception()
+        vector_index.backfill_error = f"{type(exc).__name__}: {exc}"
+
 # Initialize FastAPI app
 app = FastAPI(
     title="CarPool API",
     description="Multi-AI orchestration platform by BlackRoad OS, Inc.",
     version="0.1.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
+# Executes Lucidia routing decisions against provider adapters
+chat_executor = ChatExecutor(lucidia, semantic_cache=semantic_cache)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -31,6 +109,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Request counts and latency per route (outermost, so it sees every response)
+app.add_middleware(MetricsMiddleware)
+
 # Request/Response Models
 class ChatMessage(BaseModel):
     role: str
@@ -44,6 +125,11 @@ class ChatRequest(BaseModel):
     message: str
     preferred_model: Optional[str] = None
 
+class ChatStreamRequest(ChatRequest):
+    temperature: float = Field(0.7, ge=0, le=2)
+    max_tokens: Optional[int] = Field(None, gt=0)
+    hedge: bool = False
+
 class ChatResponse(BaseModel):
     conversation_id: str
     message: ChatMessage
@@ -60,6 +146,11 @@ class WorkspaceCreate(BaseModel):
     name: str
     settings: Optional[Dict[str, Any]] = {}
 
+class RouteBatchRequest(BaseModel):
+    messages: List[str] = Field(..., max_length=10000)
+    available_providers: List[str]
+    user_preferences: Optional[Dict[str, Any]] = None
+
 # Health check
 @app.get("/")
 async def root():
@@ -79,11 +170,17 @@ async def health_check():
         "services": {
             "api": "operational",
             "database": "not_configured",
-            "lucidia": "not_configured",
+            "lucidia": "operational" if lucidia.tokenizer.ready else "warming",
             "redis": "not_configured"
         }
     }
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus metrics (text exposition format)"""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 # Workspace Management
 @app.post("/api/v1/workspaces")
 async def create_workspace(workspace: WorkspaceCreate):
@@ -109,9 +206,13 @@ async def get_workspace(workspace_id: str):
 # API Key Management
 @app.post("/api/v1/workspaces/{workspace_id}/providers")
 async def add_provider(workspace_id: str, config: ProviderConfig):
-    """Add AI provider API key to workspace"""
-    # TODO: Implement encrypted storage
+    """Add AI provider API key to workspace (stored sealed with the workspace's data key)"""
+    try:
+        key_id = await store_api_key(workspace_id, config.provider, config.api_key, config.enabled)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     return {
+        "id": key_id,
         "workspace_id": workspace_id,
         "provider": config.provider,
         "status": "configured",
@@ -159,6 +260,142 @@ async def chat(request: ChatRequest):
         }
     )
 
+@app.post("/api/v1/chat/stream")
+async def chat_stream(request: ChatStreamRequest):
+    """
+    Streaming chat endpoint (server-sent events)
+
+    Events, in order:
+    - routing: the conversation id, Lucidia's task analysis and routing decision
+    - delta: {"text": ...} per chunk, as the provider produces it
+    - done: the model that answered, token usage and RoadCoin cost
+    - error: sent instead of (or after some) deltas if the request failed
+
+    The prompt and the completed reply are stored in the conversation (a
+    new one when no conversation_id is given).
+
+    Chunks are pulled from the provider only as fast as the client reads
+    them, and a client disconnect closes the provider stream.
+    """
+    adapters = await load_adapters(request.workspace_id)
+    if not adapters:
+        raise HTTPException(status_code=400, detail="No AI providers configured for this workspace")
+    settings = await load_settings(request.workspace_id)
+
+    history = await load_history(request.conversation_id) if request.conversation_id else []
+    analysis = lucidia.analyze_task(request.message, history, request.conversation_id)
+    try:
+        decision = lucidia.route(analysis, list(adapters))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    decision = _prefer_model(decision, request.preferred_model, adapters)
+    messages = history + [{"role": "user", "content": request.message}]
+
+    conversation_id = request.conversation_id or await start_conversation(request.workspace_id)
+    # Stored before execution: a semantic cache miss keeps the prompt's embedding under its id
+    prompt_message_id = await save_message(
+        conversation_id, "user", request.message, tokens_used=lucidia.count_tokens(request.message)
+    )
+
+    async def events():
+        result = ExecutionResult()
+        output = []
+        stream = chat_executor.stream(
+            decision,
+            messages,
+            adapters,
+            workspace_id=request.workspace_id,
+            hedge=request.hedge,
+            conversation_id=conversation_id,
+            cache_opt_in=bool(settings.get("response_cache")),
+            semantic_opt_in=bool(settings.get("semantic_cache")),
+            prompt_message_id=prompt_message_id,
+            result=result,
+            temperature=request.temperature,
+            max_tokens=request.max_tokens
+        )
+        try:
+            yield _sse("routing", {
+                "conversation_id": conversation_id,
+                "analysis": analysis.model_dump(mode="json"),
+                "decision": decision.model_dump(mode="json"),
+            })
+            async for chunk in stream:
+                output.append(chunk)
+                yield _sse("delta", {"text": chunk})
+            reply = "".join(output)
+            usage = _stream_usage(result, reply, adapters)
+            # Stored before "done", so the client's next turn sees it in the history
+            await save_message(
+                conversation_id,
+                "assistant",
+                reply,
+                model_used=usage["model"],
+                tokens_used=usage["output_tokens"],
+                routing_decision=decision.model_dump(mode="json")
+            )
+            yield _sse("done", usage)
+        except Exception as e:
+            # Headers are already sent, so report the failure in-band
+            yield _sse("error", {"type": type(e).__name__, "detail": str(e)})
+        finally:
+            await stream.aclose()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _prefer_model(decision: RoutingDecision, preferred_model: Optional[str], adapters) -> RoutingDecision:
+    """Put the user's preferred model first when one of their providers serves it"""
+    capability = lucidia.model_capabilities.get(preferred_model) if preferred_model else None
+    if capability is None or capability.provider not in adapters or preferred_model == decision.selected_model:
+        return decision
+    chain = [decision.selected_model, *decision.alternatives]
+    return decision.model_copy(update={
+        "selected_model": preferred_model,
+        "selected_provider": capability.provider,
+        "alternatives": [model for model in chain if model != preferred_model],
+        "reasoning": f"User preferred {preferred_model} (Lucidia suggested {decision.selected_model})",
+    })
+
+def _stream_usage(result: ExecutionResult, text: str, adapters) -> Dict[str, Any]:
+    """Usage and cost for the final SSE event"""
+    output_tokens = lucidia.count_tokens(text)
+    if result.semantic_hit or result.model is None:
+        return {"model": None, "semantic_cache": True, "input_tokens": 0,
+                "output_tokens": output_tokens, "roadcoin_cost": 0.0}
+
+    capability = lucidia.model_capabilities[result.model]
+    usage = result.usage
+    input_tokens = result.input_tokens
+    prompt_cache = None
+    if usage is not None and usage.reported:
+        input_tokens, output_tokens = usage.total_input_tokens, usage.output_tokens
+        prompt_cache = {
+            "read_tokens": usage.cache_read_input_tokens,
+            "write_tokens": usage.cache_write_input_tokens,
+        }
+
+    # Replays and coalesced requests did not call the provider themselves
+    cost = 0.0 if result.cached or result.coalesced else adapters[capability.provider].estimate_cost(
+        input_tokens, output_tokens, capability.model_id, usage=usage
+    )
+    return {
+        "model": result.model,
+        "provider": capability.provider.value,
+        "cached": result.cached,
+        "coalesced": result.coalesced,
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "prompt_cache": prompt_cache,
+        "roadcoin_cost": cost,
+    }
+
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.get("/api/v1/conversations/{conversation_id}")
 async def get_conversation(conversation_id: str):
     """Get conversation history"""
@@ -188,6 +425,45 @@ async def lucidia_status():
             "google",
             "xai",
             "custom"
+        ],
+        "caches": {
+            "routing_decisions": lucidia.decision_cache.stats(),
+            "token_counts": lucidia.token_count_cache.stats(),
+            "responses": chat_executor.response_cache.stats(),
+            "adapters": adapter_cache.stats()
+        },
+        "latency": lucidia.latency.snapshot(),
+        "execution": chat_executor.stats(),
+        "http_clients": http_clients.stats(),
+        "tokenizer": tokenizer_service.stats(),
+        "embeddings": embedding_pipeline.stats() if embedding_pipeline else None,
+        "vector_index": vector_index.stats() if vector_index else None
+    }
+
+@app.post("/api/v1/lucidia/route:batch")
+def route_batch(request: RouteBatchRequest):
+    """
+    Analyze and route a batch of messages in one call.
+
+    Used by offline evaluation and bulk imports. Declared sync so the
+    CPU-bound batch runs in the threadpool instead of on the event loop;
+    Lucidia's caches lock, so batches can run alongside routing on the loop.
+    """
+    try:
+        providers = [ModelProvider(provider) for provider in request.available_providers]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    analyses = lucidia.analyze_many(request.messages)
+    try:
+        decisions = lucidia.route_many(analyses, providers, request.user_preferences)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "results": [
+            {"analysis": analysis, "decision": decision}
+            for analysis, decision in zip(analyses, decisions)
         ]
     }
 
@@ -4,4 +4,5 @@ Middleware
 - auth.py: JWT verification (Clerk)
 - rate_limit.py: Rate limiting (Redis)
 - logging.py: Request/response logging
+- metrics.py: Per-route request counts and latency (Prometheus)
 """
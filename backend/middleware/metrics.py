@@ -0,0 +1,51 @@
+"""
+Metrics Middleware
+
+Counts and times every HTTP request by method, route template and
+status. Pure ASGI (no BaseHTTPMiddleware), so streaming responses pass
+through untouched and are timed to their last byte.
+"""
+
+import time
+
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from utils.metrics import HTTP_REQUESTS, HTTP_REQUEST_SECONDS, sampled
+
+# Label for requests that matched no route (404s, CORS preflights), so
+# arbitrary paths cannot grow the label set
+UNMATCHED_ROUTE = "unmatched"
+
+
+class MetricsMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter() if sampled() else None
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            labels = (scope["method"], route_template(scope), str(status))
+            HTTP_REQUESTS.inc(*labels)
+            if started is not None:
+                HTTP_REQUEST_SECONDS.child(labels).observe(time.perf_counter() - started)
+
+
+def route_template(scope: Scope) -> str:
+    """Path template of the route that handled a request (e.g. /api/v1/workspaces/{workspace_id})"""
+    # The router adds the matched route to the (shared) scope
+    route = scope.get("route")
+    return getattr(route, "path", None) or UNMATCHED_ROUTE
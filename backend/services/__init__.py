@@ -4,4 +4,16 @@ Core Business Logic Services
 - roadchain_service.py: RoadChain operations
 - agent_service.py: Agent management
 - user_service.py: User management
+- latency.py: Live per-model TTFT / throughput tracking
+- executor.py: Runs routing decisions against adapters (fallback, hedging)
+- circuit_breaker.py: Per provider/model circuit breakers
+- context.py: Packs conversation history into a model's context window
+- response_cache.py: Exact-match cache for deterministic chat requests
+- singleflight.py: Coalesces identical in-flight chat requests
+- semantic_cache.py: Embedding-similarity cache over MessageEmbedding
+- vector_index.py: In-process IVF-PQ index mirroring message embeddings
+- embedding_pipeline.py: Batched background MessageEmbedding ingestion
+- providers.py: Builds (and caches) adapters from a workspace's stored API keys
+- conversations.py: Loads stored conversation history
+- workspaces.py: Reads workspace settings
 """
@@ -0,0 +1,191 @@
+"""
+Circuit Breaker Service
+
+Per provider/model circuit breakers driven by error rate and timeouts.
+
+- CLOSED: requests flow; outcomes are recorded in a rolling window
+- OPEN: the model failed too often; requests are refused until the
+  cooldown elapses and Lucidia routes around it
+- HALF_OPEN: a limited number of trial requests decide whether to close
+  again or re-open
+"""
+
+from collections import deque
+from enum import Enum
+from typing import Callable, Deque, Dict, FrozenSet, Optional, Tuple
+import time
+
+
+class CircuitState(str, Enum):
+    """Circuit breaker states"""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitBreaker:
+    """Circuit breaker for a single provider/model"""
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_requests: int = 5,
+        error_rate: float = 0.5,
+        open_seconds: float = 30.0,
+        half_open_trials: int = 1,
+        on_state_change: Optional[Callable[["CircuitBreaker"], None]] = None
+    ):
+        """
+        Initialize the breaker.
+
+        Args:
+            window: Recent outcomes used for the error rate
+            min_requests: Outcomes needed before the breaker can trip
+            error_rate: Failure ratio (0-1) that opens the circuit
+            open_seconds: Cooldown before trial requests are allowed
+            half_open_trials: Concurrent trial requests while half-open
+            on_state_change: Called after every state transition
+        """
+        self.window = window
+        self.min_requests = min_requests
+        self.error_rate = error_rate
+        self.open_seconds = open_seconds
+        self.half_open_trials = half_open_trials
+        self.on_state_change = on_state_change
+
+        self._state = CircuitState.CLOSED
+        self._outcomes: Deque[bool] = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._trials_in_flight = 0
+
+    @property
+    def state(self) -> CircuitState:
+        """Current state (an expired OPEN cooldown becomes HALF_OPEN)"""
+        if self._state is CircuitState.OPEN and \
+                time.monotonic() - self._opened_at >= self.open_seconds:
+            self._trials_in_flight = 0
+            self._transition(CircuitState.HALF_OPEN)
+        return self._state
+
+    def available(self) -> bool:
+        """Whether a request would currently be allowed (does not reserve it)"""
+        state = self.state
+        if state is CircuitState.CLOSED:
+            return True
+        if state is CircuitState.HALF_OPEN:
+            return self._trials_in_flight < self.half_open_trials
+        return False
+
+    def allow_request(self) -> bool:
+        """Reserve a request slot; False means fail fast"""
+        if not self.available():
+            return False
+        if self._state is CircuitState.HALF_OPEN:
+            self._trials_in_flight += 1
+        return True
+
+    def record_success(self) -> None:
+        """Record a successful request (closes a half-open circuit)"""
+        if self._state is CircuitState.HALF_OPEN:
+            self._outcomes.clear()
+            self._transition(CircuitState.CLOSED)
+            return
+        self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        """Record a failed or timed-out request"""
+        if self._state is CircuitState.HALF_OPEN:
+            self._open()
+            return
+        self._outcomes.append(False)
+        if len(self._outcomes) >= self.min_requests:
+            failures = self._outcomes.count(False)
+            if failures / len(self._outcomes) >= self.error_rate:
+                self._open()
+
+    def release(self) -> None:
+        """Give back a reserved slot whose request was abandoned (e.g. a lost hedge)"""
+        if self._state is CircuitState.HALF_OPEN and self._trials_in_flight > 0:
+            self._trials_in_flight -= 1
+
+    def snapshot(self) -> Dict[str, object]:
+        """State and recent error rate for status reporting"""
+        outcomes = len(self._outcomes)
+        return {
+            "state": self.state.value,
+            "recent_requests": outcomes,
+            "recent_error_rate": self._outcomes.count(False) / outcomes if outcomes else 0.0,
+        }
+
+    def _open(self) -> None:
+        self._opened_at = time.monotonic()
+        self._trials_in_flight = 0
+        self._outcomes.clear()
+        self._transition(CircuitState.OPEN)
+
+    def _transition(self, state: CircuitState) -> None:
+        if state is self._state:
+            return
+        self._state = state
+        if self.on_state_change:
+            self.on_state_change(self)
+
+
+class CircuitBreakerRegistry:
+    """
+    Circuit breakers keyed by (provider, model_id).
+
+    `version` moves whenever the set of open circuits changes, so Lucidia
+    can drop cached routing decisions that still point at them.
+    """
+
+    def __init__(self, **breaker_config):
+        """
+        Initialize the registry.
+
+        Args:
+            **breaker_config: CircuitBreaker settings applied to every breaker
+        """
+        self.breaker_config = breaker_config
+        self.breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self.version = 0
+        self._open: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self._open_keys: FrozenSet[Tuple[str, str]] = frozenset()
+
+    def get(self, provider: str, model_id: str) -> CircuitBreaker:
+        """Get (or create) the breaker for a provider/model"""
+        key = (_provider_value(provider), model_id)
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                on_state_change=lambda b, key=key: self._state_changed(key, b),
+                **self.breaker_config
+            )
+            self.breakers[key] = breaker
+        return breaker
+
+    def open_circuits(self) -> Tuple[FrozenSet[Tuple[str, str]], int]:
+        """(provider, model_id) pairs currently OPEN, and their version"""
+        for breaker in list(self._open.values()):
+            breaker.state  # moves expired cooldowns to HALF_OPEN
+        return self._open_keys, self.version
+
+    def snapshot(self) -> Dict[str, Dict[str, object]]:
+        """Breaker states keyed "provider/model_id" """
+        return {
+            f"{provider}/{model_id}": breaker.snapshot()
+            for (provider, model_id), breaker in self.breakers.items()
+        }
+
+    def _state_changed(self, key: Tuple[str, str], breaker: CircuitBreaker) -> None:
+        if breaker._state is CircuitState.OPEN:
+            self._open[key] = breaker
+        else:
+            self._open.pop(key, None)
+        self._open_keys = frozenset(self._open)
+        self.version += 1
+
+
+def _provider_value(provider) -> str:
+    """Provider enum or string -> string value"""
+    return getattr(provider, "value", provider)
@@ -0,0 +1,328 @@
+"""
+Context Packing Service
+
+Fits a conversation into the chosen model's context window before it is
+sent. System messages and the current turn are pinned; history is kept
+newest-first until the budget runs out, and older turns are dropped or
+replaced by a cached summary. Token counts come from Lucidia's
+per-message cache, so nothing is re-encoded.
+
+When turns are dropped and no cached summary applies, the packer says how
+many leading turns a new summary should cover; ContextSummarizer writes
+that summary in the background with the same model, for later turns.
+"""
+
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+
+from pydantic import BaseModel
+
+from lucidia import LucidiaRouter
+from utils.cache import LRUCache
+
+
+# Chat formats add a few tokens of framing per message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Output budget when the request does not set max_tokens
+DEFAULT_RESERVED_OUTPUT_TOKENS = 4096
+
+# Output budget for a generated summary
+SUMMARY_MAX_TOKENS = 512
+
+# Share of the history budget left to verbatim turns after a new summary,
+# so the next several turns still fit next to it
+SUMMARY_VERBATIM_SHARE = 0.5
+
+SUMMARY_PROMPT = (
+    "Summarize the conversation so far for your own later reference. Keep facts, "
+    "decisions, names, numbers and open questions; leave out pleasantries. "
+    "Reply with the summary only."
+)
+
+
+class PackedContext(BaseModel):
+    """Messages selected for a model's context window"""
+    messages: List[Dict[str, Any]]
+    input_tokens: int
+    budget: int
+    dropped_messages: int = 0
+    summary_used: bool = False
+    fits: bool = True
+    # Leading history messages a new summary should cover (turns were
+    # dropped and no cached summary applied)
+    summarize_through: Optional[int] = None
+
+
+class ContextPacker:
+    """
+    Packs conversation history into a token budget.
+
+    Summaries are supplied from outside (ContextSummarizer) with
+    store_summary(), keyed by how many leading history messages they
+    cover.
+    """
+
+    def __init__(
+        self,
+        router: LucidiaRouter,
+        max_conversations: int = 4096,
+        summary_max_tokens: int = SUMMARY_MAX_TOKENS
+    ):
+        self.router = router
+        # Room a summary takes when planning a new one
+        self.summary_max_tokens = summary_max_tokens
+        # conversation_id -> {messages covered: summary text}
+        self.summaries = LRUCache(maxsize=max_conversations)
+
+    def store_summary(self, conversation_id: str, covered_messages: int, summary: str) -> None:
+        """
+        Cache a summary of a conversation's first `covered_messages`
+        non-system messages.
+        """
+        summaries = self.summaries.get(conversation_id) or {}
+        summaries[covered_messages] = summary
+        self.summaries.set(conversation_id, summaries)
+
+    def has_summary(self, conversation_id: str, covered_messages: int) -> bool:
+        """Whether a summary of exactly this many leading messages is cached"""
+        return covered_messages in (self.summaries.get(conversation_id) or {})
+
+    def pack(
+        self,
+        messages: List[Dict[str, Any]],
+        context_window: int,
+        reserved_output_tokens: Optional[int] = None,
+        conversation_id: Optional[str] = None
+    ) -> PackedContext:
+        """
+        Select the messages to send.
+
+        Args:
+            messages: Full conversation, current turn last
+            context_window: The chosen model's context window
+            reserved_output_tokens: Tokens kept free for the response
+                (default: 4096, capped at a quarter of the window)
+            conversation_id: Enables cached summaries for dropped turns
+
+        Returns:
+            PackedContext with the messages in their original order
+        """
+        if reserved_output_tokens is None:
+            reserved_output_tokens = min(DEFAULT_RESERVED_OUTPUT_TOKENS, context_window // 4)
+        budget = max(0, context_window - reserved_output_tokens)
+
+        counts = [self._tokens(msg) for msg in messages]
+        total = sum(counts)
+        if total <= budget or len(messages) <= 1:
+            return PackedContext(
+                messages=list(messages), input_tokens=total, budget=budget, fits=total <= budget
+            )
+
+        # Pin system messages and the current turn
+        system = [i for i, msg in enumerate(messages[:-1]) if msg.get("role") == "system"]
+        history = [i for i in range(len(messages) - 1) if messages[i].get("role") != "system"]
+        pinned_tokens = sum(counts[i] for i in system) + counts[-1]
+
+        # A cached summary lets us start the history later, in exchange for its own tokens
+        start, summary = 0, None
+        if conversation_id is not None:
+            start, summary = self._best_summary(
+                conversation_id, history, counts, budget - pinned_tokens
+            )
+
+        summary_tokens = self._summary_tokens(summary) if summary else 0
+        remaining = budget - pinned_tokens - summary_tokens
+        kept: List[int] = []
+        for i in reversed(history[start:]):
+            if counts[i] > remaining:
+                break
+            kept.append(i)
+            remaining -= counts[i]
+        kept.reverse()
+
+        # Providers expect history to resume on a user turn
+        while kept and messages[kept[0]].get("role") == "assistant":
+            remaining += counts[kept.pop(0)]
+
+        packed = [messages[i] for i in system]
+        if summary:
+            packed.append({
+                "role": "system",
+                "content": f"Summary of the earlier conversation:\n{summary}",
+            })
+        packed.extend(messages[i] for i in kept)
+        packed.append(messages[-1])
+
+        dropped = len(history) - len(kept)
+        summarize_through = None
+        if conversation_id is not None and summary is None and dropped:
+            summarize_through = self._summary_cut(messages, history, counts, budget - pinned_tokens)
+
+        input_tokens = budget - remaining
+        return PackedContext(
+            messages=packed,
+            input_tokens=input_tokens,
+            budget=budget,
+            dropped_messages=dropped,
+            summary_used=summary is not None,
+            fits=input_tokens <= budget,
+            summarize_through=summarize_through,
+        )
+
+    def _best_summary(
+        self,
+        conversation_id: str,
+        history: List[int],
+        counts: List[int],
+        history_budget: int
+    ) -> Tuple[int, Optional[str]]:
+        """
+        Pick a cached summary for the oldest turns.
+
+        Returns (position in history to resume from, summary), using the
+        summary covering the fewest messages whose text plus every turn
+        after it fits, so nothing between the summary and the kept turns is
+        lost. (0, None) when no summary applies.
+        """
+        summaries = self.summaries.get(conversation_id)
+        if not summaries:
+            return 0, None
+
+        suffix_tokens = _suffix_tokens(history, counts)
+        for covered in sorted(summaries):
+            if covered > len(history):
+                break  # summary of a longer (since edited) history
+            summary = summaries[covered]
+            if self._summary_tokens(summary) + suffix_tokens[covered] <= history_budget:
+                return covered, summary
+        return 0, None
+
+    def _summary_cut(
+        self,
+        messages: List[Dict[str, Any]],
+        history: List[int],
+        counts: List[int],
+        history_budget: int
+    ) -> Optional[int]:
+        """
+        How many leading history messages a new summary should cover.
+
+        Enough that the turns after it fill at most SUMMARY_VERBATIM_SHARE
+        of the history budget next to a full-size summary, ending before a
+        user turn. None if even that cannot fit.
+        """
+        verbatim_budget = (
+            history_budget * SUMMARY_VERBATIM_SHARE - self.summary_max_tokens - MESSAGE_OVERHEAD_TOKENS
+        )
+        if verbatim_budget < 0:
+            return None
+        suffix_tokens = _suffix_tokens(history, counts)
+        cut = next(
+            position for position in range(len(history) + 1)
+            if suffix_tokens[position] <= verbatim_budget
+        )
+        while cut < len(history) and messages[history[cut]].get("role") == "assistant":
+            cut += 1
+        return cut
+
+    def _tokens(self, message: Dict[str, Any]) -> int:
+        return self.router.count_message_tokens(message) + MESSAGE_OVERHEAD_TOKENS
+
+    def _summary_tokens(self, summary: str) -> int:
+        return self.router.count_tokens(summary) + MESSAGE_OVERHEAD_TOKENS
+
+
+def _suffix_tokens(history: List[int], counts: List[int]) -> List[int]:
+    """Tokens of history[position:] for every position (and 0 past the end)"""
+    suffix_tokens = [0] * (len(history) + 1)
+    for position in range(len(history) - 1, -1, -1):
+        suffix_tokens[position] = suffix_tokens[position + 1] + counts[history[position]]
+    return suffix_tokens
+
+
+class ContextSummarizer:
+    """
+    Writes the summaries ContextPacker swaps in for dropped turns.
+
+    A summary is generated off the response path by the model that is
+    about to answer (so the prefix is in a context window it handles),
+    at most one at a time per conversation.
+    """
+
+    def __init__(self, packer: ContextPacker):
+        self.packer = packer
+        self._running: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.summaries_written = 0
+        self.failures = 0
+
+    def schedule(
+        self,
+        conversation_id: str,
+        messages: List[Dict[str, Any]],
+        covered_messages: int,
+        chat: Callable[..., AsyncIterator[str]],
+        context_window: int
+    ) -> None:
+        """
+        Summarize a conversation's first `covered_messages` non-system
+        messages in the background.
+
+        Args:
+            conversation_id: Conversation the summary is cached under
+            messages: The conversation as packed for (current turn last)
+            covered_messages: From PackedContext.summarize_through
+            chat: Called as chat(messages, max_tokens=...) for a text stream;
+                circuit breaking and metering are up to it (see
+                ChatExecutor._summary_chat)
+            context_window: Context window of the model behind `chat`
+        """
+        if conversation_id in self._running or self.packer.has_summary(conversation_id, covered_messages):
+            return
+        history = [msg for msg in messages[:-1] if msg.get("role") != "system"]
+        if not covered_messages or covered_messages > len(history):
+            return
+
+        self._running.add(conversation_id)
+        task = asyncio.ensure_future(self._summarize(
+            conversation_id, history[:covered_messages], covered_messages, chat, context_window
+        ))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(
+        self,
+        conversation_id: str,
+        prefix: List[Dict[str, Any]],
+        covered_messages: int,
+        chat: Callable[..., AsyncIterator[str]],
+        context_window: int
+    ) -> None:
+        try:
+            # Packing the prefix reuses an earlier, shorter summary if it needs to
+            packed = self.packer.pack(
+                prefix + [{"role": "user", "content": SUMMARY_PROMPT}],
+                context_window,
+                reserved_output_tokens=self.packer.summary_max_tokens,
+                conversation_id=conversation_id
+            )
+            request = [{"role": msg["role"], "content": msg["content"]} for msg in packed.messages]
+            chunks = [chunk async for chunk in chat(request, max_tokens=self.packer.summary_max_tokens)]
+            summary = "".join(chunks).strip()
+            if summary:
+                self.packer.store_summary(conversation_id, covered_messages, summary)
+                self.summaries_written += 1
+        except Exception:
+            # Best effort: the next over-long turn schedules another attempt
+            self.failures += 1
+        finally:
+            self._running.discard(conversation_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Summaries written, failed attempts and summaries in progress"""
+        return {
+            "written": self.summaries_written,
+            "failures": self.failures,
+            "running": len(self._running),
+        }
@@ -0,0 +1,98 @@
+"""
+Conversation Service
+
+Reads and stores conversation history for chat requests.
+"""
+
+from typing import Any, Dict, List, Optional
+import asyncio
+import uuid
+
+from sqlalchemy.orm import sessionmaker
+
+from database import Conversation, Message, SessionLocal
+
+
+async def load_history(
+    conversation_id: str,
+    session_factory: sessionmaker = SessionLocal
+) -> List[Dict[str, Any]]:
+    """
+    A conversation's messages, oldest first.
+
+    Each message carries role, content and (when stored) tokens_used, so
+    Lucidia reuses the stored count instead of re-encoding.
+    """
+    return await asyncio.to_thread(_history, conversation_id, session_factory)
+
+
+def _history(conversation_id: str, session_factory: sessionmaker) -> List[Dict[str, Any]]:
+    with session_factory() as session:
+        rows = (
+            session.query(Message.role, Message.content, Message.tokens_used)
+            .filter(Message.conversation_id == uuid.UUID(str(conversation_id)))
+            .order_by(Message.created_at)
+            .all()
+        )
+    history = []
+    for role, content, tokens_used in rows:
+        message = {"role": role, "content": content}
+        if tokens_used is not None:
+            message["tokens_used"] = tokens_used
+        history.append(message)
+    return history
+
+
+async def start_conversation(
+    workspace_id: str,
+    session_factory: sessionmaker = SessionLocal
+) -> str:
+    """Create an empty conversation in a workspace; returns its id"""
+    return await asyncio.to_thread(_start_conversation, workspace_id, session_factory)
+
+
+async def save_message(
+    conversation_id: str,
+    role: str,
+    content: str,
+    model_used: Optional[str] = None,
+    tokens_used: Optional[int] = None,
+    routing_decision: Optional[Dict[str, Any]] = None,
+    session_factory: sessionmaker = SessionLocal
+) -> str:
+    """Append a message to a conversation; returns the stored Message id"""
+    return await asyncio.to_thread(
+        _save_message, conversation_id, role, content, model_used, tokens_used, routing_decision, session_factory
+    )
+
+
+def _start_conversation(workspace_id: str, session_factory: sessionmaker) -> str:
+    conversation_id = uuid.uuid4()
+    with session_factory() as session:
+        session.add(Conversation(id=conversation_id, workspace_id=uuid.UUID(str(workspace_id))))
+        session.commit()
+    return str(conversation_id)
+
+
+def _save_message(
+    conversation_id: str,
+    role: str,
+    content: str,
+    model_used: Optional[str],
+    tokens_used: Optional[int],
+    routing_decision: Optional[Dict[str, Any]],
+    session_factory: sessionmaker
+) -> str:
+    message_id = uuid.uuid4()
+    with session_factory() as session:
+        session.add(Message(
+            id=message_id,
+            conversation_id=uuid.UUID(str(conversation_id)),
+            role=role,
+            content=content,
+            model_used=model_used,
+            tokens_used=tokens_used,
+            routing_decision=routing_decision,
+        ))
+        session.commit()
+    return str(message_id)
@@ -0,0 +1,373 @@
+"""
+Embedding Ingestion Service
+
+Populates MessageEmbedding in the background.
+
+Stored messages are submitted to an in-process queue (never blocking the
+chat response path) and a worker task micro-batches them: a batch closes
+when it reaches `batch_size` or `max_wait` seconds after its first
+message. Each workspace's share of a batch is one embeddings call with
+that workspace's key, and all vectors are written with a single
+multi-row INSERT; if that INSERT fails, the rows are written one by one
+so a bad row (e.g. a deleted message) fails only itself. Embedding
+calls and inserts retry transient errors with exponential backoff.
+Every message is counted once: embedded, skipped or failed. Messages that arrive with a vector (e.g. a prompt embedded for a
+semantic cache lookup) skip the embeddings call, and messages that
+already have a stored vector are skipped.
+
+submit_on_commit() feeds the pipeline every user and assistant Message
+committed through the ORM.
+"""
+
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+import asyncio
+import time
+import uuid
+
+from sqlalchemy import event, insert, select
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+from tenacity import (
+    AsyncRetrying,
+    retry_if_exception_type,
+    retry_if_not_exception_type,
+    stop_after_attempt,
+    wait_exponential,
+)
+
+from adapters.base import BaseAdapter
+from database import Conversation, Message, MessageEmbedding, SessionLocal
+from services.vector_index import INDEXED_ROLE, VectorIndex
+
+
+# Embedding inputs are cut to stay under the model's 8K-token limit
+MAX_EMBED_CHARS = 24_000
+
+# Roles of the committed messages submit_on_commit() queues
+EMBEDDED_ROLES = ("user", "assistant")
+
+_SESSION_KEY = "embedding_pipeline_pending"
+
+
+class EmbeddingJob(NamedTuple):
+    """A stored message waiting for its embedding"""
+    message_id: str
+    workspace_id: str
+    content: str
+    enqueued_at: float
+    embedding: Optional[List[float]] = None
+    role: str = "user"
+
+
+class EmbeddingPipeline:
+    """Queue + micro-batching worker for message embeddings"""
+
+    def __init__(
+        self,
+        embedder_for: Callable[[str], Awaitable[Optional[BaseAdapter]]],
+        session_factory: sessionmaker = SessionLocal,
+        index: Optional[VectorIndex] = None,
+        batch_size: int = 100,
+        max_wait: float = 0.5,
+        max_queue: int = 10_000,
+        attempts: int = 5
+    ):
+        """
+        Initialize the pipeline.
+
+        Args:
+            embedder_for: Async lookup of a workspace's embedding-capable
+                adapter (None skips the workspace's messages)
+            session_factory: SQLAlchemy session factory
+            index: In-process vector index to update after each insert
+            batch_size: Messages per batch
+            max_wait: Seconds a batch waits to fill after its first message
+            max_queue: Queued messages before new ones are dropped
+            attempts: Tries per embedding call / insert
+        """
+        self.embedder_for = embedder_for
+        self.session_factory = session_factory
+        self.index = index
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.attempts = attempts
+
+        # Message ids wait in the queue; their jobs (oldest first) in _pending
+        self.queue: "asyncio.Queue[str]" = asyncio.Queue(maxsize=max_queue)
+        self._pending: Dict[str, EmbeddingJob] = {}
+        self._worker: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.submitted = 0
+        self.dropped = 0
+        self.embedded = 0
+        self.skipped = 0
+        self.failed = 0
+        self.index_errors = 0
+        self.batches = 0
+        self.last_lag_seconds = 0.0
+        self.max_lag_seconds = 0.0
+
+    def submit(
+        self,
+        message_id: str,
+        workspace_id: str,
+        content: str,
+        embedding: Optional[List[float]] = None,
+        role: str = "user"
+    ) -> bool:
+        """
+        Queue a stored message for embedding (never waits; event loop only).
+
+        A message that is already queued is not queued twice; a vector
+        submitted for it is attached to the queued job.
+
+        Args:
+            message_id: Stored Message id
+            workspace_id: The message's workspace
+            content: Text to embed
+            embedding: Vector already computed for this content, if any
+            role: The message's role (only user prompts go to the index)
+
+        Returns:
+            False if the queue is full and the message was dropped
+        """
+        if embedding is None and (not content or not content.strip()):
+            return True
+        message_id = str(message_id)
+        vector = list(embedding) if embedding is not None else None
+
+        queued = self._pending.get(message_id)
+        if queued is not None:
+            if vector is not None:
+                self._pending[message_id] = queued._replace(embedding=vector)
+            return True
+        try:
+            self.queue.put_nowait(message_id)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self._pending[message_id] = EmbeddingJob(
+            message_id, str(workspace_id), content, time.monotonic(), vector, role
+        )
+        self.submitted += 1
+        return True
+
+    def submit_threadsafe(self, messages: Iterable[Tuple[str, str, str, str]]) -> None:
+        """
+        Queue (message_id, workspace_id, content, role) tuples from any thread.
+
+        Messages are dropped (and counted) when the pipeline is not running.
+        """
+        messages = list(messages)
+        if self._loop is None or self._loop.is_closed():
+            self.dropped += len(messages)
+            return
+
+        def submit_all() -> None:
+            for message_id, workspace_id, content, role in messages:
+                self.submit(message_id, workspace_id, content, role=role)
+
+        self._loop.call_soon_threadsafe(submit_all)
+
+    def start(self) -> None:
+        """Start the worker task (call from the running event loop)"""
+        self._loop = asyncio.get_running_loop()
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.ensure_future(self._run())
+
+    async def stop(self, drain_timeout: float = 10.0) -> None:
+        """Embed what is already queued (up to `drain_timeout`), then stop"""
+        if self._worker is None:
+            return
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            pass
+        self._worker.cancel()
+        await asyncio.gather(self._worker, return_exceptions=True)
+        self._worker = None
+        self._loop = None
+
+    def lag_seconds(self) -> float:
+        """Age of the oldest queued message (0 when the queue is empty)"""
+        oldest = next(iter(self._pending.values()), None)
+        if oldest is None:
+            return 0.0
+        return time.monotonic() - oldest.enqueued_at
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, lag and counters"""
+        return {
+            "queued": len(self._pending),
+            "lag_seconds": self.lag_seconds(),
+            "last_batch_lag_seconds": self.last_lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "submitted": self.submitted,
+            "dropped": self.dropped,
+            "embedded": self.embedded,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "index_errors": self.index_errors,
+            "batches": self.batches,
+        }
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            ids = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(ids) < self.batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    ids.append(await asyncio.wait_for(self.queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            batch = [self._pending.pop(message_id) for message_id in ids]
+            try:
+                await self._process(batch)
+            except Exception:
+                # Only the stored-vector lookup raises, before any message was counted
+                self.failed += len(batch)
+            finally:
+                for _ in ids:
+                    self.queue.task_done()
+
+    async def _process(self, batch: List[EmbeddingJob]) -> None:
+        """Embed a batch (one call per workspace) and insert every vector at once"""
+        stored = await self._retry(asyncio.to_thread, self._already_embedded, [job.message_id for job in batch])
+        by_workspace: Dict[str, List[EmbeddingJob]] = {}
+        for job in batch:
+            if job.message_id in stored:
+                self.skipped += 1
+                continue
+            by_workspace.setdefault(job.workspace_id, []).append(job)
+
+        ready: List[Tuple[EmbeddingJob, List[float]]] = []
+        for workspace_id, jobs in by_workspace.items():
+            ready.extend((job, job.embedding) for job in jobs if job.embedding is not None)
+            pending = [job for job in jobs if job.embedding is None]
+            if pending:
+                try:
+                    embedder = await self.embedder_for(workspace_id)
+                    if embedder is None or not embedder.supports_embeddings:
+                        self.skipped += len(pending)
+                        continue
+                    vectors = await self._retry(
+                        embedder.embed, [job.content[:MAX_EMBED_CHARS] for job in pending]
+                    )
+                except Exception:
+                    self.failed += len(pending)
+                    continue
+                ready.extend(zip(pending, vectors))
+
+        if ready:
+            stored_jobs = await self._insert(ready)
+            self.embedded += len(stored_jobs)
+            self.failed += len(ready) - len(stored_jobs)
+            indexed = [
+                (job.message_id, job.workspace_id, vector)
+                for job, vector in stored_jobs
+                if job.role == INDEXED_ROLE
+            ]
+            if self.index is not None and indexed:
+                try:
+                    # Off the loop: the index may grow its arrays or save
+                    await asyncio.to_thread(self.index.add_many, indexed)
+                except Exception:
+                    # The vectors are stored; the next backfill indexes them
+                    self.index_errors += 1
+
+        self.batches += 1
+        self.last_lag_seconds = time.monotonic() - min(job.enqueued_at for job in batch)
+        self.max_lag_seconds = max(self.max_lag_seconds, self.last_lag_seconds)
+
+    async def _insert(
+        self,
+        ready: List[Tuple[EmbeddingJob, List[float]]]
+    ) -> List[Tuple[EmbeddingJob, List[float]]]:
+        """Store the vectors in one INSERT, else row by row; returns the stored ones"""
+        rows = [{"message_id": uuid.UUID(job.message_id), "embedding": vector} for job, vector in ready]
+        try:
+            await self._retry(asyncio.to_thread, self._bulk_insert, rows)
+            return ready
+        except Exception:
+            if len(rows) == 1:
+                return []
+        inserted = []
+        for item, row in zip(ready, rows):
+            try:
+                await self._retry(asyncio.to_thread, self._bulk_insert, [row])
+            except Exception:
+                continue
+            inserted.append(item)
+        return inserted
+
+    async def _retry(self, fn: Callable[..., Awaitable[Any]], *args: Any) -> Any:
+        async for attempt in AsyncRetrying(
+            stop=stop_after_attempt(self.attempts),
+            wait=wait_exponential(multiplier=0.5, max=30),
+            # A bad row fails the same way every time
+            retry=retry_if_exception_type(Exception) & retry_if_not_exception_type((IntegrityError, DataError)),
+            reraise=True,
+        ):
+            with attempt:
+                return await fn(*args)
+
+    def _already_embedded(self, message_ids: List[str]) -> Set[str]:
+        """Which of these messages already have a stored vector"""
+        with self.session_factory() as session:
+            rows = session.execute(
+                select(MessageEmbedding.message_id)
+                .where(MessageEmbedding.message_id.in_({uuid.UUID(message_id) for message_id in message_ids}))
+            ).scalars()
+            return {str(message_id) for message_id in rows}
+
+    def _bulk_insert(self, rows: List[Dict[str, Any]]) -> None:
+        """One multi-row INSERT"""
+        with self.session_factory() as session:
+            session.execute(insert(MessageEmbedding).values(rows))
+            session.commit()
+
+
+def submit_on_commit(
+    pipeline: EmbeddingPipeline,
+    session_factory: sessionmaker = SessionLocal,
+    roles: Tuple[str, ...] = EMBEDDED_ROLES
+) -> None:
+    """
+    Queue every committed user / assistant Message for embedding.
+
+    New messages are collected at flush (when their workspace can still be
+    looked up) and submitted only after the transaction commits; a
+    rollback discards them. Commits usually happen in worker threads, so
+    submission goes through the pipeline's event loop.
+    """
+
+    @event.listens_for(session_factory, "after_flush")
+    def collect(session: Session, flush_context) -> None:
+        added = [obj for obj in session.new if isinstance(obj, Message) and obj.role in roles]
+        if not added:
+            return
+        workspaces = dict(session.execute(
+            select(Conversation.id, Conversation.workspace_id)
+            .where(Conversation.id.in_({obj.conversation_id for obj in added}))
+        ).all())
+        session.info.setdefault(_SESSION_KEY, []).extend(
+            (str(obj.id), str(workspaces[obj.conversation_id]), obj.content, obj.role)
+            for obj in added
+            if obj.conversation_id in workspaces
+        )
+
+    @event.listens_for(session_factory, "after_commit")
+    def apply(session: Session) -> None:
+        pending = session.info.pop(_SESSION_KEY, None)
+        if pending:
+            pipeline.submit_threadsafe(pending)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def discard(session: Session) -> None:
+        session.info.pop(_SESSION_KEY, None)
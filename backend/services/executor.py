@@ -0,0 +1,593 @@
+"""
+Chat Execution Service
+
+Runs a Lucidia RoutingDecision against the workspace's provider adapters.
+
+Fallback: the selected model and its alternatives form a chain. A model
+that errors, times out or ends its stream before its first chunk is
+recorded on its circuit breaker and the next one is tried; models whose circuit is open
+are skipped without a request.
+
+Hedging (opt-in): if the selected model has not produced its first chunk
+within a percentile of its usual TTFT, the same request is started on the
+next alternative and whichever stream yields first wins; the other is
+cancelled. Hedges are capped per workspace by a token-bucket budget.
+
+Context packing: every attempt sends the history packed for that model's
+context window, so a fallback to a smaller model still fits. When turns
+are dropped without a usable summary, one is written in the background
+for the following turns. Summary calls go through the model's circuit
+breaker like any attempt, and their tokens and cost are metered in
+stats() under "summary_usage"; no response carries them.
+
+Response cache: deterministic requests (temperature 0, or a workspace that
+opted in) are answered from the ResponseCache when the exact packed
+request was seen before; replays are not timed as provider latency.
+
+Single-flight: identical deterministic requests that are in flight at
+the same time (same packed request hash) share one provider stream. The
+requests that attached report the first one's usage at no cost.
+
+Semantic cache (opt-in): a first-turn prompt is compared against earlier
+prompts in the workspace and a sufficiently similar one's reply is
+returned without calling a provider.
+"""
+
+from typing import Any, AsyncIterator, Dict, List, Mapping, NamedTuple, Optional, Set, Tuple
+import asyncio
+import time
+
+from pydantic import BaseModel
+
+from adapters.base import BaseAdapter, TokenUsage
+from lucidia import LucidiaRouter, ModelProvider, RoutingDecision
+from services.circuit_breaker import CircuitBreaker
+from services.context import ContextPacker, ContextSummarizer
+from services.response_cache import ResponseCache, response_cache_key
+from services.semantic_cache import SemanticCache
+from services.singleflight import SingleFlight
+from utils.cache import LRUCache
+from utils.tokenizer import tokenizer_service
+
+
+class CircuitOpenError(Exception):
+    """The model's circuit breaker refused the request"""
+
+
+class EmptyResponseError(Exception):
+    """The model's stream ended without producing any text"""
+
+
+class ExecutionError(Exception):
+    """Every model in the fallback chain failed"""
+
+    def __init__(self, failures: List[Tuple[str, BaseException]]):
+        self.failures = failures
+        summary = ", ".join(f"{model} ({type(exc).__name__})" for model, exc in failures)
+        super().__init__(f"All models in the fallback chain failed: {summary}")
+
+
+class ExecutionResult(BaseModel):
+    """Filled in by ChatExecutor.stream once a model starts answering"""
+    model: Optional[str] = None
+    input_tokens: int = 0
+    cached: bool = False
+    # Shared another request's in-flight stream (usage is that request's)
+    coalesced: bool = False
+    semantic_hit: bool = False
+    # Provider-reported usage, complete once the stream has ended
+    usage: Optional[TokenUsage] = None
+
+
+class _ChatRequest(NamedTuple):
+    """Per-request inputs shared by every attempt in the fallback chain"""
+    messages: List[Dict[str, str]]
+    adapters: Mapping[ModelProvider, BaseAdapter]
+    chat_kwargs: Dict[str, Any]
+    workspace_id: str
+    conversation_id: Optional[str]
+    cache_opt_in: bool
+    input_tokens: Dict[str, int]
+    cached_models: Set[str]
+    coalesced_models: Set[str]
+    usage: Dict[str, TokenUsage]
+
+
+class HedgeBudget:
+    """
+    Per-workspace token bucket for hedged requests.
+
+    Every request earns `ratio` hedge tokens (up to `burst`); a hedge spends
+    one. With the defaults at most ~5% of a workspace's requests are hedged
+    over time, which bounds the extra provider spend.
+    """
+
+    def __init__(self, ratio: float = 0.05, burst: float = 5.0, max_workspaces: int = 10000):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = LRUCache(maxsize=max_workspaces)
+
+    def record_request(self, workspace_id: str) -> None:
+        """Credit the workspace for one request"""
+        tokens = self._tokens.get(workspace_id, self.burst)
+        self._tokens.set(workspace_id, min(self.burst, tokens + self.ratio))
+
+    def try_acquire(self, workspace_id: str) -> bool:
+        """Spend one hedge token if the workspace has one"""
+        tokens = self._tokens.get(workspace_id, self.burst)
+        if tokens < 1:
+            return False
+        self._tokens.set(workspace_id, tokens - 1)
+        return True
+
+    def available(self, workspace_id: str) -> float:
+        """Hedge tokens currently available to the workspace"""
+        return self._tokens.get(workspace_id, self.burst)
+
+
+class ChatExecutor:
+    """
+    Executes routing decisions against provider adapters.
+
+    Every stream is timed through the router's LatencyTracker and every
+    outcome is recorded on the router's circuit breakers, so executed
+    requests keep Lucidia's live speed estimates and health current. The
+    input tokens a provider reports calibrate the tokenizer's estimate for
+    providers without a local tokenizer.
+    """
+
+    def __init__(
+        self,
+        router: LucidiaRouter,
+        hedge_budget: Optional[HedgeBudget] = None,
+        hedge_percentile: float = 95.0,
+        hedge_default_delay: float = 2.0,
+        hedge_min_delay: float = 0.05,
+        first_chunk_timeout: float = 20.0,
+        context_packer: Optional[ContextPacker] = None,
+        context_summarizer: Optional[ContextSummarizer] = None,
+        response_cache: Optional[ResponseCache] = None,
+        semantic_cache: Optional[SemanticCache] = None,
+        single_flight: Optional[SingleFlight] = None
+    ):
+        """
+        Initialize the executor.
+
+        Args:
+            router: Router whose capabilities, latency tracker and circuit
+                breakers to use
+            hedge_budget: Per-workspace hedge budget (default: 5% of requests)
+            hedge_percentile: TTFT percentile after which a hedge starts
+            hedge_default_delay: Hedge delay (seconds) for unmeasured models
+            hedge_min_delay: Lower bound on the hedge delay
+            first_chunk_timeout: Seconds to wait for a first chunk before the
+                attempt counts as failed and the chain moves on
+            context_packer: Packs history per model (default: one sharing
+                the router's token counts)
+            context_summarizer: Writes summaries of dropped turns (default:
+                one storing into the context packer)
+            response_cache: Cache for deterministic requests (default:
+                in-memory, plus disk if RESPONSE_CACHE_DIR is set)
+            semantic_cache: Embedding-similarity cache (default: disabled)
+            single_flight: Coalesces identical in-flight requests
+        """
+        self.router = router
+        self.hedge_budget = hedge_budget or HedgeBudget()
+        self.hedge_percentile = hedge_percentile
+        self.hedge_default_delay = hedge_default_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.first_chunk_timeout = first_chunk_timeout
+        self.context_packer = context_packer or ContextPacker(router)
+        self.context_summarizer = context_summarizer or ContextSummarizer(self.context_packer)
+        self.response_cache = response_cache or ResponseCache()
+        self.semantic_cache = semantic_cache
+        self.single_flight = single_flight or SingleFlight()
+        self._background: Set[asyncio.Task] = set()
+
+        self.hedges_started = 0
+        self.hedges_won = 0
+        self.fallbacks = 0
+        self.messages_dropped = 0
+        self.summary_usage = {"requests": 0, "input_tokens": 0, "output_tokens": 0, "roadcoin_cost": 0.0}
+
+    async def stream(
+        self,
+        decision: RoutingDecision,
+        messages: List[Dict[str, str]],
+        adapters: Mapping[ModelProvider, BaseAdapter],
+        workspace_id: Optional[str] = None,
+        hedge: bool = False,
+        conversation_id: Optional[str] = None,
+        cache_opt_in: bool = False,
+        semantic_opt_in: bool = False,
+        prompt_message_id: Optional[str] = None,
+        result: Optional[ExecutionResult] = None,
+        **chat_kwargs: Any
+    ) -> AsyncIterator[str]:
+        """
+        Stream the response for a routing decision.
+
+        Walks the fallback chain (selected model, then alternatives) until a
+        model produces its first chunk. Once streaming has started, errors
+        are recorded and re-raised; a half-sent answer is never switched.
+
+        Args:
+            decision: Lucidia routing decision
+            messages: Chat messages
+            adapters: The workspace's adapters by provider
+            workspace_id: Workspace, for the hedge budget
+            hedge: Enable hedging onto the next usable model in the chain
+            conversation_id: Conversation, for cached history summaries
+            cache_opt_in: The workspace allows cached responses at any
+                temperature (temperature 0 is always cacheable)
+            semantic_opt_in: The workspace allows replies to similar
+                earlier prompts (needs a semantic cache and an adapter with
+                embeddings)
+            prompt_message_id: Stored Message id of the prompt; its embedding
+                is saved on a semantic miss so later prompts can match it
+            result: Receives the answering model, its packed input tokens
+                and the provider-reported usage
+            **chat_kwargs: Passed to adapter chat() (temperature, max_tokens...)
+
+        Yields:
+            str: Response chunks from the winning model
+
+        Raises:
+            ExecutionError: If every model in the chain failed
+        """
+        chain = [
+            model for model in [decision.selected_model, *decision.alternatives]
+            if self._adapter_for(model, adapters)
+        ]
+        if not chain:
+            raise ValueError(f"No adapter connected for {decision.selected_model}")
+        if hedge:
+            self.hedge_budget.record_request(workspace_id or "")
+
+        if semantic_opt_in and self.semantic_cache is not None and workspace_id:
+            reply = await self._semantic_reply(
+                decision, messages, adapters, workspace_id, prompt_message_id
+            )
+            if reply is not None:
+                if result is not None:
+                    result.semantic_hit = True
+                yield reply
+                return
+
+        request = _ChatRequest(
+            messages, adapters, chat_kwargs, workspace_id or "", conversation_id, cache_opt_in, {}, set(), set(), {}
+        )
+        failures: List[Tuple[str, BaseException]] = []
+        started = None
+        while chain:
+            model = chain.pop(0)
+            if not self._breaker(model).allow_request():
+                failures.append((model, CircuitOpenError(model)))
+                continue
+
+            backup = None
+            if hedge:
+                hedge = False
+                backup = next((m for m in chain if self._breaker(m).available()), None)
+
+            try:
+                started = await self._first_chunk(model, backup, request)
+                break
+            except ExecutionError as e:
+                failures.extend(e.failures)
+                tried = {failed for failed, _ in e.failures}
+                chain = [m for m in chain if m not in tried]
+                self.fallbacks += 1
+
+        if started is None:
+            raise ExecutionError(failures)
+
+        winner, stream, first_chunk = started
+        if result is not None:
+            result.model = winner
+            result.input_tokens = request.input_tokens.get(winner, 0)
+            result.cached = winner in request.cached_models
+            result.coalesced = winner in request.coalesced_models
+            result.usage = request.usage.get(winner)
+        try:
+            yield first_chunk
+            async for chunk in stream:
+                yield chunk
+        except Exception:
+            self._breaker(winner).record_failure()
+            raise
+        finally:
+            await _close(stream)
+
+    async def _first_chunk(
+        self,
+        model: str,
+        backup: Optional[str],
+        request: _ChatRequest
+    ) -> Tuple[str, AsyncIterator[str], str]:
+        """
+        Start `model` and wait for its first chunk, hedging onto `backup`.
+
+        Returns (winning model, its stream, first chunk). A stream that ends
+        before its first chunk counts as a failed attempt, like an error.
+        Losing or timed-out streams are cancelled and closed.
+
+        Raises:
+            ExecutionError: If no stream produced a first chunk in time
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.first_chunk_timeout
+        hedge_at = loop.time() + self._hedge_delay(model) if backup else None
+
+        pending: Dict[asyncio.Future, Tuple[str, AsyncIterator[str]]] = {}
+
+        def start(model_key: str) -> None:
+            stream = self._open(model_key, request)
+            pending[asyncio.ensure_future(stream.__anext__())] = (model_key, stream)
+
+        async def cancel(task: asyncio.Future, stream: AsyncIterator[str]) -> None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            await _close(stream)
+
+        failures: List[Tuple[str, BaseException]] = []
+        start(model)
+        try:
+            while pending:
+                wake_at = deadline if hedge_at is None else min(deadline, hedge_at)
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=max(0.0, wake_at - loop.time()),
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+
+                if not done:
+                    if hedge_at is not None and loop.time() < deadline:
+                        hedge_at = None
+                        breaker = self._breaker(backup)
+                        if breaker.available() and self.hedge_budget.try_acquire(request.workspace_id):
+                            breaker.allow_request()
+                            start(backup)
+                            self.hedges_started += 1
+                        continue
+                    # First-chunk deadline passed: everything still pending timed out
+                    for task, (timed_out, stream) in list(pending.items()):
+                        del pending[task]
+                        await cancel(task, stream)
+                        self._breaker(timed_out).record_failure()
+                        failures.append((timed_out, asyncio.TimeoutError()))
+                    break
+
+                for task in done:
+                    model_key, stream = pending.pop(task)
+                    exc = task.exception()
+                    if exc is None:
+                        self._breaker(model_key).record_success()
+                        if model_key != model:
+                            self.hedges_won += 1
+                        return model_key, stream, task.result()
+                    if isinstance(exc, StopAsyncIteration):
+                        exc = EmptyResponseError(model_key)
+                    self._breaker(model_key).record_failure()
+                    failures.append((model_key, exc))
+                    await _close(stream)
+
+            raise ExecutionError(failures)
+        finally:
+            # Attempts abandoned without an outcome (a lost hedge, cancellation) give back their slot
+            for task, (model_key, stream) in pending.items():
+                await cancel(task, stream)
+                self._breaker(model_key).release()
+
+    async def _semantic_reply(
+        self,
+        decision: RoutingDecision,
+        messages: List[Dict[str, str]],
+        adapters: Mapping[ModelProvider, BaseAdapter],
+        workspace_id: str,
+        prompt_message_id: Optional[str]
+    ) -> Optional[str]:
+        """
+        A cached reply to a similar earlier prompt, if there is one.
+
+        Only first-turn prompts are looked up: later turns depend on the
+        conversation so far, which the nearest earlier prompt does not share.
+        """
+        if any(msg.get("role") == "assistant" for msg in messages):
+            return None
+        embedder = next(
+            (adapter for adapter in adapters.values() if adapter.supports_embeddings), None
+        )
+        if embedder is None:
+            return None
+
+        started = time.perf_counter()
+        result = await self.semantic_cache.lookup(workspace_id, messages[-1]["content"], embedder)
+        if result is None:
+            return None
+
+        if result.hit is None:
+            if prompt_message_id is not None:
+                # Off the response path: the provider call should not wait on the insert
+                task = asyncio.ensure_future(
+                    self.semantic_cache.remember(workspace_id, prompt_message_id, result.embedding)
+                )
+                self._background.add(task)
+                task.add_done_callback(self._background.discard)
+            return None
+
+        capability = self.router.model_capabilities.get(decision.selected_model)
+        if capability is not None:
+            expected = self.router.latency.estimate_response_seconds(
+                capability.model_id, self.router.count_tokens(result.hit.reply)
+            )
+            if expected is not None:
+                self.semantic_cache.record_saved(expected - (time.perf_counter() - started))
+        return result.hit.reply
+
+    def _hedge_delay(self, model_key: str) -> float:
+        """How long to wait for the first chunk before hedging"""
+        capability = self.router.model_capabilities.get(model_key)
+        delay = None
+        if capability is not None:
+            delay = self.router.latency.ttft_percentile(capability.model_id, self.hedge_percentile)
+        if delay is None:
+            delay = self.hedge_default_delay
+        return max(self.hedge_min_delay, delay)
+
+    def _breaker(self, model_key: str) -> CircuitBreaker:
+        capability = self.router.model_capabilities[model_key]
+        return self.router.circuit_breakers.get(capability.provider, capability.model_id)
+
+    def _adapter_for(
+        self,
+        model_key: str,
+        adapters: Mapping[ModelProvider, BaseAdapter]
+    ) -> Optional[BaseAdapter]:
+        capability = self.router.model_capabilities.get(model_key)
+        if capability is None:
+            return None
+        return adapters.get(capability.provider)
+
+    def _open(self, model_key: str, request: _ChatRequest) -> AsyncIterator[str]:
+        """Start a chat stream for a catalog model on its packed context"""
+        adapter = self._adapter_for(model_key, request.adapters)
+        capability = self.router.model_capabilities[model_key]
+        chat_kwargs = request.chat_kwargs
+        packed = self.context_packer.pack(
+            request.messages,
+            capability.context_window,
+            reserved_output_tokens=chat_kwargs.get("max_tokens"),
+            conversation_id=request.conversation_id
+        )
+        if packed.dropped_messages:
+            self.messages_dropped += packed.dropped_messages
+        if packed.summarize_through is not None:
+            self.context_summarizer.schedule(
+                request.conversation_id,
+                request.messages,
+                packed.summarize_through,
+                lambda summary_request, **kwargs: self._summary_chat(model_key, adapter, summary_request, **kwargs),
+                capability.context_window
+            )
+        request.input_tokens[model_key] = packed.input_tokens
+        # Providers reject extra keys such as stored token counts
+        messages = [{"role": msg["role"], "content": msg["content"]} for msg in packed.messages]
+        usage = request.usage[model_key] = TokenUsage()
+
+        def open_stream() -> AsyncIterator[str]:
+            return self._calibrated(
+                self.router.latency.track(
+                    capability.model_id,
+                    adapter.chat(messages, capability.model_id, stream=True, usage=usage, **chat_kwargs)
+                ),
+                capability.provider,
+                packed.input_tokens,
+                usage
+            )
+
+        temperature = chat_kwargs.get("temperature", 0.7)
+        key = response_cache_key(
+            request.workspace_id,
+            messages,
+            capability.model_id,
+            temperature,
+            chat_kwargs.get("max_tokens")
+        )
+
+        def on_coalesced(leader_usage: TokenUsage) -> None:
+            # Filled in by the leader's stream, which this one mirrors
+            request.usage[model_key] = leader_usage
+            request.coalesced_models.add(model_key)
+
+        def coalesced_stream() -> AsyncIterator[str]:
+            return self.single_flight.join(key, open_stream, shared=usage, on_coalesced=on_coalesced)
+
+        # Sampled requests are neither cached nor coalesced: each gets its own answer
+        if not self.response_cache.is_cacheable(temperature, request.cache_opt_in):
+            return open_stream()
+        return self.response_cache.wrap(
+            key, coalesced_stream, on_hit=lambda: request.cached_models.add(model_key)
+        )
+
+    async def _summary_chat(
+        self,
+        model_key: str,
+        adapter: BaseAdapter,
+        messages: List[Dict[str, Any]],
+        **chat_kwargs: Any
+    ) -> AsyncIterator[str]:
+        """A background summary request: gated and recorded by the model's circuit breaker, and metered"""
+        breaker = self._breaker(model_key)
+        if not breaker.allow_request():
+            raise CircuitOpenError(model_key)
+        capability = self.router.model_capabilities[model_key]
+        usage = TokenUsage()
+        parts: List[str] = []
+        stream = adapter.chat(messages, capability.model_id, stream=True, temperature=0, usage=usage, **chat_kwargs)
+        try:
+            async for chunk in stream:
+                parts.append(chunk)
+                yield chunk
+        except Exception:
+            breaker.record_failure()
+            raise
+        except BaseException:
+            # Cancelled (e.g. shutdown): no outcome to record
+            breaker.release()
+            raise
+        finally:
+            await _close(stream)
+        breaker.record_success()
+
+        if usage.reported:
+            input_tokens, output_tokens = usage.total_input_tokens, usage.output_tokens
+        else:
+            input_tokens = sum(self.router.count_message_tokens(message) for message in messages)
+            output_tokens = self.router.count_tokens("".join(parts))
+        self.summary_usage["requests"] += 1
+        self.summary_usage["input_tokens"] += input_tokens
+        self.summary_usage["output_tokens"] += output_tokens
+        self.summary_usage["roadcoin_cost"] += adapter.estimate_cost(
+            input_tokens, output_tokens, capability.model_id, usage=usage
+        )
+
+    async def _calibrated(
+        self,
+        stream: AsyncIterator[str],
+        provider: ModelProvider,
+        estimated_tokens: int,
+        usage: TokenUsage
+    ) -> AsyncIterator[str]:
+        """Pass a stream through, then calibrate the provider's token ratio against its reported usage"""
+        # Approximate counts (tokenizer still loading) would skew the ratio
+        exact = self.router.tokenizer.ready
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await _close(stream)
+        if exact and usage.reported:
+            tokenizer_service.calibrate(provider.value, estimated_tokens, usage.total_input_tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hedging / fallback / packing / coalescing counters and circuit breaker states"""
+        return {
+            "hedges_started": self.hedges_started,
+            "hedges_won": self.hedges_won,
+            "fallbacks": self.fallbacks,
+            "messages_dropped": self.messages_dropped,
+            "summaries": self.context_summarizer.stats(),
+            "summary_usage": dict(self.summary_usage),
+            "circuit_breakers": self.router.circuit_breakers.snapshot(),
+            "semantic_cache": self.semantic_cache.stats() if self.semantic_cache else None,
+            "single_flight": self.single_flight.stats(),
+        }
+
+
+async def _close(stream: AsyncIterator[str]) -> None:
+    """Close a stream, ignoring errors from an already-failed generator"""
+    try:
+        await stream.aclose()
+    except (RuntimeError, StopAsyncIteration):
+        pass
@@ -0,0 +1,244 @@
+"""
+Latency Tracking Service
+
+Online time-to-first-token (TTFT) and output tokens/sec estimates per
+model, measured by timing adapter chat() streams. Lucidia uses the live
+numbers in place of the static speed_tier bonus when scoring models.
+
+Attempts abandoned before their first chunk (a lost hedge, a first-chunk
+timeout) are recorded as censored samples: the time waited is a lower
+bound on their TTFT, and dropping them would bias the estimates towards
+the fast requests that finished.
+"""
+
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Tuple
+import asyncio
+import time
+
+from utils.tokenizer import tokenizer_service
+
+
+class ModelLatency:
+    """Latency estimates for a single model"""
+
+    def __init__(self, alpha: float, window: int):
+        self.alpha = alpha
+        self.ttft_ewma: Optional[float] = None
+        self.tokens_per_second_ewma: Optional[float] = None
+        self.ttft_samples: Deque[float] = deque(maxlen=window)
+        self.samples = 0
+        self.censored = 0
+        self.last_observed = 0.0
+
+    def observe(
+        self,
+        ttft: float,
+        tokens_per_second: Optional[float],
+        now: float,
+        censored: bool = False
+    ) -> None:
+        """Fold one timed request into the estimates (censored: `ttft` is a lower bound)"""
+        self.ttft_ewma = ttft if self.ttft_ewma is None else (
+            self.alpha * ttft + (1 - self.alpha) * self.ttft_ewma
+        )
+        if tokens_per_second is not None:
+            self.tokens_per_second_ewma = tokens_per_second if self.tokens_per_second_ewma is None else (
+                self.alpha * tokens_per_second + (1 - self.alpha) * self.tokens_per_second_ewma
+            )
+        self.ttft_samples.append(ttft)
+        self.samples += 1
+        self.censored += censored
+        self.last_observed = now
+
+    def ttft_percentile(self, percentile: float) -> Optional[float]:
+        """TTFT percentile (0-100) over the recent sample window"""
+        if not self.ttft_samples:
+            return None
+        ordered = sorted(self.ttft_samples)
+        index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Optional[float]]:
+        """Current estimates for status reporting"""
+        return {
+            "ttft_ewma_s": self.ttft_ewma,
+            "ttft_p50_s": self.ttft_percentile(50),
+            "ttft_p95_s": self.ttft_percentile(95),
+            "tokens_per_second_ewma": self.tokens_per_second_ewma,
+            "samples": self.samples,
+            "censored_samples": self.censored,
+        }
+
+
+class LatencyTracker:
+    """
+    Live latency estimates for every model that has been called.
+
+    Speed bonuses are on the same 0-5 scale as the static speed tiers and
+    are quantized, so `version` only moves when a bonus changes enough to
+    affect routing. Estimates older than `stale_after` seconds are dropped
+    and the model falls back to its static tier.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.2,
+        window: int = 256,
+        min_samples: int = 3,
+        fast_ttft: float = 0.5,
+        slow_ttft: float = 5.0,
+        fast_tokens_per_second: float = 80.0,
+        stale_after: float = 300.0,
+        quantum: float = 0.5
+    ):
+        """
+        Initialize the tracker.
+
+        Args:
+            alpha: EWMA smoothing factor
+            window: Recent TTFT samples kept per model for percentiles
+            min_samples: Samples needed before live numbers replace the tier
+            fast_ttft: TTFT (seconds) that earns the full TTFT bonus
+            slow_ttft: TTFT (seconds) at or above which the bonus is zero
+            fast_tokens_per_second: Throughput that earns the full throughput bonus
+            stale_after: Seconds without samples before estimates expire
+            quantum: Bonus rounding step
+        """
+        self.alpha = alpha
+        self.window = window
+        self.min_samples = min_samples
+        self.fast_ttft = fast_ttft
+        self.slow_ttft = slow_ttft
+        self.fast_tokens_per_second = fast_tokens_per_second
+        self.stale_after = stale_after
+        self.quantum = quantum
+
+        self.models: Dict[str, ModelLatency] = {}
+        self.version = 0
+        self._bonuses: Dict[str, float] = {}
+        self._next_sweep = 0.0
+
+    def observe(
+        self,
+        model_id: str,
+        ttft: float,
+        output_tokens: int = 0,
+        generation_seconds: float = 0.0,
+        censored: bool = False
+    ) -> None:
+        """
+        Record one timed request.
+
+        Args:
+            model_id: Provider model identifier (ModelCapability.model_id)
+            ttft: Seconds from request start to first chunk
+            output_tokens: Output tokens produced
+            generation_seconds: Seconds from first to last chunk
+            censored: The request was abandoned before its first chunk;
+                `ttft` is the time waited
+        """
+        now = time.monotonic()
+        latency = self.models.get(model_id)
+        if latency is None:
+            latency = self.models[model_id] = ModelLatency(self.alpha, self.window)
+
+        tokens_per_second = None
+        if output_tokens > 1 and generation_seconds > 0:
+            tokens_per_second = output_tokens / generation_seconds
+        latency.observe(ttft, tokens_per_second, now, censored)
+
+        if latency.samples >= self.min_samples:
+            self._set_bonus(model_id, self._bonus(latency))
+
+    def speed_bonuses(self) -> Tuple[Dict[str, float], int]:
+        """Live speed bonuses by model_id, and the version they belong to"""
+        now = time.monotonic()
+        if now >= self._next_sweep:
+            self._next_sweep = now + min(self.stale_after, 10.0)
+            for model_id in list(self._bonuses):
+                if now - self.models[model_id].last_observed > self.stale_after:
+                    del self._bonuses[model_id]
+                    self.version += 1
+        return self._bonuses, self.version
+
+    def speed_bonus(self, model_id: str) -> Optional[float]:
+        """Live speed bonus for a model, or None to use its static tier"""
+        return self.speed_bonuses()[0].get(model_id)
+
+    def ttft_percentile(self, model_id: str, percentile: float) -> Optional[float]:
+        """Recent TTFT percentile for a model, if it has been measured"""
+        latency = self.models.get(model_id)
+        return latency.ttft_percentile(percentile) if latency else None
+
+    def estimate_response_seconds(self, model_id: str, output_tokens: int) -> Optional[float]:
+        """Expected wall time for a response of `output_tokens`, if measured"""
+        latency = self.models.get(model_id)
+        if latency is None or latency.ttft_ewma is None:
+            return None
+        seconds = latency.ttft_ewma
+        if latency.tokens_per_second_ewma:
+            seconds += output_tokens / latency.tokens_per_second_ewma
+        return seconds
+
+    def snapshot(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """Estimates for every tracked model, with the bonus in effect"""
+        bonuses, _ = self.speed_bonuses()
+        return {
+            model_id: {**latency.snapshot(), "speed_bonus": bonuses.get(model_id)}
+            for model_id, latency in self.models.items()
+        }
+
+    async def track(
+        self,
+        model_id: str,
+        stream: AsyncIterator[str]
+    ) -> AsyncIterator[str]:
+        """
+        Pass an adapter chat() stream through, timing it.
+
+        TTFT is recorded once the first chunk arrives; a stream closed or
+        cancelled before then is recorded as a censored sample, while one
+        that failed or ended empty is not recorded. Throughput needs at
+        least two chunks and counts the output with the model's tokenizer.
+        """
+        start = time.monotonic()
+        first_chunk_at = None
+        parts: List[str] = []
+        abandoned = False
+        try:
+            async for chunk in stream:
+                if first_chunk_at is None:
+                    first_chunk_at = time.monotonic()
+                parts.append(chunk)
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            abandoned = True
+            raise
+        finally:
+            await stream.aclose()
+            if first_chunk_at is not None:
+                self.observe(
+                    model_id,
+                    ttft=first_chunk_at - start,
+                    output_tokens=tokenizer_service.count("".join(parts), model=model_id) if len(parts) > 1 else 0,
+                    generation_seconds=time.monotonic() - first_chunk_at
+                )
+            elif abandoned:
+                self.observe(model_id, ttft=time.monotonic() - start, censored=True)
+
+    def _bonus(self, latency: ModelLatency) -> float:
+        """Quantized 0-5 speed bonus from TTFT (70%) and throughput (30%)"""
+        span = self.slow_ttft - self.fast_ttft
+        ttft_score = min(1.0, max(0.0, (self.slow_ttft - latency.ttft_ewma) / span))
+        if latency.tokens_per_second_ewma is None:
+            throughput_score = ttft_score
+        else:
+            throughput_score = min(1.0, latency.tokens_per_second_ewma / self.fast_tokens_per_second)
+        bonus = 5 * (0.7 * ttft_score + 0.3 * throughput_score)
+        return round(bonus / self.quantum) * self.quantum
+
+    def _set_bonus(self, model_id: str, bonus: float) -> None:
+        if self._bonuses.get(model_id) != bonus:
+            self._bonuses[model_id] = bonus
+            self.version += 1
@@ -0,0 +1,305 @@
+"""
+Provider Service
+
+Loads a workspace's stored API keys and builds provider adapters;
+store_api_key seals and stores new ones.
+
+APIKey.encrypted_key holds "dk:<iv>:<ciphertext>" (both base64),
+encrypted with the workspace's data key (Workspace.encrypted_data_key,
+see utils/crypto.py) and the workspace id as associated data, so a
+value copied into another workspace's rows does not decrypt. Values
+without the prefix are "<iv>:<ciphertext>" under the master key, from
+before workspaces had data keys; they are still read, never written.
+Keys are decrypted only when adapters are built, a workspace's keys in
+one batch.
+
+Built adapters are cached per (workspace, provider) for a TTL, including
+"no key" results, so a chat request does not query, decrypt and
+construct on every call. Decrypted keys live only inside cached adapters
+in memory. Committed APIKey changes invalidate the workspace's entries
+(see invalidate_on_key_changes); the TTL bounds staleness for changes
+made by other processes.
+"""
+
+from typing import Any, Dict, List, Optional, Set, Tuple, Type
+import asyncio
+import os
+import uuid
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, sessionmaker
+
+from adapters import AnthropicAdapter, BaseAdapter, GoogleAdapter, OpenAIAdapter, XAIAdapter
+from database import APIKey, SessionLocal, Workspace
+from lucidia import ModelProvider
+from utils.cache import TTLCache
+from utils.crypto import EncryptionService, get_encryption_service, get_key_ring
+
+
+ADAPTER_CLASSES: Dict[ModelProvider, Type[BaseAdapter]] = {
+    ModelProvider.OPENAI: OpenAIAdapter,
+    ModelProvider.ANTHROPIC: AnthropicAdapter,
+    ModelProvider.GOOGLE: GoogleAdapter,
+    ModelProvider.XAI: XAIAdapter,
+}
+
+# Seconds a built adapter (or a "no key" result) is reused
+ADAPTER_CACHE_TTL_SECONDS = float(os.getenv("ADAPTER_CACHE_TTL_SECONDS", "300"))
+
+# Marks APIKey.encrypted_key values sealed with the workspace data key
+DATA_KEY_PREFIX = "dk:"
+
+_SESSION_KEY = "providers_changed_workspaces"
+_MISSING = object()
+
+
+class AdapterCache:
+    """Adapters by (workspace, provider); None records a workspace without that key"""
+
+    def __init__(self, maxsize: int = 4096, ttl: float = ADAPTER_CACHE_TTL_SECONDS):
+        self.entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, workspace_id: str, provider: ModelProvider, default: Any = None) -> Any:
+        return self.entries.get((str(workspace_id), provider), default)
+
+    def set(self, workspace_id: str, provider: ModelProvider, adapter: Optional[BaseAdapter]) -> None:
+        self.entries.set((str(workspace_id), provider), adapter)
+
+    def invalidate(self, workspace_id: str, provider: Optional[ModelProvider] = None) -> None:
+        """Drop a workspace's adapters (one provider, or all of them)"""
+        for cached_provider in ([provider] if provider else ADAPTER_CLASSES):
+            self.entries.pop((str(workspace_id), cached_provider))
+
+    def stats(self) -> Dict[str, Any]:
+        return self.entries.stats()
+
+
+adapter_cache = AdapterCache()
+
+
+def ensure_data_key(workspace: Workspace) -> str:
+    """The workspace's wrapped data key, generating one if it has none"""
+    if workspace.encrypted_data_key is None:
+        workspace.encrypted_data_key = get_key_ring().new_data_key()
+    return workspace.encrypted_data_key
+
+
+def seal_api_key(api_key: str, workspace_id: str, wrapped_data_key: str) -> str:
+    """
+    Encrypt an API key for APIKey.encrypted_key.
+
+    Args:
+        api_key: Plaintext key
+        workspace_id: Workspace the key belongs to (bound as associated data)
+        wrapped_data_key: The workspace's data key (see ensure_data_key)
+    """
+    encrypted, iv = get_key_ring().service_for(wrapped_data_key).encrypt(
+        api_key, _associated_data(workspace_id)
+    )
+    return f"{DATA_KEY_PREFIX}{iv}:{encrypted}"
+
+
+def open_api_keys(
+    encrypted_keys: List[str],
+    workspace_id: str,
+    wrapped_data_key: Optional[str] = None
+) -> List[str]:
+    """
+    Decrypt one workspace's APIKey.encrypted_key values.
+
+    Data-key values share a single (cached) unwrap and one batch decrypt;
+    master-key values are decrypted in a second batch.
+
+    Raises:
+        ValueError: If a value needs a data key and none was given
+        cryptography.exceptions.InvalidTag: If a value fails to decrypt,
+            e.g. one sealed for another workspace
+    """
+    enveloped, legacy = [], []
+    for position, encrypted_key in enumerate(encrypted_keys):
+        if encrypted_key.startswith(DATA_KEY_PREFIX):
+            enveloped.append((position, encrypted_key[len(DATA_KEY_PREFIX):]))
+        else:
+            legacy.append((position, encrypted_key))
+    if enveloped and wrapped_data_key is None:
+        raise ValueError("API key was sealed with a workspace data key, but the workspace has none")
+
+    plaintexts: List[Optional[str]] = [None] * len(encrypted_keys)
+    if enveloped:
+        _decrypt_into(
+            plaintexts, enveloped, get_key_ring().service_for(wrapped_data_key), _associated_data(workspace_id)
+        )
+    if legacy:
+        _decrypt_into(plaintexts, legacy, get_encryption_service())
+    return plaintexts
+
+
+def open_api_key(encrypted_key: str, workspace_id: str, wrapped_data_key: Optional[str] = None) -> str:
+    """Decrypt an APIKey.encrypted_key value"""
+    return open_api_keys([encrypted_key], workspace_id, wrapped_data_key)[0]
+
+
+async def store_api_key(
+    workspace_id: str,
+    provider: str,
+    api_key: str,
+    enabled: bool = True,
+    session_factory: sessionmaker = SessionLocal
+) -> str:
+    """
+    Seal an API key with the workspace's data key and store it.
+
+    Generates the workspace's data key on its first stored key.
+
+    Returns:
+        The stored APIKey id
+
+    Raises:
+        ValueError: If the workspace does not exist
+    """
+    return await asyncio.to_thread(_store_api_key, workspace_id, provider, api_key, enabled, session_factory)
+
+
+async def load_adapters(
+    workspace_id: str,
+    providers: Optional[List[ModelProvider]] = None,
+    session_factory: sessionmaker = SessionLocal
+) -> Dict[ModelProvider, BaseAdapter]:
+    """
+    Adapters for a workspace's enabled API keys.
+
+    Served from the adapter cache when every wanted provider is cached;
+    otherwise all of the workspace's keys are loaded and cached at once.
+
+    Args:
+        workspace_id: Workspace whose keys to load
+        providers: Only these providers (default: all supported)
+        session_factory: SQLAlchemy session factory
+
+    Returns:
+        Adapters by provider (providers without a key are absent)
+    """
+    wanted = [provider for provider in (providers or ADAPTER_CLASSES) if provider in ADAPTER_CLASSES]
+    cached = {provider: adapter_cache.get(workspace_id, provider, _MISSING) for provider in wanted}
+    if _MISSING not in cached.values():
+        return {provider: adapter for provider, adapter in cached.items() if adapter is not None}
+
+    wrapped_data_key, rows = await asyncio.to_thread(_enabled_keys, workspace_id, session_factory)
+    first_keys: Dict[ModelProvider, str] = {}
+    for provider_value, encrypted_key in rows:
+        try:
+            provider = ModelProvider(provider_value)
+        except ValueError:
+            continue  # e.g. "custom" endpoints have no adapter yet
+        if provider in ADAPTER_CLASSES:
+            first_keys.setdefault(provider, encrypted_key)
+
+    api_keys = open_api_keys(list(first_keys.values()), workspace_id, wrapped_data_key)
+    built: Dict[ModelProvider, BaseAdapter] = {
+        provider: ADAPTER_CLASSES[provider](api_key)
+        for provider, api_key in zip(first_keys, api_keys)
+    }
+
+    for provider in ADAPTER_CLASSES:
+        adapter_cache.set(workspace_id, provider, built.get(provider))
+    return {provider: built[provider] for provider in wanted if provider in built}
+
+
+async def get_adapter(
+    workspace_id: str,
+    provider: ModelProvider,
+    session_factory: sessionmaker = SessionLocal
+) -> Optional[BaseAdapter]:
+    """Adapter for one provider, or None if the workspace has no enabled key"""
+    adapters = await load_adapters(workspace_id, [provider], session_factory)
+    return adapters.get(provider)
+
+
+def invalidate_on_key_changes(session_factory: sessionmaker = SessionLocal) -> None:
+    """
+    Invalidate cached adapters when a workspace's API keys change.
+
+    Workspaces with added, changed or deleted APIKey rows are collected
+    at flush and invalidated only after the transaction commits.
+    """
+
+    @event.listens_for(session_factory, "after_flush")
+    def collect(session: Session, flush_context) -> None:
+        # Whole workspaces: an edited row may have moved to another provider
+        changed: Set[str] = {
+            str(obj.workspace_id)
+            for obj in (*session.new, *session.dirty, *session.deleted)
+            if isinstance(obj, APIKey)
+        }
+        if changed:
+            session.info.setdefault(_SESSION_KEY, set()).update(changed)
+
+    @event.listens_for(session_factory, "after_commit")
+    def apply(session: Session) -> None:
+        for workspace_id in session.info.pop(_SESSION_KEY, ()):
+            adapter_cache.invalidate(workspace_id)
+
+    @event.listens_for(session_factory, "after_rollback")
+    def discard(session: Session) -> None:
+        session.info.pop(_SESSION_KEY, None)
+
+
+def _associated_data(workspace_id: str) -> bytes:
+    return uuid.UUID(str(workspace_id)).bytes
+
+
+def _decrypt_into(
+    plaintexts: List[Optional[str]],
+    batch: List[Tuple[int, str]],
+    service: EncryptionService,
+    associated_data: Optional[bytes] = None
+) -> None:
+    pairs = []
+    for _, value in batch:
+        iv, encrypted = value.split(":", 1)
+        pairs.append((encrypted, iv))
+    for (position, _), plaintext in zip(batch, service.decrypt_many(pairs, associated_data)):
+        plaintexts[position] = plaintext
+
+
+def _enabled_keys(workspace_id: str, session_factory: sessionmaker) -> Tuple[Optional[str], List[tuple]]:
+    """The workspace's wrapped data key and its enabled (provider, encrypted_key) rows"""
+    workspace_uuid = uuid.UUID(str(workspace_id))
+    with session_factory() as session:
+        wrapped_data_key = session.query(Workspace.encrypted_data_key).filter(
+            Workspace.id == workspace_uuid
+        ).scalar()
+        rows = [
+            (row.provider, row.encrypted_key)
+            for row in session.query(APIKey.provider, APIKey.encrypted_key)
+            .filter(APIKey.workspace_id == workspace_uuid)
+            .filter(APIKey.enabled.is_(True))
+            .order_by(APIKey.created_at)
+        ]
+    return wrapped_data_key, rows
+
+
+def _store_api_key(
+    workspace_id: str,
+    provider: str,
+    api_key: str,
+    enabled: bool,
+    session_factory: sessionmaker
+) -> str:
+    workspace_uuid = uuid.UUID(str(workspace_id))
+    with session_factory() as session:
+        # Locked, so concurrent first keys do not each generate a data key
+        workspace = session.query(Workspace).filter(Workspace.id == workspace_uuid).with_for_update().first()
+        if workspace is None:
+            raise ValueError(f"Workspace {workspace_id} not found")
+        wrapped_data_key = ensure_data_key(workspace)
+        key_id = uuid.uuid4()
+        session.add(APIKey(
+            id=key_id,
+            workspace_id=workspace_uuid,
+            provider=provider,
+            encrypted_key=seal_api_key(api_key, workspace_id, wrapped_data_key),
+            enabled=enabled,
+        ))
+        session.commit()
+    return str(key_id)
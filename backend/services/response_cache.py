@@ -0,0 +1,208 @@
+"""
+Response Cache Service
+
+Exact-match cache in front of adapter chat() for deterministic requests.
+
+A request is cacheable at temperature 0, or at any temperature when the
+workspace opts in (Workspace.settings["response_cache"]). The key is a
+SHA-256 of the workspace, the normalized messages, the model, the
+temperature and max_tokens, so workspaces never share entries. Entries
+live in a bounded in-memory LRU with a TTL, optionally backed by a disk
+tier that survives restarts. Hits are replayed chunk by chunk, so callers
+see the same streaming interface as a live response.
+"""
+
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from pathlib import Path
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+from utils.cache import TTLCache
+
+
+# Seconds a cached response stays valid
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+
+# Directory for the on-disk tier (unset: memory only)
+RESPONSE_CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR") or None
+
+# Responses longer than this are not cached
+MAX_CACHED_RESPONSE_CHARS = 200_000
+
+
+def normalize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+    """
+    Reduce messages to what the provider sees.
+
+    Metadata (ids, timestamps, stored token counts) is dropped, line
+    endings are unified and trailing whitespace is stripped, so equivalent
+    prompts share a key.
+    """
+    return [
+        {
+            "role": str(msg.get("role", "")).lower(),
+            "content": str(msg.get("content", "")).replace("\r\n", "\n").rstrip(),
+        }
+        for msg in messages
+    ]
+
+
+def response_cache_key(
+    workspace_id: Optional[str],
+    messages: List[Dict[str, Any]],
+    model: str,
+    temperature: float,
+    max_tokens: Optional[int]
+) -> str:
+    """Stable SHA-256 key for a chat request"""
+    payload = json.dumps(
+        {
+            "workspace": str(workspace_id or ""),
+            "messages": normalize_messages(messages),
+            "model": model,
+            "temperature": float(temperature),
+            "max_tokens": max_tokens,
+        },
+        sort_keys=True,
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier (memory, optional disk) cache of chat responses.
+
+    Values are the list of chunks the provider streamed, so a replay keeps
+    the original chunking.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 2048,
+        ttl: float = RESPONSE_CACHE_TTL_SECONDS,
+        disk_dir: Optional[str] = RESPONSE_CACHE_DIR
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: In-memory entries before least-recently-used eviction
+            ttl: Seconds an entry stays valid (both tiers)
+            disk_dir: Directory for the disk tier, or None for memory only
+        """
+        self.ttl = ttl
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self.disk_hits = 0
+        self.replays = 0
+        self.stores = 0
+
+    @staticmethod
+    def is_cacheable(temperature: Optional[float], workspace_opt_in: bool = False) -> bool:
+        """Whether a request may be served from / stored in the cache"""
+        return workspace_opt_in or temperature == 0
+
+    async def get(self, key: str) -> Optional[List[str]]:
+        """Cached chunks for a key, checking memory then disk"""
+        chunks = self.memory.get(key)
+        if chunks is not None or self.disk_dir is None:
+            return chunks
+
+        entry = await asyncio.to_thread(self._read_disk, key)
+        if entry is None:
+            return None
+        expires_at, chunks = entry
+        self.memory.set(key, chunks, ttl=expires_at - time.time())
+        self.disk_hits += 1
+        return chunks
+
+    async def set(self, key: str, chunks: List[str]) -> None:
+        """Store a complete response"""
+        self.memory.set(key, chunks)
+        self.stores += 1
+        if self.disk_dir is not None:
+            await asyncio.to_thread(self._write_disk, key, chunks, time.time() + self.ttl)
+
+    async def wrap(
+        self,
+        key: str,
+        open_stream: Callable[[], AsyncIterator[str]],
+        on_hit: Optional[Callable[[], None]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Serve a request through the cache.
+
+        On a hit the cached chunks are replayed, `on_hit` is called and
+        `open_stream` is never called. On a miss the live stream is passed
+        through and stored once it completes; failed, abandoned or empty
+        streams are not cached.
+        """
+        chunks = await self.get(key)
+        if chunks is not None:
+            self.replays += 1
+            if on_hit is not None:
+                on_hit()
+            for chunk in chunks:
+                yield chunk
+            return
+
+        stream = open_stream()
+        received: List[str] = []
+        size = 0
+        try:
+            async for chunk in stream:
+                if size <= MAX_CACHED_RESPONSE_CHARS:
+                    received.append(chunk)
+                    size += len(chunk)
+                yield chunk
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+        # Empty responses are not cached: the executor treats them as failures
+        if received and size <= MAX_CACHED_RESPONSE_CHARS:
+            await self.set(key, received)
+
+    def stats(self) -> Dict[str, Any]:
+        """Memory tier counters plus disk hits and replays"""
+        return {
+            **self.memory.stats(),
+            "disk_enabled": self.disk_dir is not None,
+            "disk_hits": self.disk_hits,
+            "replays": self.replays,
+            "stores": self.stores,
+        }
+
+    def _path(self, key: str) -> Path:
+        return self.disk_dir / key[:2] / f"{key}.json"
+
+    def _read_disk(self, key: str) -> Optional[tuple]:
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        if entry.get("expires_at", 0) <= time.time():
+            path.unlink(missing_ok=True)
+            return None
+        return entry["expires_at"], entry["chunks"]
+
+    def _write_disk(self, key: str, chunks: List[str], expires_at: float) -> None:
+        path = self._path(key)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Write-then-rename so readers never see a partial entry
+            with tempfile.NamedTemporaryFile(
+                "w", encoding="utf-8", dir=path.parent, delete=False, suffix=".tmp"
+            ) as f:
+                json.dump({"expires_at": expires_at, "chunks": chunks}, f, ensure_ascii=False)
+            os.replace(f.name, path)
+        except OSError:
+            pass  # the disk tier is best-effort
@@ -0,0 +1,236 @@
+"""
+Semantic Cache Service
+
+Answers repeat questions from earlier conversations in the same
+workspace without calling a provider.
+
+The incoming prompt is embedded and compared (pgvector cosine distance)
+against the MessageEmbedding vectors of previous user prompts in the
+workspace. If the nearest prompt is at least `threshold` similar and was
+answered, that assistant reply is returned. Database work runs in a
+worker thread so the event loop is never blocked on Postgres.
+
+With an in-process VectorIndex the neighbour search skips Postgres
+entirely; only hits load their reply from the database. With an
+EmbeddingPipeline, prompt embeddings are stored through it, so a prompt
+the pipeline also picked up is embedded and inserted only once.
+"""
+
+from bisect import bisect_left
+from typing import Any, Dict, List, Optional, Sequence
+import asyncio
+import os
+import time
+import uuid
+
+from pydantic import BaseModel
+from sqlalchemy.orm import Session, sessionmaker
+
+from adapters.base import BaseAdapter
+from database import Conversation, Message, MessageEmbedding, SessionLocal
+from services.embedding_pipeline import EmbeddingPipeline
+from services.vector_index import VectorIndex
+
+
+# Minimum cosine similarity (0-1) for a cached reply to be served
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95"))
+
+# Upper bucket edges for the reported similarity distribution
+SIMILARITY_BUCKETS = (0.5, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 1.0)
+
+
+class SemanticHit(BaseModel):
+    """A cached reply to a similar earlier prompt"""
+    reply: str
+    similarity: float
+    message_id: str
+    reply_message_id: str
+    model_used: Optional[str] = None
+
+
+class SemanticLookup(BaseModel):
+    """Outcome of a lookup; the embedding can be stored for the new prompt"""
+    embedding: List[float]
+    hit: Optional[SemanticHit] = None
+    similarity: Optional[float] = None
+
+
+class SemanticCache:
+    """
+    Nearest-neighbour cache over MessageEmbedding.
+
+    Keeps hit rate, the similarity distribution of nearest neighbours and
+    an estimate of provider time saved for status reporting.
+    """
+
+    def __init__(
+        self,
+        threshold: float = SEMANTIC_CACHE_THRESHOLD,
+        session_factory: sessionmaker = SessionLocal,
+        index: Optional[VectorIndex] = None,
+        pipeline: Optional[EmbeddingPipeline] = None
+    ):
+        """
+        Initialize the cache.
+
+        Args:
+            threshold: Minimum cosine similarity for a hit
+            session_factory: SQLAlchemy session factory
+            index: In-process index to search instead of pgvector
+            pipeline: Running embedding pipeline to store prompt vectors through
+        """
+        self.threshold = threshold
+        self.session_factory = session_factory
+        self.index = index
+        self.pipeline = pipeline
+
+        self.lookups = 0
+        self.hits = 0
+        self.errors = 0
+        self.similarity_counts = [0] * len(SIMILARITY_BUCKETS)
+        self.lookup_seconds = 0.0
+        self.seconds_saved = 0.0
+
+    async def lookup(
+        self,
+        workspace_id: str,
+        prompt: str,
+        embedder: BaseAdapter
+    ) -> Optional[SemanticLookup]:
+        """
+        Find a cached reply for a prompt.
+
+        Args:
+            workspace_id: Only this workspace's conversations are searched
+            prompt: The new user prompt
+            embedder: Adapter with supports_embeddings
+
+        Returns:
+            SemanticLookup (with .hit set on a hit), or None if the lookup
+            itself failed
+        """
+        started = time.perf_counter()
+        self.lookups += 1
+        try:
+            embedding = (await embedder.embed([prompt]))[0]
+            if self.index is not None:
+                nearest = await self._nearest_indexed(workspace_id, embedding)
+            else:
+                nearest = await asyncio.to_thread(self._nearest, workspace_id, embedding)
+        except Exception:
+            self.errors += 1
+            return None
+        finally:
+            self.lookup_seconds += time.perf_counter() - started
+
+        if nearest is None:
+            return SemanticLookup(embedding=embedding)
+
+        similarity = nearest["similarity"]
+        self.similarity_counts[bisect_left(SIMILARITY_BUCKETS[:-1], similarity)] += 1
+        if similarity < self.threshold or nearest["reply"] is None:
+            return SemanticLookup(embedding=embedding, similarity=similarity)
+
+        self.hits += 1
+        return SemanticLookup(
+            embedding=embedding,
+            similarity=similarity,
+            hit=SemanticHit(
+                reply=nearest["reply"].content,
+                similarity=similarity,
+                message_id=str(nearest["message_id"]),
+                reply_message_id=str(nearest["reply"].id),
+                model_used=nearest["reply"].model_used,
+            ),
+        )
+
+    async def remember(self, workspace_id: str, message_id: str, embedding: Sequence[float]) -> None:
+        """Store a user prompt's embedding so later prompts can match it"""
+        if self.pipeline is not None:
+            self.pipeline.submit(message_id, workspace_id, "", embedding=embedding)
+            return
+        try:
+            await asyncio.to_thread(self._insert, message_id, list(embedding))
+        except Exception:
+            self.errors += 1
+
+    def record_saved(self, seconds: float) -> None:
+        """Credit the provider time a hit avoided (net of lookup cost)"""
+        self.seconds_saved += max(0.0, seconds)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit rate, similarity distribution and latency saved"""
+        return {
+            "threshold": self.threshold,
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "errors": self.errors,
+            "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            "similarity_distribution": {
+                f"<={edge}": count
+                for edge, count in zip(SIMILARITY_BUCKETS, self.similarity_counts)
+            },
+            "mean_lookup_ms": 1000 * self.lookup_seconds / self.lookups if self.lookups else 0.0,
+            "seconds_saved": self.seconds_saved,
+        }
+
+    def _nearest(self, workspace_id: str, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Nearest earlier user prompt in the workspace and the reply that followed it"""
+        distance = MessageEmbedding.embedding.cosine_distance(embedding)
+        with self.session_factory() as session:
+            row = (
+                session.query(Message.id, Message.conversation_id, Message.created_at, distance.label("distance"))
+                .join(MessageEmbedding, MessageEmbedding.message_id == Message.id)
+                .join(Conversation, Conversation.id == Message.conversation_id)
+                .filter(Conversation.workspace_id == uuid.UUID(str(workspace_id)))
+                .filter(Message.role == "user")
+                .order_by(distance)
+                .limit(1)
+                .first()
+            )
+            if row is None:
+                return None
+            return {
+                "message_id": row.id,
+                "similarity": 1.0 - float(row.distance),
+                "reply": self._reply_to(session, row.conversation_id, row.created_at),
+            }
+
+    async def _nearest_indexed(self, workspace_id: str, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Nearest prompt from the in-process index; the reply is only loaded above threshold"""
+        results = self.index.search(embedding, workspace_id, k=1)
+        if not results:
+            return None
+        message_id, similarity = results[0]
+        reply = None
+        if similarity >= self.threshold:
+            reply = await asyncio.to_thread(self._reply_for, message_id)
+        return {"message_id": message_id, "similarity": similarity, "reply": reply}
+
+    def _reply_for(self, message_id: str) -> Optional[Message]:
+        with self.session_factory() as session:
+            prompt = session.get(Message, uuid.UUID(str(message_id)))
+            # Only prompts are indexed, but an index built by an older version may hold replies
+            if prompt is None or prompt.role != "user":
+                return None
+            return self._reply_to(session, prompt.conversation_id, prompt.created_at)
+
+    @staticmethod
+    def _reply_to(session: Session, conversation_id, asked_at) -> Optional[Message]:
+        """The next message in the conversation, if it is an assistant reply"""
+        following = (
+            session.query(Message)
+            .filter(Message.conversation_id == conversation_id)
+            .filter(Message.created_at > asked_at)
+            .order_by(Message.created_at)
+            .first()
+        )
+        if following is None or following.role != "assistant":
+            return None
+        session.expunge(following)
+        return following
+
+    def _insert(self, message_id: str, embedding: List[float]) -> None:
+        with self.session_factory() as session:
+            session.add(MessageEmbedding(message_id=uuid.UUID(str(message_id)), embedding=embedding))
+            session.commit()
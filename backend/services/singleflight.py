@@ -0,0 +1,195 @@
+"""
+Single-Flight Service
+
+Coalesces identical in-flight chat requests onto one provider stream.
+
+Requests are keyed on the response cache hash (workspace, normalized
+messages, model, temperature, max_tokens). Only deterministic requests
+(those the ResponseCache would serve) are coalesced: concurrent sampled
+requests each get their own answer. The first request for a key starts
+the upstream stream; requests that arrive while it is running attach to
+it and are handed the leader's shared value (the usage the upstream call
+fills in), so they can report its usage without paying for it again.
+
+Chunks are kept in a fan-out buffer, so a late subscriber replays what it
+missed and then follows live. The upstream is read no further ahead of
+the slowest subscriber than `max_buffered_chunks`; once that much has
+been read by everyone, the read prefix is dropped and the flight stops
+taking new subscribers (they could no longer replay from the start). An
+upstream error reaches every subscriber. The upstream call is cancelled
+once its last subscriber leaves.
+"""
+
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+import asyncio
+
+# Chunks the upstream may be read ahead of the slowest subscriber
+MAX_BUFFERED_CHUNKS = 256
+
+
+class _Flight:
+    """One upstream stream and its fan-out buffer"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        # Index (over the whole stream) of chunks[0]; > 0 once the read prefix was dropped
+        self.offset = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        # Chunks read so far, by subscriber
+        self.positions: Dict[object, int] = {}
+        self.shared: Any = None
+        self.task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+        self._advanced = asyncio.Event()
+
+    @property
+    def end(self) -> int:
+        """Chunks received from the upstream so far"""
+        return self.offset + len(self.chunks)
+
+    @property
+    def slowest(self) -> int:
+        """Chunks read by the slowest subscriber"""
+        return min(self.positions.values(), default=self.end)
+
+    def notify(self) -> None:
+        """Wake every subscriber waiting for the next chunk"""
+        self._wake.set()
+        self._wake = asyncio.Event()
+
+    async def wait(self, seen: int) -> None:
+        """Wait until there is something past chunk `seen` (or the flight ended)"""
+        wake = self._wake
+        if seen < self.end or self.done:
+            return
+        await wake.wait()
+
+    def advanced(self) -> None:
+        """Wake the upstream reader after a subscriber read or left"""
+        self._advanced.set()
+        self._advanced = asyncio.Event()
+
+    async def wait_for_readers(self, max_ahead: int) -> None:
+        """Wait until the slowest subscriber is less than `max_ahead` chunks behind"""
+        while self.end - self.slowest >= max_ahead:
+            await self._advanced.wait()
+
+
+class SingleFlight:
+    """In-flight request registry keyed on request hashes"""
+
+    def __init__(self, max_buffered_chunks: int = MAX_BUFFERED_CHUNKS):
+        """
+        Initialize the registry.
+
+        Args:
+            max_buffered_chunks: Chunks the upstream may be read ahead of
+                the slowest subscriber
+        """
+        self.max_buffered_chunks = max_buffered_chunks
+        self._flights: Dict[str, _Flight] = {}
+        self.flights = 0
+        self.coalesced = 0
+
+    async def join(
+        self,
+        key: str,
+        open_stream: Callable[[], AsyncIterator[str]],
+        shared: Any = None,
+        on_coalesced: Optional[Callable[[Any], None]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Stream the response for `key`, sharing a running upstream if any.
+
+        Args:
+            key: Request hash (see response_cache_key)
+            open_stream: Starts the upstream stream; called only when no
+                request for `key` is in flight
+            shared: Kept with the flight when this request starts it
+            on_coalesced: Called with the running flight's `shared` value
+                when this request attaches to it instead
+
+        Yields:
+            str: The upstream's chunks, from the first one
+        """
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            flight.shared = shared
+            flight.task = asyncio.ensure_future(self._pump(key, flight, open_stream))
+            self._flights[key] = flight
+            self.flights += 1
+        else:
+            self.coalesced += 1
+            if on_coalesced is not None:
+                on_coalesced(flight.shared)
+        subscriber = object()
+        flight.positions[subscriber] = 0
+
+        seen = 0
+        try:
+            while True:
+                await flight.wait(seen)
+                while seen < flight.end:
+                    chunk = flight.chunks[seen - flight.offset]
+                    seen += 1
+                    flight.positions[subscriber] = seen
+                    flight.advanced()
+                    yield chunk
+                if flight.done and seen == flight.end:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            del flight.positions[subscriber]
+            flight.advanced()
+            if not flight.positions and not flight.done:
+                # Nobody is listening any more: stop paying for the upstream call
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """Upstream streams started, requests that attached to one, and how many are running"""
+        return {
+            "in_flight": len(self._flights),
+            "flights": self.flights,
+            "coalesced": self.coalesced,
+        }
+
+    async def _pump(
+        self,
+        key: str,
+        flight: _Flight,
+        open_stream: Callable[[], AsyncIterator[str]]
+    ) -> None:
+        """Read the upstream into the flight's buffer, at the pace of its slowest subscriber"""
+        stream = open_stream()
+        try:
+            async for chunk in stream:
+                flight.chunks.append(chunk)
+                flight.notify()
+                await flight.wait_for_readers(self.max_buffered_chunks)
+                if flight.slowest - flight.offset >= self.max_buffered_chunks:
+                    # Late subscribers could no longer replay from the start
+                    self._forget(key, flight)
+                    del flight.chunks[:flight.slowest - flight.offset]
+                    flight.offset = flight.slowest
+        except Exception as e:
+            flight.error = e
+        finally:
+            # Also on cancellation (last subscriber left), which is re-raised
+            self._forget(key, flight)
+            flight.done = True
+            flight.notify()
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                try:
+                    await aclose()
+                except (RuntimeError, StopAsyncIteration):
+                    pass
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        # Later requests start a new flight rather than joining a finished one
+        if self._flights.get(key) is flight:
+            del self._flights[key]
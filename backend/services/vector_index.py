@@ -0,0 +1,573 @@
+"""
+Vector Index Service
+
+In-process approximate nearest-neighbour index over the embeddings of
+user prompts, for semantic search without a Postgres round trip.
+Assistant and system messages are not indexed: the semantic cache matches
+prompts, never replies. Only message ids are stored, so serving a hit
+still loads its reply from the database; a node without database access
+can search the index but not answer from it.
+
+- Vectors are L2-normalized, so inner product is cosine similarity.
+- Small workspaces (and every workspace before the index is trained) are
+  searched exactly over their own rows.
+- Large workspaces use IVF-PQ: a coarse k-means quantizer picks `nprobe`
+  lists, product-quantized residuals (vector minus its list centroid)
+  score the candidates from lookup tables, and the best few are re-ranked
+  against the stored float32 vectors.
+- Arrays are NumPy .npy files opened as memory maps, so a restarted
+  process reopens the index instead of rebuilding it. Metadata is saved
+  at most every `save_interval` seconds as rows are added; backfill()
+  reconciles the rows added since with the database at startup.
+
+attach_to_sessions() keeps the index in sync as MessageEmbedding rows are
+committed through the ORM; bulk inserts call add_many() directly.
+"""
+
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+from pathlib import Path
+import json
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from database import Conversation, Message, MessageEmbedding, SessionLocal
+
+
+# Directory for the memory-mapped index (unset: in-memory only)
+VECTOR_INDEX_DIR = os.getenv("VECTOR_INDEX_DIR") or None
+
+EMBEDDING_DIMENSIONS = 1536
+
+# Workspaces with at most this many vectors are searched exactly
+EXACT_SEARCH_MAX_ROWS = 512
+
+# Vectors needed before IVF-PQ is trained (in a background thread)
+TRAIN_THRESHOLD = 4096
+
+# Seconds between metadata saves while rows are being added
+SAVE_INTERVAL_SECONDS = 10.0
+
+# Role of the messages whose vectors are indexed
+INDEXED_ROLE = "user"
+
+_SESSION_KEY = "vector_index_pending"
+
+
+class _RowList:
+    """Append-only int32 array with amortized growth"""
+
+    def __init__(self, rows: Optional[np.ndarray] = None):
+        self._rows = np.array(rows if rows is not None else [], dtype=np.int32)
+        self._size = len(self._rows)
+
+    def append(self, row: int) -> None:
+        if self._size == len(self._rows):
+            grown = np.empty(max(16, 2 * self._size), dtype=np.int32)
+            grown[:self._size] = self._rows[:self._size]
+            self._rows = grown
+        self._rows[self._size] = row
+        self._size += 1
+
+    def array(self) -> np.ndarray:
+        return self._rows[:self._size]
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class VectorIndex:
+    """
+    IVF-PQ index with per-workspace filtering.
+
+    Rows are never moved: replacing or deleting a message's vector
+    tombstones its row (workspace code -1).
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = VECTOR_INDEX_DIR,
+        dim: int = EMBEDDING_DIMENSIONS,
+        nlist: int = 256,
+        subquantizers: int = 48,
+        train_threshold: int = TRAIN_THRESHOLD,
+        exact_search_max_rows: int = EXACT_SEARCH_MAX_ROWS,
+        save_interval: float = SAVE_INTERVAL_SECONDS
+    ):
+        """
+        Open (or create) an index.
+
+        Args:
+            path: Directory for the memory-mapped arrays, or None
+            dim: Vector dimension
+            nlist: Coarse IVF lists
+            subquantizers: PQ sub-vectors per vector (must divide dim)
+            train_threshold: Vectors before IVF-PQ is trained automatically
+            exact_search_max_rows: Workspace size searched exactly
+            save_interval: Seconds between saves triggered by add_many()
+        """
+        if dim % subquantizers:
+            raise ValueError("subquantizers must divide dim")
+        self.path = Path(path) if path else None
+        self.dim = dim
+        self.nlist = nlist
+        self.subquantizers = subquantizers
+        self.train_threshold = train_threshold
+        self.exact_search_max_rows = exact_search_max_rows
+        self.save_interval = save_interval
+        self._saved_at = time.monotonic()
+
+        self._lock = threading.Lock()
+        self._training: Optional[threading.Thread] = None
+        self.count = 0
+        self.trained = False
+        # Outcome of the last backfill() (rows added, or the error it raised)
+        self.backfilled: Optional[int] = None
+        self.backfill_error: Optional[str] = None
+        self.coarse: Optional[np.ndarray] = None
+        self.codebooks: Optional[np.ndarray] = None
+        self.workspaces: List[str] = []
+        self._code_offsets = np.arange(subquantizers, dtype=np.intp) * 256
+
+        if self.path is not None and (self.path / "meta.json").exists():
+            self._load()
+        else:
+            self._allocate(1024)
+
+        self._rebuild_maps()
+
+    # Writes
+
+    def add(self, message_id: str, workspace_id: str, vector: Sequence[float]) -> None:
+        """Index (or replace) one message's vector"""
+        self.add_many([(message_id, workspace_id, vector)])
+
+    def add_many(self, items: Iterable[Tuple[str, str, Sequence[float]]]) -> None:
+        """Index (or replace) (message_id, workspace_id, vector) triples"""
+        items = list(items)
+        if not items:
+            return
+        vectors = _normalize(np.asarray([vector for _, _, vector in items], dtype=np.float32))
+
+        with self._lock:
+            self._reserve(self.count + len(items))
+            for (message_id, workspace_id, _), vector in zip(items, vectors):
+                message_key = uuid.UUID(str(message_id))
+                self._tombstone(message_key)
+
+                row = self.count
+                code = self._workspace_code(str(workspace_id))
+                self.ids[row] = np.frombuffer(message_key.bytes, dtype=np.uint8)
+                self.workspace_codes[row] = code
+                self.vectors[row] = vector
+                if self.trained:
+                    lists, codes = self._encode_rows(vector[None, :], 0, 1, self.coarse, self.codebooks)
+                    self.lists[row], self.codes[row] = lists[0], codes[0]
+                    self._list_rows.setdefault(int(self.lists[row]), _RowList()).append(row)
+                else:
+                    self.lists[row] = -1
+                self._workspace_rows.setdefault(code, _RowList()).append(row)
+                self._row_by_id[message_key] = row
+                self.count += 1
+
+        if not self.trained and self.count >= self.train_threshold:
+            self.train_in_background()
+        elif self.path is not None and time.monotonic() - self._saved_at >= self.save_interval:
+            self.save()
+
+    def remove(self, message_id: str) -> None:
+        """Drop a message's vector"""
+        with self._lock:
+            self._tombstone(uuid.UUID(str(message_id)))
+
+    # Reads
+
+    def search(
+        self,
+        vector: Sequence[float],
+        workspace_id: str,
+        k: int = 10,
+        nprobe: int = 8,
+        rerank: int = 64
+    ) -> List[Tuple[str, float]]:
+        """
+        Top-k most similar messages in a workspace.
+
+        Args:
+            vector: Query embedding
+            workspace_id: Only this workspace's messages are returned
+            k: Results to return
+            nprobe: IVF lists probed (large workspaces)
+            rerank: PQ candidates re-scored against the stored vectors
+
+        Returns:
+            (message_id, cosine similarity) pairs, most similar first
+        """
+        query = _normalize(np.asarray(vector, dtype=np.float32)[None, :])[0]
+        with self._lock:
+            code = self._workspace_index.get(str(workspace_id))
+            if code is None:
+                return []
+            rows = self._workspace_rows.get(code, _RowList()).array()
+            if self.trained and len(rows) > self.exact_search_max_rows:
+                candidates = self._probe(query, code, nprobe, max(rerank, k))
+            else:
+                candidates = rows[self.workspace_codes[rows] == code]
+            if not len(candidates):
+                return []
+
+            scores = self.vectors[candidates] @ query
+            top = _top_k(scores, k)
+            return [
+                (str(uuid.UUID(bytes=self.ids[candidates[i]].tobytes())), float(scores[i]))
+                for i in top
+            ]
+
+    def __len__(self) -> int:
+        return len(self._row_by_id)
+
+    def stats(self) -> Dict[str, object]:
+        """Size, training state and the last backfill's outcome"""
+        return {
+            "vectors": len(self),
+            "rows": self.count,
+            "trained": self.trained,
+            "backfilled": self.backfilled,
+            "backfill_error": self.backfill_error,
+        }
+
+    # Training
+
+    def train(self, sample_size: int = 20_000, iterations: int = 8, seed: int = 0) -> None:
+        """
+        Train the coarse quantizer and PQ codebooks, then encode every row.
+
+        The heavy work runs without the lock; only rows added meanwhile
+        are encoded while holding it.
+        """
+        rng = np.random.default_rng(seed)
+        with self._lock:
+            snapshot = self.count
+            vectors = self.vectors
+        if snapshot == 0:
+            return
+
+        sample = np.asarray(vectors[np.sort(rng.choice(snapshot, min(sample_size, snapshot), replace=False))])
+        coarse = _kmeans(sample, min(self.nlist, len(sample)), iterations, rng)
+        residuals = sample - coarse[_nearest_centroid(sample, coarse)]
+        dsub = self.dim // self.subquantizers
+        codebooks = np.stack([
+            _kmeans(residuals[:, j * dsub:(j + 1) * dsub], min(256, len(sample)), iterations, rng)
+            for j in range(self.subquantizers)
+        ])
+        if codebooks.shape[1] < 256:
+            codebooks = np.concatenate(
+                [codebooks, np.repeat(codebooks[:, -1:], 256 - codebooks.shape[1], axis=1)], axis=1
+            )
+
+        lists, codes = self._encode_rows(vectors, 0, snapshot, coarse, codebooks)
+        with self._lock:
+            self.coarse, self.codebooks = coarse, codebooks
+            self.lists[:snapshot] = lists
+            self.codes[:snapshot] = codes
+            if self.count > snapshot:
+                lists, codes = self._encode_rows(self.vectors, snapshot, self.count, coarse, codebooks)
+                self.lists[snapshot:self.count] = lists
+                self.codes[snapshot:self.count] = codes
+            self.trained = True
+            self._rebuild_maps()
+        self.save()
+
+    def train_in_background(self) -> None:
+        """Start train() in a daemon thread (no-op if already training)"""
+        if self._training is not None and self._training.is_alive():
+            return
+        self._training = threading.Thread(target=self.train, name="vector-index-train", daemon=True)
+        self._training.start()
+
+    # Persistence
+
+    def save(self) -> None:
+        """Flush memory maps and write metadata (no-op without a path)"""
+        if self.path is None:
+            return
+        with self._lock:
+            for array in (self.ids, self.workspace_codes, self.lists, self.codes, self.vectors):
+                array.flush()
+            if self.trained:
+                np.save(self.path / "coarse.npy", self.coarse)
+                np.save(self.path / "codebooks.npy", self.codebooks)
+            meta = {
+                "dim": self.dim,
+                "nlist": self.nlist,
+                "subquantizers": self.subquantizers,
+                "count": self.count,
+                "trained": self.trained,
+                "workspaces": self.workspaces,
+            }
+            tmp = self.path / "meta.json.tmp"
+            tmp.write_text(json.dumps(meta))
+            os.replace(tmp, self.path / "meta.json")
+            self._saved_at = time.monotonic()
+
+    def backfill(self, session_factory: sessionmaker = SessionLocal, batch_size: int = 5000) -> int:
+        """
+        Reconcile the index with the stored user-prompt embeddings; returns rows added.
+
+        Indexes every MessageEmbedding the index is missing (all of them on
+        a new edge node; after a crash, those added since the last save)
+        and drops rows whose embedding is gone. Vectors are only read for
+        the missing rows.
+        """
+        # Snapshot before reading: rows committed meanwhile are then re-added, never dropped
+        with self._lock:
+            indexed = set(self._row_by_id)
+
+        prompts = (
+            select(MessageEmbedding.message_id)
+            .join(Message, Message.id == MessageEmbedding.message_id)
+            .join(Conversation, Conversation.id == Message.conversation_id)
+            .where(Message.role == INDEXED_ROLE)
+        )
+        added = 0
+        with session_factory() as session:
+            stored = {
+                uuid.UUID(str(message_id))
+                for message_id in session.scalars(prompts.execution_options(yield_per=batch_size))
+            }
+            with self._lock:
+                for message_key in indexed - stored:
+                    self._tombstone(message_key)
+
+            missing = list(stored - indexed)
+            for start in range(0, len(missing), batch_size):
+                rows = session.execute(
+                    prompts.with_only_columns(
+                        MessageEmbedding.message_id, Conversation.workspace_id, MessageEmbedding.embedding
+                    ).where(MessageEmbedding.message_id.in_(missing[start:start + batch_size]))
+                ).all()
+                self.add_many((row[0], row[1], row[2]) for row in rows)
+                added += len(rows)
+        self.save()
+        self.backfilled, self.backfill_error = added, None
+        return added
+
+    # Internals
+
+    def _probe(self, query: np.ndarray, code: int, nprobe: int, candidates: int) -> np.ndarray:
+        """IVF-PQ candidates for a query within one workspace"""
+        coarse_scores = self.coarse @ query
+        probes = _top_k(coarse_scores, nprobe)
+        rows = [self._list_rows[p].array() for p in probes if p in self._list_rows]
+        if not rows:
+            return np.empty(0, dtype=np.int32)
+        rows = np.concatenate(rows)
+        rows = rows[self.workspace_codes[rows] == code]
+
+        dsub = self.dim // self.subquantizers
+        # q.x = q.centroid + q.residual; the residual tables are shared by every list
+        tables = np.matmul(self.codebooks, query.reshape(self.subquantizers, dsub, 1)).ravel()
+        approx = coarse_scores[self.lists[rows]] + np.take(
+            tables, self.codes[rows].astype(np.intp) + self._code_offsets
+        ).sum(axis=1)
+        return rows[_top_k(approx, candidates)]
+
+    def _encode_rows(self, vectors, start, stop, coarse, codebooks, chunk: int = 8192):
+        lists = np.empty(stop - start, dtype=np.int32)
+        codes = np.empty((stop - start, self.subquantizers), dtype=np.uint8)
+        for offset in range(start, stop, chunk):
+            block = np.asarray(vectors[offset:min(stop, offset + chunk)], dtype=np.float32)
+            assigned = _nearest_centroid(block, coarse)
+            lists[offset - start:offset - start + len(block)] = assigned
+            codes[offset - start:offset - start + len(block)] = _pq_encode(block - coarse[assigned], codebooks)
+        return lists, codes
+
+    def _tombstone(self, message_key: uuid.UUID) -> None:
+        row = self._row_by_id.pop(message_key, None)
+        if row is not None:
+            self.workspace_codes[row] = -1
+
+    def _workspace_code(self, workspace_id: str) -> int:
+        code = self._workspace_index.get(workspace_id)
+        if code is None:
+            code = len(self.workspaces)
+            self.workspaces.append(workspace_id)
+            self._workspace_index[workspace_id] = code
+        return code
+
+    def _allocate(self, capacity: int, keep: int = 0) -> None:
+        """Create every row array with room for `capacity` rows, carrying over the first `keep`"""
+        specs = (
+            ("ids", "ids", (capacity, 16), np.uint8),
+            ("workspace_codes", "workspaces", (capacity,), np.int32),
+            ("lists", "lists", (capacity,), np.int32),
+            ("codes", "codes", (capacity, self.subquantizers), np.uint8),
+            # Last: a crash between renames leaves the vectors at the old
+            # capacity, so the next _reserve() grows every array again
+            ("vectors", "vectors", (capacity, self.dim), np.float32),
+        )
+        arrays = []
+        for attr, name, shape, dtype in specs:
+            array = self._array(name, shape, dtype)
+            if keep:
+                array[:keep] = getattr(self, attr)[:keep]
+            arrays.append(array)
+
+        for (attr, name, _, _), array in zip(specs, arrays):
+            if self.path is not None:
+                # Swapped in only once it holds every row, and by rename, so
+                # readers of the old map keep a valid inode
+                array.flush()
+                os.replace(self.path / f"{name}.npy.tmp", self.path / f"{name}.npy")
+            setattr(self, attr, array)
+
+    def _reserve(self, needed: int) -> None:
+        """Grow every row array (doubling) to hold `needed` rows"""
+        capacity = len(self.vectors)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        self._allocate(capacity, keep=self.count)
+
+    def _array(self, name: str, shape, dtype) -> np.ndarray:
+        """A zeroed array, memory-mapped to `<name>.npy.tmp` when the index has a path"""
+        if self.path is None:
+            return np.zeros(shape, dtype=dtype)
+        self.path.mkdir(parents=True, exist_ok=True)
+        return np.lib.format.open_memmap(self.path / f"{name}.npy.tmp", mode="w+", dtype=dtype, shape=shape)
+
+    def _load(self) -> None:
+        meta = json.loads((self.path / "meta.json").read_text())
+        if meta["dim"] != self.dim or meta["subquantizers"] != self.subquantizers:
+            raise ValueError(f"Vector index at {self.path} was built with different dimensions")
+        self.nlist = meta["nlist"]
+        self.count = meta["count"]
+        self.trained = meta["trained"]
+        self.workspaces = meta["workspaces"]
+
+        def open_array(name: str) -> np.ndarray:
+            return np.load(self.path / f"{name}.npy", mmap_mode="r+")
+
+        self.ids = open_array("ids")
+        self.workspace_codes = open_array("workspaces")
+        self.lists = open_array("lists")
+        self.codes = open_array("codes")
+        self.vectors = open_array("vectors")
+        if self.trained:
+            self.coarse = np.load(self.path / "coarse.npy")
+            self.codebooks = np.load(self.path / "codebooks.npy")
+
+    def _rebuild_maps(self) -> None:
+        """Derive workspace / IVF row lists and the id map from the arrays"""
+        live = np.flatnonzero(self.workspace_codes[:self.count] >= 0).astype(np.int32)
+        self._workspace_index = {workspace: code for code, workspace in enumerate(self.workspaces)}
+        self._workspace_rows = _group(live, self.workspace_codes[live])
+        self._list_rows = _group(live, self.lists[live]) if self.trained else {}
+        self._row_by_id = {
+            uuid.UUID(bytes=self.ids[row].tobytes()): int(row) for row in live
+        }
+
+
+def attach_to_sessions(index: VectorIndex, session_factory: sessionmaker = SessionLocal) -> None:
+    """
+    Mirror committed MessageEmbedding writes for user prompts into the index.
+
+    New and deleted embeddings are collected at flush (when the workspace
+    can still be looked up) and applied only after the transaction
+    commits; a rollback discards them.
+    """
+
+    @event.listens_for(session_factory, "after_flush")
+    def collect(session: Session, flush_context) -> None:
+        added = [obj for obj in session.new if isinstance(obj, MessageEmbedding)]
+        removed = [obj.message_id for obj in session.deleted if isinstance(obj, MessageEmbedding)]
+        if not added and not removed:
+            return
+
+        workspaces = {}
+        if added:
+            workspaces = dict(session.execute(
+                select(Message.id, Conversation.workspace_id)
+                .join(Conversation, Conversation.id == Message.conversation_id)
+                .where(Message.id.in_({obj.message_id for obj in added}))
+                .where(Message.role == INDEXED_ROLE)
+            ).all())
+
+        pending = session.info.setdefault(_SESSION_KEY, {"added": [], "removed": []})
+        pending["added"].extend(
+            (obj.message_id, workspaces[obj.message_id], list(obj.embedding))
+            for obj in added
+            if obj.embedding is not None and obj.message_id in workspaces
+        )
+        pending["removed"].extend(removed)
+
+    @event.listens_for(session_factory, "after_commit")
+    def apply(session: Session) -> None:
+        pending = session.info.pop(_SESSION_KEY, None)
+        if pending:
+            for message_id in pending["removed"]:
+                index.remove(message_id)
+            index.add_many(pending["added"])
+
+    @event.listens_for(session_factory, "after_rollback")
+    def discard(session: Session) -> None:
+        session.info.pop(_SESSION_KEY, None)
+
+
+# NumPy helpers
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1.0, norms)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, highest first"""
+    if k >= len(scores):
+        return np.argsort(-scores, kind="stable")
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+def _nearest_centroid(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest (L2) centroid for each vector"""
+    distances = (centroids * centroids).sum(axis=1)[None, :] - 2.0 * (vectors @ centroids.T)
+    return distances.argmin(axis=1).astype(np.int32)
+
+
+def _pq_encode(vectors: np.ndarray, codebooks: np.ndarray) -> np.ndarray:
+    subquantizers, _, dsub = codebooks.shape
+    codes = np.empty((len(vectors), subquantizers), dtype=np.uint8)
+    for j in range(subquantizers):
+        codes[:, j] = _nearest_centroid(vectors[:, j * dsub:(j + 1) * dsub], codebooks[j])
+    return codes
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Lloyd's k-means (sums per cluster via sort + reduceat)"""
+    centroids = data[rng.choice(len(data), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest_centroid(data, centroids)
+        order = np.argsort(assignment, kind="stable")
+        clusters, starts, counts = np.unique(assignment[order], return_index=True, return_counts=True)
+        centroids[clusters] = np.add.reduceat(data[order], starts, axis=0) / counts[:, None]
+        empty = np.setdiff1d(np.arange(k), clusters)
+        if len(empty):
+            centroids[empty] = data[rng.choice(len(data), len(empty), replace=False)]
+    return centroids
+
+
+def _group(rows: np.ndarray, keys: np.ndarray) -> Dict[int, _RowList]:
+    """Rows grouped by key (rows keep their order)"""
+    if not len(rows):
+        return {}
+    order = np.argsort(keys, kind="stable")
+    unique, starts = np.unique(keys[order], return_index=True)
+    groups = np.split(rows[order], starts[1:])
+    return {int(key): _RowList(group) for key, group in zip(unique, groups)}
@@ -0,0 +1,29 @@
+"""
+Workspace Service
+
+Reads workspace settings (cache opt-ins and other per-workspace flags).
+"""
+
+from typing import Any, Dict
+import asyncio
+import uuid
+
+from sqlalchemy.orm import sessionmaker
+
+from database import SessionLocal, Workspace
+
+
+async def load_settings(
+    workspace_id: str,
+    session_factory: sessionmaker = SessionLocal
+) -> Dict[str, Any]:
+    """A workspace's settings ({} if it has none)"""
+    return await asyncio.to_thread(_settings, workspace_id, session_factory)
+
+
+def _settings(workspace_id: str, session_factory: sessionmaker) -> Dict[str, Any]:
+    with session_factory() as session:
+        settings = session.query(Workspace.settings).filter(
+            Workspace.id == uuid.UUID(str(workspace_id))
+        ).scalar()
+    return settings or {}
@@ -0,0 +1,13 @@
+"""
+Backend unit tests.
+
+Run from backend/ with:
+
+    python -m pytest tests
+"""
+
+from pathlib import Path
+import sys
+
+# Modules import each other as top-level packages (services.*, utils.*), as when the app runs from backend/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
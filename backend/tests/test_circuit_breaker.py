@@ -0,0 +1,115 @@
+from services.circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CircuitState
+
+
+def tripped(open_seconds: float = 60.0, **config) -> CircuitBreaker:
+    breaker = CircuitBreaker(min_requests=2, error_rate=0.5, open_seconds=open_seconds, **config)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_stays_closed_below_min_requests():
+    breaker = CircuitBreaker(min_requests=5, error_rate=0.5)
+    for _ in range(4):
+        breaker.record_failure()
+
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.allow_request()
+
+
+def test_opens_at_the_error_rate():
+    breaker = CircuitBreaker(min_requests=4, error_rate=0.5)
+    breaker.record_success()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state is CircuitState.CLOSED
+
+    breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
+
+
+def test_only_the_rolling_window_counts():
+    breaker = CircuitBreaker(window=4, min_requests=4, error_rate=0.5)
+    breaker.record_failure()
+    for _ in range(4):
+        breaker.record_success()
+    breaker.record_failure()
+
+    # The first failure has left the window: 1 failure in 4
+    assert breaker.state is CircuitState.CLOSED
+
+
+def test_open_circuit_refuses_requests():
+    breaker = tripped()
+
+    assert not breaker.available()
+    assert not breaker.allow_request()
+
+
+def test_half_opens_after_the_cooldown():
+    breaker = tripped(open_seconds=0.0)
+
+    assert breaker.state is CircuitState.HALF_OPEN
+    assert breaker.allow_request()
+    # One trial at a time by default
+    assert not breaker.allow_request()
+
+
+def test_half_open_success_closes():
+    breaker = tripped(open_seconds=0.0)
+    breaker.allow_request()
+    breaker.record_success()
+
+    assert breaker.state is CircuitState.CLOSED
+    assert breaker.snapshot()["recent_requests"] == 0
+
+
+def test_half_open_failure_reopens():
+    breaker = tripped(open_seconds=0.0)
+    breaker.allow_request()
+    # A fresh cooldown, so the reopened circuit stays open
+    breaker.open_seconds = 60.0
+
+    breaker.record_failure()
+    assert breaker.state is CircuitState.OPEN
+    assert not breaker.allow_request()
+
+
+def test_release_returns_a_trial_slot():
+    breaker = tripped(open_seconds=0.0, half_open_trials=1)
+    assert breaker.allow_request()
+    assert not breaker.available()
+
+    breaker.release()
+    assert breaker.allow_request()
+
+
+def test_state_changes_are_reported():
+    changes = []
+    breaker = tripped(open_seconds=0.0, on_state_change=lambda b: changes.append(b._state))
+    breaker.allow_request()
+    breaker.record_success()
+
+    assert changes == [CircuitState.OPEN, CircuitState.HALF_OPEN, CircuitState.CLOSED]
+
+
+def test_registry_tracks_open_circuits():
+    registry = CircuitBreakerRegistry(min_requests=1, error_rate=0.5, open_seconds=60.0)
+    breaker = registry.get("openai", "gpt-4o")
+    assert registry.get("openai", "gpt-4o") is breaker
+    assert registry.open_circuits() == (frozenset(), 0)
+
+    breaker.record_failure()
+    open_keys, version = registry.open_circuits()
+    assert open_keys == {("openai", "gpt-4o")}
+    assert version == 1
+    assert registry.snapshot()["openai/gpt-4o"]["state"] == "open"
+
+
+def test_registry_forgets_circuits_after_the_cooldown():
+    registry = CircuitBreakerRegistry(min_requests=1, error_rate=0.5, open_seconds=0.0)
+    registry.get("anthropic", "claude").record_failure()
+
+    open_keys, version = registry.open_circuits()
+    assert open_keys == frozenset()
+    assert version == 2
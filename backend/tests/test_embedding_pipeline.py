@@ -0,0 +1,70 @@
+import asyncio
+import uuid
+
+from sqlalchemy.exc import IntegrityError
+
+from services.embedding_pipeline import EmbeddingJob, EmbeddingPipeline
+
+
+class StubPipeline(EmbeddingPipeline):
+    """Pipeline whose inserts fail for chosen messages, without a database"""
+
+    def __init__(self, bad_ids=(), **kwargs):
+        super().__init__(embedder_for=None, attempts=1, **kwargs)
+        self.bad_ids = {uuid.UUID(message_id) for message_id in bad_ids}
+        self.inserts = []
+        self.stored = []
+
+    def _already_embedded(self, message_ids):
+        return set()
+
+    def _bulk_insert(self, rows):
+        self.inserts.append(len(rows))
+        if any(row["message_id"] in self.bad_ids for row in rows):
+            raise IntegrityError("INSERT", {}, Exception("foreign key violation"))
+        self.stored.extend(str(row["message_id"]) for row in rows)
+
+
+def job(embedding=(0.1, 0.2)):
+    return EmbeddingJob(str(uuid.uuid4()), "w1", "hello", 0.0, list(embedding))
+
+
+def test_one_bad_row_fails_only_itself():
+    batch = [job() for _ in range(4)]
+    pipeline = StubPipeline(bad_ids=[batch[1].message_id])
+
+    asyncio.run(pipeline._process(batch))
+
+    assert pipeline.stored == [batch[0].message_id, batch[2].message_id, batch[3].message_id]
+    assert pipeline.embedded == 3
+    assert pipeline.failed == 1
+    # A deterministic error is not retried: one bulk attempt, then one per row
+    assert pipeline.inserts == [4, 1, 1, 1, 1]
+
+
+def test_failed_rows_are_counted_once():
+    ready = [job() for _ in range(2)]
+    unembedded = EmbeddingJob(str(uuid.uuid4()), "w2", "hello", 0.0)
+    pipeline = StubPipeline(bad_ids=[item.message_id for item in ready])
+
+    class FailingEmbedder:
+        supports_embeddings = True
+
+        async def embed(self, texts):
+            raise RuntimeError("provider down")
+
+    async def embedder_for(workspace_id):
+        return FailingEmbedder()
+
+    pipeline.embedder_for = embedder_for
+
+    async def run():
+        pipeline.start()
+        for item in (*ready, unembedded):
+            pipeline.submit(item.message_id, item.workspace_id, item.content, item.embedding)
+        await pipeline.stop()
+
+    asyncio.run(run())
+
+    assert pipeline.failed == 3
+    assert pipeline.embedded == 0
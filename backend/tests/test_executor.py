@@ -0,0 +1,178 @@
+import asyncio
+
+from adapters.base import BaseAdapter
+from adapters.events import Finish, TextDelta
+from lucidia import LucidiaRouter, ModelProvider, RoutingDecision
+from services.executor import ChatExecutor, CircuitOpenError, EmptyResponseError, ExecutionError
+
+
+class StubAdapter(BaseAdapter):
+    """Streams fixed chunks after an optional delay"""
+
+    def __init__(self, chunks=(), delay=0.0):
+        super().__init__("test-key")
+        self.chunks = list(chunks)
+        self.delay = delay
+        self.calls = 0
+
+    async def _chat_events(self, messages, model, stream=True, temperature=0.7, max_tokens=None, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        for chunk in self.chunks:
+            yield TextDelta(text=chunk)
+        yield Finish(reason="stop")
+
+    async def count_tokens(self, text, model):
+        return len(text) // 4
+
+    async def list_models(self):
+        return []
+
+    async def validate_key(self):
+        return True
+
+    def _get_model_pricing(self):
+        return {}
+
+
+def decision(selected: str, provider: ModelProvider, *alternatives: str) -> RoutingDecision:
+    return RoutingDecision(
+        selected_model=selected,
+        selected_provider=provider,
+        reasoning="test",
+        alternatives=list(alternatives),
+        estimated_cost=0.0,
+        confidence_score=1.0
+    )
+
+
+def run_stream(executor, routing, adapters, **kwargs):
+    async def run():
+        return [chunk async for chunk in executor.stream(
+            routing, [{"role": "user", "content": "hi"}], adapters, workspace_id="w1", **kwargs
+        )]
+    return asyncio.run(run())
+
+
+def test_empty_stream_falls_back_and_counts_as_failure():
+    router = LucidiaRouter()
+    executor = ChatExecutor(router)
+    adapters = {
+        ModelProvider.XAI: StubAdapter([]),
+        ModelProvider.ANTHROPIC: StubAdapter(["answer"]),
+    }
+
+    chunks = run_stream(executor, decision("grok-beta", ModelProvider.XAI, "claude-3-haiku"), adapters)
+
+    assert chunks == ["answer"]
+    assert executor.fallbacks == 1
+    snapshot = router.circuit_breakers.get(ModelProvider.XAI, "grok-beta").snapshot()
+    assert snapshot["recent_error_rate"] == 1.0
+
+
+def test_every_model_empty_raises():
+    router = LucidiaRouter()
+    executor = ChatExecutor(router)
+
+    try:
+        run_stream(executor, decision("grok-beta", ModelProvider.XAI), {ModelProvider.XAI: StubAdapter([])})
+    except ExecutionError as e:
+        assert isinstance(e.failures[0][1], EmptyResponseError)
+    else:
+        raise AssertionError("expected ExecutionError")
+
+
+def count_releases(router, provider, model_id):
+    breaker = router.circuit_breakers.get(provider, model_id)
+    releases = []
+    release = breaker.release
+    breaker.release = lambda: (releases.append(1), release())
+    return breaker, releases
+
+
+def test_first_chunk_timeout_records_a_failure_without_releasing():
+    router = LucidiaRouter()
+    executor = ChatExecutor(router, first_chunk_timeout=0.05)
+    breaker, releases = count_releases(router, ModelProvider.XAI, "grok-beta")
+
+    try:
+        run_stream(executor, decision("grok-beta", ModelProvider.XAI), {ModelProvider.XAI: StubAdapter(["late"], delay=1.0)})
+    except ExecutionError as e:
+        assert isinstance(e.failures[0][1], asyncio.TimeoutError)
+    else:
+        raise AssertionError("expected ExecutionError")
+
+    assert releases == []
+    assert breaker.snapshot()["recent_error_rate"] == 1.0
+
+
+def test_lost_hedge_is_released_not_failed():
+    router = LucidiaRouter()
+    executor = ChatExecutor(router, hedge_default_delay=0.02, hedge_min_delay=0.02)
+    breaker, releases = count_releases(router, ModelProvider.XAI, "grok-beta")
+    adapters = {
+        ModelProvider.XAI: StubAdapter(["slow"], delay=1.0),
+        ModelProvider.ANTHROPIC: StubAdapter(["fast"]),
+    }
+
+    chunks = run_stream(executor, decision("grok-beta", ModelProvider.XAI, "claude-3-haiku"), adapters, hedge=True)
+
+    assert chunks == ["fast"]
+    assert executor.hedges_won == 1
+    assert releases == [1]
+    assert breaker.snapshot()["recent_requests"] == 0
+
+
+class PricedAdapter(StubAdapter):
+    def _get_model_pricing(self):
+        return {"grok-beta": {"input": 1.0, "output": 2.0}}
+
+
+class FailingAdapter(StubAdapter):
+    async def _chat_events(self, messages, model, stream=True, temperature=0.7, max_tokens=None, **kwargs):
+        self.calls += 1
+        raise RuntimeError("provider down")
+        yield
+
+
+def summarize(executor, adapter):
+    async def run():
+        return [chunk async for chunk in executor._summary_chat(
+            "grok-beta", adapter, [{"role": "user", "content": "summarize this"}], max_tokens=64
+        )]
+    return asyncio.run(run())
+
+
+def test_summary_calls_are_metered():
+    router = LucidiaRouter()
+    executor = ChatExecutor(router)
+
+    assert summarize(executor, PricedAdapter(["a short summary"])) == ["a short summary"]
+
+    usage = executor.stats()["summary_usage"]
+    assert usage["requests"] == 1
+    assert usage["input_tokens"] > 0 and usage["output_tokens"] > 0
+    assert usage["roadcoin_cost"] > 0
+
+
+def test_summary_failures_reach_the_circuit_breaker():
+    router = LucidiaRouter()
+    executor = ChatExecutor(router)
+    breaker = router.circuit_breakers.get(ModelProvider.XAI, "grok-beta")
+    adapter = FailingAdapter()
+
+    while breaker.available():
+        try:
+            summarize(executor, adapter)
+        except RuntimeError:
+            pass
+    calls = adapter.calls
+
+    try:
+        summarize(executor, adapter)
+    except CircuitOpenError:
+        pass
+    else:
+        raise AssertionError("expected CircuitOpenError")
+    assert adapter.calls == calls
+    assert executor.summary_usage["requests"] == 0
@@ -0,0 +1,49 @@
+from services.executor import HedgeBudget
+
+
+def test_starts_with_a_full_bucket():
+    budget = HedgeBudget(ratio=0.5, burst=2.0)
+
+    assert budget.available("w1") == 2.0
+    assert budget.try_acquire("w1")
+    assert budget.try_acquire("w1")
+    assert not budget.try_acquire("w1")
+
+
+def test_requests_earn_hedge_tokens():
+    budget = HedgeBudget(ratio=0.5, burst=2.0)
+    budget.try_acquire("w1")
+    budget.try_acquire("w1")
+
+    budget.record_request("w1")
+    assert not budget.try_acquire("w1")
+    budget.record_request("w1")
+    assert budget.try_acquire("w1")
+    assert budget.available("w1") == 0.0
+
+
+def test_tokens_are_capped_at_burst():
+    budget = HedgeBudget(ratio=0.5, burst=2.0)
+    for _ in range(100):
+        budget.record_request("w1")
+
+    assert budget.available("w1") == 2.0
+
+
+def test_default_ratio_bounds_hedges_to_five_percent():
+    budget = HedgeBudget()
+    hedges = 0
+    for _ in range(1000):
+        budget.record_request("w1")
+        hedges += budget.try_acquire("w1")
+
+    # The initial burst, plus 5% of the requests
+    assert hedges <= 5 + 1000 * 0.05
+
+
+def test_workspaces_have_separate_buckets():
+    budget = HedgeBudget(ratio=0.5, burst=1.0)
+
+    assert budget.try_acquire("w1")
+    assert not budget.try_acquire("w1")
+    assert budget.try_acquire("w2")
@@ -0,0 +1,66 @@
+import asyncio
+
+import pytest
+
+from services.latency import LatencyTracker
+
+
+async def stream(chunks, delay=0.0, fail=None):
+    await asyncio.sleep(delay)
+    for chunk in chunks:
+        yield chunk
+    if fail is not None:
+        raise fail
+
+
+def test_timed_stream_records_ttft_and_throughput():
+    tracker = LatencyTracker()
+
+    async def run():
+        return [chunk async for chunk in tracker.track("m", stream(["Hello", " there", " friend"], delay=0.01))]
+
+    assert asyncio.run(run()) == ["Hello", " there", " friend"]
+    latency = tracker.models["m"]
+    assert latency.samples == 1 and latency.censored == 0
+    assert latency.ttft_ewma >= 0.01
+
+
+def test_cancelled_before_first_chunk_is_a_censored_sample():
+    tracker = LatencyTracker()
+
+    async def run():
+        timed = tracker.track("m", stream(["late"], delay=10))
+        task = asyncio.ensure_future(timed.__anext__())
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        await timed.aclose()
+
+    asyncio.run(run())
+    latency = tracker.models["m"]
+    assert latency.samples == 1 and latency.censored == 1
+    assert latency.ttft_samples[0] >= 0.05
+
+
+def test_censored_samples_raise_the_percentiles():
+    tracker = LatencyTracker()
+    for _ in range(10):
+        tracker.observe("m", ttft=0.2)
+    for _ in range(10):
+        tracker.observe("m", ttft=3.0, censored=True)
+
+    assert tracker.ttft_percentile("m", 95) == 3.0
+
+
+@pytest.mark.parametrize("chunks,fail", [([], None), ([], RuntimeError("provider error"))])
+def test_failed_or_empty_streams_are_not_recorded(chunks, fail):
+    tracker = LatencyTracker()
+
+    async def run():
+        try:
+            return [chunk async for chunk in tracker.track("m", stream(chunks, fail=fail))]
+        except RuntimeError:
+            return None
+
+    asyncio.run(run())
+    assert "m" not in tracker.models
@@ -0,0 +1,93 @@
+import asyncio
+from types import SimpleNamespace
+
+from adapters.openai import OpenAIAdapter, _token_usage
+
+
+class FakeStream:
+    """Streamed chat completion as the pinned SDK yields it"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for chunk in self.chunks:
+            yield chunk
+
+    async def close(self):
+        self.closed = True
+
+
+def chunk(text=None, finish_reason=None, usage=None):
+    choices = []
+    if text is not None or finish_reason is not None:
+        choices = [SimpleNamespace(delta=SimpleNamespace(content=text), finish_reason=finish_reason)]
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def adapter_streaming(chunks):
+    adapter = OpenAIAdapter("sk-test")
+    stream = FakeStream(chunks)
+    requests = []
+
+    async def create(**kwargs):
+        requests.append(kwargs)
+        return stream
+
+    adapter.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return adapter, stream, requests
+
+
+def test_dict_usage():
+    usage = _token_usage({
+        "prompt_tokens": 120,
+        "completion_tokens": 30,
+        "prompt_tokens_details": {"cached_tokens": 100},
+    })
+
+    assert (usage.input_tokens, usage.cache_read_input_tokens, usage.output_tokens) == (20, 100, 30)
+    assert usage.reported
+
+
+def test_object_usage():
+    usage = _token_usage(SimpleNamespace(prompt_tokens=50, completion_tokens=5, prompt_tokens_details=None))
+
+    assert (usage.input_tokens, usage.cache_read_input_tokens, usage.output_tokens) == (50, 0, 5)
+
+
+def test_stream_with_dict_usage_chunk():
+    # The pinned ChatCompletionChunk has no usage field, so the final chunk's usage is a dict
+    adapter, stream, _ = adapter_streaming([
+        chunk("Hel"),
+        chunk("lo", finish_reason="stop"),
+        chunk(usage={"prompt_tokens": 12, "completion_tokens": 2, "prompt_tokens_details": {"cached_tokens": 0}}),
+    ])
+
+    async def run():
+        return [event async for event in adapter.chat_events([{"role": "user", "content": "hi"}], "gpt-4o")]
+
+    events = asyncio.run(run())
+    assert [event.text for event in events if event.type == "text"] == ["Hel", "lo"]
+    assert not [event for event in events if event.type == "error"]
+    [report] = [event for event in events if event.type == "usage"]
+    assert (report.usage.input_tokens, report.usage.output_tokens) == (12, 2)
+    assert [event.reason for event in events if event.type == "finish"] == ["stop"]
+    assert stream.closed
+
+
+def test_stream_leaves_callers_extra_body_alone():
+    adapter, _, requests = adapter_streaming([chunk("hi", finish_reason="stop")])
+    extra_body = {"user": "u1"}
+
+    async def run():
+        return [event async for event in adapter.chat_events(
+            [{"role": "user", "content": "hi"}], "gpt-4o", extra_body=extra_body
+        )]
+
+    asyncio.run(run())
+    assert extra_body == {"user": "u1"}
+    assert requests[0]["extra_body"] == {"user": "u1", "stream_options": {"include_usage": True}}
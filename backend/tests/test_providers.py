@@ -0,0 +1,56 @@
+import uuid
+
+import pytest
+from cryptography.exceptions import InvalidTag
+
+from services.providers import ensure_data_key, open_api_key, open_api_keys, seal_api_key
+from utils.crypto import get_encryption_service, get_key_ring
+
+
+@pytest.fixture(autouse=True)
+def encryption_secret(monkeypatch):
+    monkeypatch.setenv("ENCRYPTION_SECRET", "test-secret")
+
+
+class FakeWorkspace:
+    def __init__(self):
+        self.id = uuid.uuid4()
+        self.encrypted_data_key = None
+
+
+def test_sealed_key_opens_in_its_workspace():
+    workspace = FakeWorkspace()
+    wrapped = ensure_data_key(workspace)
+
+    sealed = seal_api_key("sk-live", str(workspace.id), wrapped)
+
+    assert sealed.startswith("dk:")
+    assert open_api_key(sealed, str(workspace.id), wrapped) == "sk-live"
+    assert ensure_data_key(workspace) == wrapped
+
+
+def test_sealed_key_copied_to_another_workspace_does_not_open():
+    source, target = FakeWorkspace(), FakeWorkspace()
+    wrapped = ensure_data_key(source)
+    sealed = seal_api_key("sk-live", str(source.id), wrapped)
+
+    # Even with the source's data key copied along
+    with pytest.raises(InvalidTag):
+        open_api_key(sealed, str(target.id), wrapped)
+
+
+def test_legacy_master_key_values_are_still_read():
+    workspace = FakeWorkspace()
+    wrapped = ensure_data_key(workspace)
+    encrypted, iv = get_encryption_service().encrypt("sk-old")
+    sealed = seal_api_key("sk-new", str(workspace.id), wrapped)
+
+    assert open_api_keys([f"{iv}:{encrypted}", sealed], str(workspace.id), wrapped) == ["sk-old", "sk-new"]
+
+
+def test_data_key_value_without_a_data_key_is_an_error():
+    workspace = FakeWorkspace()
+    sealed = seal_api_key("sk-live", str(workspace.id), get_key_ring().new_data_key())
+
+    with pytest.raises(ValueError):
+        open_api_key(sealed, str(workspace.id))
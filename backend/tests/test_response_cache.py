@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from services.response_cache import ResponseCache, response_cache_key
+
+
+async def stream(chunks, fail=None):
+    for chunk in chunks:
+        await asyncio.sleep(0)
+        yield chunk
+    if fail is not None:
+        raise fail
+
+
+def opener(chunks, fail=None):
+    calls = []
+
+    def open_stream():
+        calls.append(1)
+        return stream(chunks, fail)
+
+    return open_stream, calls
+
+
+async def collect(cache, key, open_stream, on_hit=None):
+    return [chunk async for chunk in cache.wrap(key, open_stream, on_hit=on_hit)]
+
+
+def test_miss_then_replay():
+    async def run():
+        cache = ResponseCache(disk_dir=None)
+        open_stream, calls = opener(["Hel", "lo", "!"])
+        hits = []
+
+        first = await collect(cache, "k", open_stream, on_hit=lambda: hits.append(1))
+        second = await collect(cache, "k", open_stream, on_hit=lambda: hits.append(1))
+
+        assert first == second == ["Hel", "lo", "!"]
+        assert len(calls) == 1
+        assert len(hits) == 1
+        assert cache.stats()["replays"] == 1
+
+    asyncio.run(run())
+
+
+def test_failed_stream_is_not_stored():
+    async def run():
+        cache = ResponseCache(disk_dir=None)
+        open_stream, _ = opener(["partial"], fail=RuntimeError("provider error"))
+
+        with pytest.raises(RuntimeError):
+            await collect(cache, "k", open_stream)
+
+        assert await cache.get("k") is None
+        assert cache.stats()["stores"] == 0
+
+    asyncio.run(run())
+
+
+def test_abandoned_stream_is_not_stored():
+    async def run():
+        cache = ResponseCache(disk_dir=None)
+        open_stream, _ = opener(["a", "b", "c"])
+
+        wrapped = cache.wrap("k", open_stream)
+        assert await wrapped.__anext__() == "a"
+        await wrapped.aclose()
+
+        assert await cache.get("k") is None
+
+    asyncio.run(run())
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    async def run():
+        open_stream, calls = opener(["x", "y"])
+        await collect(ResponseCache(disk_dir=str(tmp_path)), "k", open_stream)
+
+        restarted = ResponseCache(disk_dir=str(tmp_path))
+        assert await collect(restarted, "k", open_stream) == ["x", "y"]
+        assert len(calls) == 1
+        assert restarted.stats()["disk_hits"] == 1
+
+    asyncio.run(run())
+
+
+def test_expired_entries_are_not_replayed(tmp_path):
+    async def run():
+        cache = ResponseCache(ttl=-1, disk_dir=str(tmp_path))
+        open_stream, calls = opener(["x"])
+
+        await collect(cache, "k", open_stream)
+        await collect(cache, "k", open_stream)
+        assert len(calls) == 2
+
+    asyncio.run(run())
+
+
+def test_only_deterministic_or_opted_in_requests_are_cacheable():
+    assert ResponseCache.is_cacheable(0)
+    assert not ResponseCache.is_cacheable(0.7)
+    assert ResponseCache.is_cacheable(0.7, workspace_opt_in=True)
+
+
+def test_key_ignores_metadata_and_whitespace_but_not_the_workspace():
+    messages = [{"role": "user", "content": "Hi\r\nthere  "}]
+    equivalent = [{"role": "User", "content": "Hi\nthere", "id": "m1", "tokens_used": 3}]
+
+    key = response_cache_key("w1", messages, "gpt-4o", 0, None)
+    assert response_cache_key("w1", equivalent, "gpt-4o", 0, None) == key
+    assert response_cache_key("w2", messages, "gpt-4o", 0, None) != key
+    assert response_cache_key("w1", messages, "gpt-4o", 0, 100) != key
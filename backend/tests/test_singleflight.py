@@ -0,0 +1,204 @@
+import asyncio
+
+import pytest
+
+from services.singleflight import SingleFlight
+
+
+class Upstream:
+    """A provider stream that records how it ended"""
+
+    def __init__(self, chunks, delay=0.01, fail=None):
+        self.chunks = chunks
+        self.delay = delay
+        self.fail = fail
+        self.opened = 0
+        self.cancelled = False
+        self.finished = False
+
+    def open(self):
+        self.opened += 1
+        return self._stream()
+
+    async def _stream(self):
+        try:
+            for chunk in self.chunks:
+                await asyncio.sleep(self.delay)
+                yield chunk
+            if self.fail is not None:
+                raise self.fail
+            self.finished = True
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+
+
+async def collect(flights, key, upstream, delay=0.0, **kwargs):
+    await asyncio.sleep(delay)
+    return [chunk async for chunk in flights.join(key, upstream.open, **kwargs)]
+
+
+def test_concurrent_requests_share_one_upstream():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream(["a", "b", "c"])
+
+        # The late subscriber replays what it missed
+        results = await asyncio.gather(
+            collect(flights, "k", upstream), collect(flights, "k", upstream), collect(flights, "k", upstream, 0.015)
+        )
+
+        assert results == [["a", "b", "c"]] * 3
+        assert upstream.opened == 1
+        assert flights.stats() == {"in_flight": 0, "flights": 1, "coalesced": 2}
+
+    asyncio.run(run())
+
+
+def test_finished_flights_are_not_joined():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream(["a"])
+        await collect(flights, "k", upstream)
+        await collect(flights, "k", upstream)
+
+        assert upstream.opened == 2
+
+    asyncio.run(run())
+
+
+def test_upstream_errors_reach_every_subscriber():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream(["a"], fail=RuntimeError("provider error"))
+
+        results = await asyncio.gather(
+            collect(flights, "k", upstream), collect(flights, "k", upstream), return_exceptions=True
+        )
+        assert all(isinstance(result, RuntimeError) for result in results)
+
+    asyncio.run(run())
+
+
+def test_upstream_runs_while_any_subscriber_remains():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream(["x"] * 5)
+        first = flights.join("k", upstream.open)
+        second = flights.join("k", upstream.open)
+        await first.__anext__()
+        await second.__anext__()
+
+        await first.aclose()
+        assert [chunk async for chunk in second] == ["x"] * 4
+        assert upstream.finished and not upstream.cancelled
+
+    asyncio.run(run())
+
+
+def test_upstream_is_cancelled_when_the_last_subscriber_leaves():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream(["x"] * 100)
+        first = flights.join("k", upstream.open)
+        second = flights.join("k", upstream.open)
+        await first.__anext__()
+        await second.__anext__()
+
+        await first.aclose()
+        await second.aclose()
+        await asyncio.sleep(0.02)
+
+        assert upstream.cancelled
+        assert flights.stats()["in_flight"] == 0
+        # A new request starts a new upstream call
+        assert await collect(flights, "k", Upstream(["y"])) == ["y"]
+
+    asyncio.run(run())
+
+
+def test_coalesced_requests_get_the_leaders_shared_value():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream(["a"])
+        received = []
+
+        await asyncio.gather(
+            collect(flights, "k", upstream, shared="leader", on_coalesced=received.append),
+            collect(flights, "k", upstream, shared="follower", on_coalesced=received.append),
+        )
+        assert received == ["leader"]
+
+    asyncio.run(run())
+
+
+@pytest.mark.parametrize("delay", [0.0, 0.005])
+def test_subscribers_see_every_chunk_in_order(delay):
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream([str(i) for i in range(20)], delay=0.001)
+
+        results = await asyncio.gather(*(collect(flights, "k", upstream, delay * i) for i in range(4)))
+        assert results == [[str(i) for i in range(20)]] * 4
+
+    asyncio.run(run())
+
+
+def test_upstream_is_paced_to_the_slowest_subscriber():
+    async def run():
+        flights = SingleFlight(max_buffered_chunks=4)
+        upstream = Upstream([str(i) for i in range(100)], delay=0)
+        produced = []
+        open_stream = upstream.open
+
+        def counting():
+            async def stream():
+                async for chunk in open_stream():
+                    produced.append(chunk)
+                    yield chunk
+            return stream()
+
+        upstream.open = counting
+        slow = flights.join("k", upstream.open)
+        assert await slow.__anext__() == "0"
+        await asyncio.sleep(0.05)
+
+        # Read no more than the buffer ahead of the one chunk consumed
+        assert len(produced) <= 1 + 4 + 1
+        assert [chunk async for chunk in slow] == [str(i) for i in range(1, 100)]
+
+    asyncio.run(run())
+
+
+def test_read_prefix_is_dropped_and_late_requests_start_a_new_flight():
+    async def run():
+        flights = SingleFlight(max_buffered_chunks=4)
+        upstream = Upstream([str(i) for i in range(50)], delay=0.001)
+        first = flights.join("k", upstream.open)
+        received = [await first.__anext__() for _ in range(20)]
+
+        flight = next(iter(flights._flights.values()), None)
+        assert flight is None
+        late = await collect(flights, "k", upstream)
+
+        assert late == [str(i) for i in range(50)]
+        assert upstream.opened == 2
+        assert received + [chunk async for chunk in first] == [str(i) for i in range(50)]
+
+    asyncio.run(run())
+
+
+def test_pump_task_ends_cancelled():
+    async def run():
+        flights = SingleFlight()
+        upstream = Upstream(["x"] * 100)
+        subscriber = flights.join("k", upstream.open)
+        await subscriber.__anext__()
+        flight = flights._flights["k"]
+
+        await subscriber.aclose()
+        await asyncio.gather(flight.task, return_exceptions=True)
+        assert flight.task.cancelled()
+        assert flight.done
+
+    asyncio.run(run())
@@ -0,0 +1,34 @@
+import base64
+import hashlib
+
+import pytest
+
+from utils.tokenizer import _read_bpe_ranks, approximate_token_count
+
+
+def write_asset(path, ranks):
+    data = b"".join(base64.b64encode(token) + b" " + str(rank).encode() + b"\n" for token, rank in ranks.items())
+    path.write_bytes(data)
+    return hashlib.sha256(data).hexdigest()
+
+
+def test_reads_vendored_ranks(tmp_path):
+    ranks = {b"a": 0, b"b": 1, b" hello": 2}
+    asset = tmp_path / "test.tiktoken"
+    digest = write_asset(asset, ranks)
+
+    assert _read_bpe_ranks(asset, digest) == ranks
+
+
+def test_rejects_a_tampered_asset(tmp_path):
+    asset = tmp_path / "test.tiktoken"
+    write_asset(asset, {b"a": 0})
+
+    with pytest.raises(ValueError):
+        _read_bpe_ranks(asset, "0" * 64)
+
+
+def test_approximate_count():
+    assert approximate_token_count("") == 0
+    assert approximate_token_count("abc") == 1
+    assert approximate_token_count("a" * 40) == 10
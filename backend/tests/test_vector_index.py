@@ -0,0 +1,157 @@
+import os
+import uuid
+
+import numpy as np
+
+from services.vector_index import VectorIndex
+
+
+DIM = 32
+
+
+def make_index(path=None, **config) -> VectorIndex:
+    settings = dict(dim=DIM, nlist=16, subquantizers=8, train_threshold=10**9, exact_search_max_rows=64)
+    settings.update(config)
+    return VectorIndex(path=str(path) if path else None, **settings)
+
+
+def clustered(rng, n: int, clusters: int = 16) -> np.ndarray:
+    centers = rng.standard_normal((clusters, DIM))
+    return (centers[rng.integers(clusters, size=n)] + 0.3 * rng.standard_normal((n, DIM))).astype(np.float32)
+
+
+def test_ivf_pq_recall():
+    rng = np.random.default_rng(0)
+    vectors = clustered(rng, 3000)
+    ids = [str(uuid.uuid4()) for _ in vectors]
+    index = make_index()
+    index.add_many(zip(ids, ["w1"] * len(ids), vectors))
+    index.train()
+    assert index.trained
+
+    queries = rng.choice(len(vectors), 200, replace=False)
+    found = 0
+    for i in queries:
+        query = vectors[i] + 0.05 * rng.standard_normal(DIM).astype(np.float32)
+        results = index.search(query, "w1", k=1, nprobe=4, rerank=32)
+        found += results[0][0] == ids[i]
+
+    assert found / len(queries) >= 0.9
+
+
+def test_rows_added_after_training_are_searchable():
+    rng = np.random.default_rng(1)
+    index = make_index()
+    index.add_many((str(uuid.uuid4()), "w1", vector) for vector in clustered(rng, 1000))
+    index.train()
+
+    late = str(uuid.uuid4())
+    vector = rng.standard_normal(DIM)
+    index.add(late, "w1", vector)
+
+    assert index.search(vector, "w1", k=1)[0][0] == late
+
+
+def test_search_is_scoped_to_the_workspace():
+    rng = np.random.default_rng(2)
+    index = make_index()
+    mine, theirs = str(uuid.uuid4()), str(uuid.uuid4())
+    vector = rng.standard_normal(DIM)
+    index.add(mine, "w1", vector)
+    index.add(theirs, "w2", vector)
+
+    assert [message_id for message_id, _ in index.search(vector, "w1")] == [mine]
+    assert index.search(vector, "unknown") == []
+
+
+def test_replacing_a_vector_tombstones_the_old_row():
+    rng = np.random.default_rng(3)
+    index = make_index()
+    message_id = str(uuid.uuid4())
+    old, new = rng.standard_normal(DIM), rng.standard_normal(DIM)
+    index.add(message_id, "w1", old)
+    index.add(message_id, "w1", new)
+
+    results = index.search(old, "w1", k=10)
+    assert len(index) == 1
+    assert [found for found, _ in results] == [message_id]
+    assert abs(results[0][1] - float(np.dot(old, new) / np.linalg.norm(old) / np.linalg.norm(new))) < 1e-5
+
+
+def test_removed_vectors_are_not_returned():
+    rng = np.random.default_rng(4)
+    index = make_index()
+    vectors = clustered(rng, 1000)
+    ids = [str(uuid.uuid4()) for _ in vectors]
+    index.add_many(zip(ids, ["w1"] * len(ids), vectors))
+    index.train()
+
+    index.remove(ids[0])
+    results = index.search(vectors[0], "w1", k=5, nprobe=16)
+    assert len(index) == len(ids) - 1
+    assert ids[0] not in {message_id for message_id, _ in results}
+
+
+def test_reopens_from_disk(tmp_path):
+    rng = np.random.default_rng(5)
+    index = make_index(tmp_path)
+    vectors = clustered(rng, 2000)
+    ids = [str(uuid.uuid4()) for _ in vectors]
+    # Past the initial capacity, so the arrays are grown
+    index.add_many(zip(ids, ["w1"] * len(ids), vectors))
+    index.train()
+    index.remove(ids[1])
+    index.save()
+
+    reopened = make_index(tmp_path)
+    assert reopened.trained
+    assert len(reopened) == len(ids) - 1
+    assert reopened.search(vectors[2], "w1", k=1)[0][0] == ids[2]
+    assert ids[1] not in {message_id for message_id, _ in reopened.search(vectors[1], "w1", k=5)}
+
+
+def test_interrupted_growth_keeps_the_saved_rows(tmp_path, monkeypatch):
+    rng = np.random.default_rng(6)
+    index = make_index(tmp_path)
+    vectors = clustered(rng, 1000)
+    ids = [str(uuid.uuid4()) for _ in vectors]
+    index.add_many(zip(ids, ["w1"] * len(ids), vectors))
+    index.save()
+
+    replace = os.replace
+    renames = []
+
+    def crash_on_third_rename(src, dst):
+        # Killed after the ids and workspace arrays were swapped for the grown ones
+        renames.append(dst)
+        if len(renames) == 3:
+            raise OSError("killed")
+        replace(src, dst)
+
+    monkeypatch.setattr("services.vector_index.os.replace", crash_on_third_rename)
+    try:
+        index.add_many((str(uuid.uuid4()), "w1", vector) for vector in clustered(rng, 100))
+    except OSError:
+        pass
+    monkeypatch.undo()
+
+    reopened = make_index(tmp_path)
+    assert len(reopened) == len(ids)
+    assert reopened.search(vectors[3], "w1", k=1)[0][0] == ids[3]
+
+
+def test_adding_rows_saves_periodically(tmp_path):
+    index = make_index(tmp_path, save_interval=0.0)
+    message_id = str(uuid.uuid4())
+    index.add(message_id, "w1", np.ones(DIM))
+
+    assert len(make_index(tmp_path)) == 1
+
+
+def test_stats_report_the_last_backfill():
+    index = make_index()
+    index.add(str(uuid.uuid4()), "w1", np.ones(DIM))
+
+    assert index.stats() == {
+        "vectors": 1, "rows": 1, "trained": False, "backfilled": None, "backfill_error": None,
+    }
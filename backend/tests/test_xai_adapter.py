@@ -0,0 +1,42 @@
+import asyncio
+
+import httpx
+import pytest
+
+from adapters.xai import XAIAdapter
+
+
+def adapter_answering(status: int, body: str) -> XAIAdapter:
+    adapter = XAIAdapter("xai-test")
+    adapter.client = httpx.AsyncClient(
+        transport=httpx.MockTransport(lambda request: httpx.Response(status, text=body))
+    )
+    return adapter
+
+
+def collect(adapter, stream=True):
+    async def run():
+        return [event async for event in adapter.chat_events([{"role": "user", "content": "hi"}], "grok-beta", stream=stream)]
+    return asyncio.run(run())
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_error_status_is_an_error_event(stream):
+    events = collect(adapter_answering(503, "upstream unavailable"), stream=stream)
+
+    [error] = [event for event in events if event.type == "error"]
+    assert isinstance(error.exception, httpx.HTTPStatusError)
+    assert not [event for event in events if event.type == "text"]
+
+
+def test_streamed_reply():
+    body = (
+        'data: {"choices": [{"delta": {"content": "Hi"}, "finish_reason": null}]}\n\n'
+        'data: {"choices": [{"delta": {}, "finish_reason": "stop"}], "usage": {"prompt_tokens": 3, "completion_tokens": 1}}\n\n'
+        "data: [DONE]\n\n"
+    )
+    events = collect(adapter_answering(200, body))
+
+    assert [event.text for event in events if event.type == "text"] == ["Hi"]
+    assert [event.reason for event in events if event.type == "finish"] == ["stop"]
+    assert not [event for event in events if event.type == "error"]
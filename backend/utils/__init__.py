@@ -2,6 +2,10 @@
 Utility Functions
 
 - crypto.py: Encryption/decryption (API keys)
+- cache.py: In-process LRU / TTL caches
+- tokenizer.py: Lazy, offline-capable tiktoken loading and the shared TokenizerService
+- http.py: Shared, pooled HTTP clients per origin
+- metrics.py: Sampled Prometheus timers and counters (served at /metrics)
 - validators.py: Input validation
 - formatters.py: Data formatting
 """
@@ -0,0 +1,165 @@
+"""
+Cache Utilities
+
+Small in-process caches for hot paths (routing, token counting,
+responses).
+"""
+
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+import threading
+import time
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """
+    Bounded least-recently-used cache with hit/miss counters.
+
+    Not thread-safe; intended for use from the event loop or under the
+    caller's own lock.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of entries before the oldest is evicted
+        """
+        if maxsize <= 0:
+            raise ValueError("maxsize must be positive")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get a value, marking it most recently used"""
+        value = self._data.get(key, _MISSING)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Insert or replace a value, evicting the oldest entry if full"""
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a value and return it"""
+        return self._data.pop(key, default)
+
+    def clear(self) -> None:
+        """Drop all entries (counters are kept)"""
+        self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """Size and hit/miss counters"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class ThreadSafeLRUCache(LRUCache):
+    """
+    LRUCache whose operations hold a lock.
+
+    For caches shared between the event loop and worker threads (e.g. the
+    router's, which sync endpoints use from the threadpool). Each call is
+    atomic; a get-then-set sequence is not, so two threads may both
+    compute a missing value.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        super().__init__(maxsize=maxsize)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return super().get(key, default)
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            super().set(key, value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            return super().pop(key, default)
+
+    def clear(self) -> None:
+        with self._lock:
+            super().clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return super().__contains__(key)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return super().stats()
+
+
+class TTLCache(LRUCache):
+    """
+    LRUCache whose entries also expire after a time-to-live.
+
+    Expired entries are dropped lazily when they are looked up (and count
+    as misses); otherwise eviction is least-recently-used as usual.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        """
+        Initialize the cache.
+
+        Args:
+            maxsize: Maximum number of entries before the oldest is evicted
+            ttl: Default seconds an entry stays valid
+        """
+        super().__init__(maxsize=maxsize)
+        self.ttl = ttl
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Get an unexpired value, marking it most recently used"""
+        entry = super().get(key, _MISSING)
+        if entry is _MISSING:
+            return default
+        expires_at, value = entry
+        if time.monotonic() >= expires_at:
+            self._data.pop(key, None)
+            self.hits -= 1
+            self.misses += 1
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """Insert or replace a value that expires after `ttl` seconds"""
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        super().set(key, (expires_at, value))
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        """Remove a value and return it (expired or not)"""
+        entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._data.get(key)
+        return entry is not None and time.monotonic() < entry[0]
@@ -3,14 +3,31 @@ Cryptography Utilities
 
 AES-256-GCM encryption for API keys and sensitive data.
 Per 02-ARCHITECTURE.md
+
+Envelope encryption: each workspace has a random 256-bit data key,
+stored wrapped (encrypted) by the master key in
+Workspace.encrypted_data_key. Secrets are encrypted with the data key,
+with the workspace id as AES-GCM associated data so a ciphertext only
+decrypts in the workspace it was sealed for.
+KeyRing keeps unwrapped data keys in a bounded TTL cache, so reading a
+workspace's secrets costs one unwrap and then plain AES-GCM.
 """
 
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 import os
 import base64
 
+from .cache import TTLCache
+from .metrics import ENCRYPTION_SECONDS
+
+
+# Seconds an unwrapped data key stays in memory
+DATA_KEY_CACHE_TTL_SECONDS = float(os.getenv("DATA_KEY_CACHE_TTL_SECONDS", "300"))
+
 
 class EncryptionService:
     """
@@ -36,15 +53,27 @@ class EncryptionService:
             salt=b"blackroad-os-salt",  # Static salt for deterministic key
             iterations=100000,
         )
-        self.key = kdf.derive(master_key.encode())
+        with ENCRYPTION_SECONDS.span("derive_key"):
+            self.key = kdf.derive(master_key.encode())
         self.aesgcm = AESGCM(self.key)
 
-    def encrypt(self, plaintext: str) -> tuple[str, str]:
+    @classmethod
+    def from_key(cls, key: bytes) -> "EncryptionService":
+        """Service for a raw 256-bit key (e.g. an unwrapped data key); no KDF"""
+        service = cls.__new__(cls)
+        service.key = key
+        service.aesgcm = AESGCM(key)
+        return service
+
+    @ENCRYPTION_SECONDS.timed("encrypt")
+    def encrypt(self, plaintext: str, associated_data: Optional[bytes] = None) -> tuple[str, str]:
         """
         Encrypt plaintext.
 
         Args:
             plaintext: Data to encrypt
+            associated_data: Authenticated but not encrypted; decrypt()
+                must be given the same bytes
 
         Returns:
             Tuple of (encrypted_data, iv) both base64-encoded
@@ -56,7 +85,7 @@ class EncryptionService:
         ciphertext = self.aesgcm.encrypt(
             iv,
             plaintext.encode(),
-            None  # No additional data
+            associated_data
         )
 
         # Base64 encode for storage
@@ -65,38 +94,151 @@ class EncryptionService:
 
         return encrypted_b64, iv_b64
 
-    def decrypt(self, encrypted_data: str, iv: str) -> str:
+    @ENCRYPTION_SECONDS.timed("decrypt")
+    def decrypt(self, encrypted_data: str, iv: str, associated_data: Optional[bytes] = None) -> str:
         """
         Decrypt data.
 
         Args:
             encrypted_data: Base64-encoded ciphertext
             iv: Base64-encoded initialization vector
+            associated_data: As given to encrypt()
 
         Returns:
             Decrypted plaintext
 
         Raises:
-            cryptography.exceptions.InvalidTag: If decryption fails
+            cryptography.exceptions.InvalidTag: If decryption fails (including
+                mismatched associated data)
         """
         # Decode from base64
         ciphertext = base64.b64decode(encrypted_data)
         iv_bytes = base64.b64decode(iv)
 
         # Decrypt
-        plaintext = self.aesgcm.decrypt(iv_bytes, ciphertext, None)
+        plaintext = self.aesgcm.decrypt(iv_bytes, ciphertext, associated_data)
 
         return plaintext.decode()
 
+    @ENCRYPTION_SECONDS.timed("encrypt_many")
+    def encrypt_many(
+        self,
+        plaintexts: List[str],
+        associated_data: Optional[bytes] = None
+    ) -> List[Tuple[str, str]]:
+        """
+        Encrypt several values.
+
+        Returns:
+            (encrypted_data, iv) per plaintext, as from encrypt()
+        """
+        encrypt = self.aesgcm.encrypt
+        b64encode = base64.b64encode
+        results = []
+        for plaintext in plaintexts:
+            iv = os.urandom(12)
+            ciphertext = encrypt(iv, plaintext.encode(), associated_data)
+            results.append((b64encode(ciphertext).decode(), b64encode(iv).decode()))
+        return results
+
+    @ENCRYPTION_SECONDS.timed("decrypt_many")
+    def decrypt_many(
+        self,
+        items: List[Tuple[str, str]],
+        associated_data: Optional[bytes] = None
+    ) -> List[str]:
+        """
+        Decrypt several (encrypted_data, iv) pairs.
+
+        Raises:
+            cryptography.exceptions.InvalidTag: If any value fails to decrypt
+        """
+        decrypt = self.aesgcm.decrypt
+        b64decode = base64.b64decode
+        return [
+            decrypt(b64decode(iv), b64decode(encrypted_data), associated_data).decode()
+            for encrypted_data, iv in items
+        ]
+
+    @ENCRYPTION_SECONDS.timed("wrap_key")
+    def wrap_key(self, key: bytes) -> str:
+        """Encrypt a raw key for storage ("<iv>:<ciphertext>", base64)"""
+        iv = os.urandom(12)
+        ciphertext = self.aesgcm.encrypt(iv, key, None)
+        return f"{base64.b64encode(iv).decode()}:{base64.b64encode(ciphertext).decode()}"
+
+    @ENCRYPTION_SECONDS.timed("unwrap_key")
+    def unwrap_key(self, wrapped: str) -> bytes:
+        """Decrypt a wrap_key() value"""
+        iv, ciphertext = wrapped.split(":", 1)
+        return self.aesgcm.decrypt(base64.b64decode(iv), base64.b64decode(ciphertext), None)
+
+
+class KeyRing:
+    """
+    Per-workspace data keys, wrapped by the master key.
+
+    Unwrapped keys are cached by their wrapped form, so a rotated key is
+    simply a new cache entry.
+    """
+
+    def __init__(
+        self,
+        master: EncryptionService,
+        maxsize: int = 1024,
+        ttl: float = DATA_KEY_CACHE_TTL_SECONDS
+    ):
+        """
+        Initialize the key ring.
+
+        Args:
+            master: Service holding the master key
+            maxsize: Unwrapped data keys kept in memory
+            ttl: Seconds an unwrapped key is kept
+        """
+        self.master = master
+        self._services = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    def new_data_key(self) -> str:
+        """Generate a data key; returns its wrapped form for Workspace.encrypted_data_key"""
+        return self.master.wrap_key(AESGCM.generate_key(bit_length=256))
+
+    def service_for(self, wrapped_data_key: str) -> EncryptionService:
+        """Encryption service for a wrapped data key (unwrapped once, then cached)"""
+        service = self._services.get(wrapped_data_key)
+        if service is None:
+            service = EncryptionService.from_key(self.master.unwrap_key(wrapped_data_key))
+            self._services.set(wrapped_data_key, service)
+        return service
+
+    def stats(self) -> Dict[str, Any]:
+        return self._services.stats()
+
 
 def get_encryption_service() -> EncryptionService:
     """
     Get encryption service singleton.
 
-    Uses ENCRYPTION_SECRET from environment.
+    Uses ENCRYPTION_SECRET from environment. The service (and its PBKDF2
+    key derivation) is built once per secret, not per call.
     """
     encryption_secret = os.getenv("ENCRYPTION_SECRET")
     if not encryption_secret:
         raise ValueError("ENCRYPTION_SECRET not set")
 
+    return _encryption_service(encryption_secret)
+
+
+@lru_cache(maxsize=1)
+def _encryption_service(encryption_secret: str) -> EncryptionService:
     return EncryptionService(encryption_secret)
+
+
+def get_key_ring() -> KeyRing:
+    """Key ring for workspace data keys, wrapped by the ENCRYPTION_SECRET master key"""
+    return _key_ring(get_encryption_service())
+
+
+@lru_cache(maxsize=1)
+def _key_ring(master: EncryptionService) -> KeyRing:
+    return KeyRing(master)
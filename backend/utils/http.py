@@ -0,0 +1,124 @@
+"""
+Shared HTTP Clients
+
+One pooled httpx.AsyncClient per origin (scheme, host, port), shared by
+every adapter and integration that talks to it, so requests reuse warm
+TCP/TLS connections instead of handshaking per adapter instance.
+
+Clients carry no credentials: callers pass their auth headers per
+request (the OpenAI / Anthropic SDKs do this themselves when given the
+shared client). HTTP/2 is used when the `h2` package is installed.
+"""
+
+from typing import Any, Dict, Iterable, List, Optional
+import asyncio
+import os
+
+import httpx
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+# Provider API origins, for pre-warming
+PROVIDER_BASE_URLS: Dict[str, str] = {
+    "openai": "https://api.openai.com",
+    "anthropic": "https://api.anthropic.com",
+    "xai": "https://api.x.ai",
+}
+
+# Providers whose connections are opened at startup (comma-separated)
+HTTP_PREWARM_PROVIDERS = [
+    provider.strip()
+    for provider in os.getenv("HTTP_PREWARM_PROVIDERS", "").split(",")
+    if provider.strip()
+]
+
+DEFAULT_TIMEOUT = httpx.Timeout(60.0, connect=5.0)
+DEFAULT_LIMITS = httpx.Limits(
+    max_connections=200,
+    max_keepalive_connections=50,
+    keepalive_expiry=60.0
+)
+
+
+def origin(url: str) -> str:
+    """scheme://host[:port] of a URL (clients are shared per origin)"""
+    parsed = httpx.URL(url)
+    port = f":{parsed.port}" if parsed.port else ""
+    return f"{parsed.scheme}://{parsed.host}{port}"
+
+
+class HTTPClientRegistry:
+    """Process-wide pool of httpx clients keyed by origin"""
+
+    def __init__(
+        self,
+        timeout: httpx.Timeout = DEFAULT_TIMEOUT,
+        limits: httpx.Limits = DEFAULT_LIMITS,
+        http2: bool = HTTP2_AVAILABLE
+    ):
+        self.timeout = timeout
+        self.limits = limits
+        self.http2 = http2
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self.prewarmed = 0
+
+    def get(self, base_url: str) -> httpx.AsyncClient:
+        """The shared client for a base URL's origin (created on first use)"""
+        key = origin(base_url)
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=self.limits,
+                http2=self.http2
+            )
+            self._clients[key] = client
+        return client
+
+    async def prewarm(self, base_urls: Iterable[str], timeout: float = 5.0) -> None:
+        """
+        Open a pooled connection to each origin ahead of the first request.
+
+        The response status does not matter (the request is unauthenticated);
+        failures are ignored and the first real request connects as usual.
+        """
+        async def warm(url: str) -> None:
+            try:
+                await self.get(url).head(origin(url), timeout=timeout)
+                self.prewarmed += 1
+            except httpx.HTTPError:
+                pass
+
+        await asyncio.gather(*(warm(url) for url in base_urls))
+
+    async def aclose(self) -> None:
+        """Close every client (app shutdown)"""
+        clients, self._clients = list(self._clients.values()), {}
+        await asyncio.gather(*(client.aclose() for client in clients), return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Open clients by origin, and whether HTTP/2 is on"""
+        return {
+            "http2": self.http2,
+            "clients": sorted(self._clients),
+            "prewarmed": self.prewarmed,
+        }
+
+
+http_clients = HTTPClientRegistry()
+
+
+def get_http_client(base_url: str) -> httpx.AsyncClient:
+    """Shared client for `base_url` from the process-wide registry"""
+    return http_clients.get(base_url)
+
+
+def provider_base_urls(providers: Optional[Iterable[str]] = None) -> List[str]:
+    """Origins of the given providers (default: HTTP_PREWARM_PROVIDERS)"""
+    names = HTTP_PREWARM_PROVIDERS if providers is None else providers
+    return [PROVIDER_BASE_URLS[name] for name in names if name in PROVIDER_BASE_URLS]
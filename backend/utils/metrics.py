@@ -0,0 +1,249 @@
+"""
+Metrics
+
+Prometheus instrumentation for the request hot path, served at /metrics.
+
+- Timer: a latency histogram. Observations are sampled at
+  METRICS_SAMPLE_RATE (0-1); an unsampled span does no timing and no
+  locking, so with sampling off a span costs well under a microsecond.
+- Counter: a counter that always counts, regardless of sampling, so
+  request and error totals stay exact.
+
+Both cache their labelled children, since prometheus_client's labels()
+lookup costs more than the observation itself. Label values must come
+from bounded sets (route templates, catalog models, fixed stage names).
+"""
+
+from functools import wraps
+from typing import Any, Callable, Dict, Sequence, Tuple
+import os
+import random
+import time
+
+import prometheus_client
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session, sessionmaker
+
+
+# Fraction of spans that are timed (0 turns timing off; counters still count)
+METRICS_SAMPLE_RATE = min(1.0, max(0.0, float(os.getenv("METRICS_SAMPLE_RATE", "1.0"))))
+
+# Seconds: HTTP requests and provider calls (streams can run for minutes)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Seconds: in-process work (routing, encryption)
+FAST_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+# Seconds: database queries and transactions
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+_sample_rate = METRICS_SAMPLE_RATE
+
+
+def set_sample_rate(rate: float) -> None:
+    """Change the fraction of spans that are timed (0-1)"""
+    global _sample_rate
+    _sample_rate = min(1.0, max(0.0, rate))
+
+
+def sampled() -> bool:
+    """Whether to time this span (true for a METRICS_SAMPLE_RATE fraction of calls)"""
+    rate = _sample_rate
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class _Span:
+    __slots__ = ("child", "started")
+
+    def __init__(self, child):
+        self.child = child
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.child.observe(time.perf_counter() - self.started)
+        return False
+
+
+class _Labelled:
+    """Caches a prometheus metric's children by label values"""
+
+    def __init__(self, metric):
+        self.metric = metric
+        self._children: Dict[Tuple[str, ...], Any] = {}
+
+    def child(self, labelvalues: Tuple[str, ...]):
+        child = self._children.get(labelvalues)
+        if child is None:
+            child = self.metric.labels(*labelvalues) if labelvalues else self.metric
+            self._children[labelvalues] = child
+        return child
+
+
+class Timer(_Labelled):
+    """Sampled latency histogram"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = LATENCY_BUCKETS
+    ):
+        super().__init__(prometheus_client.Histogram(name, documentation, labelnames, buckets=buckets))
+
+    def span(self, *labelvalues: str):
+        """Context manager timing its body (a no-op when not sampled)"""
+        if not sampled():
+            return _NOOP_SPAN
+        return _Span(self.child(labelvalues))
+
+    def observe(self, seconds: float, *labelvalues: str) -> None:
+        """Record a duration measured elsewhere (subject to sampling)"""
+        if sampled():
+            self.child(labelvalues).observe(seconds)
+
+    def timed(self, *labelvalues: str) -> Callable:
+        """Decorator timing every (sampled) call of a function"""
+        def decorate(func: Callable) -> Callable:
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not sampled():
+                    return func(*args, **kwargs)
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.child(labelvalues).observe(time.perf_counter() - started)
+            return wrapper
+        return decorate
+
+
+class Counter(_Labelled):
+    """Exact counter (not sampled)"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(prometheus_client.Counter(name, documentation, labelnames))
+
+    def inc(self, *labelvalues: str, amount: float = 1.0) -> None:
+        self.child(labelvalues).inc(amount)
+
+
+# HTTP (middleware/metrics.py); `route` is the route template, not the raw path
+HTTP_REQUEST_SECONDS = Timer(
+    "carpool_http_request_duration_seconds",
+    "Time from request to the last response byte",
+    ["method", "route", "status"]
+)
+HTTP_REQUESTS = Counter(
+    "carpool_http_requests",
+    "HTTP requests handled",
+    ["method", "route", "status"]
+)
+
+# Lucidia (stage: analyze_task, route)
+ROUTING_STAGE_SECONDS = Timer(
+    "carpool_routing_stage_duration_seconds",
+    "Time spent in Lucidia task analysis and routing",
+    ["stage"],
+    buckets=FAST_BUCKETS
+)
+
+# Provider calls (adapters/base.py)
+PROVIDER_FIRST_CHUNK_SECONDS = Timer(
+    "carpool_provider_first_chunk_seconds",
+    "Time from sending a chat request to its first text chunk",
+    ["provider", "model"]
+)
+PROVIDER_COMPLETION_SECONDS = Timer(
+    "carpool_provider_completion_seconds",
+    "Time from sending a chat request to the end of its stream",
+    ["provider", "model"]
+)
+PROVIDER_REQUESTS = Counter(
+    "carpool_provider_requests",
+    "Chat requests sent to providers, by outcome (ok, error, cancelled)",
+    ["provider", "model", "outcome"]
+)
+
+# Database (instrument_database)
+DB_QUERY_SECONDS = Timer(
+    "carpool_db_query_duration_seconds",
+    "Time spent executing SQL statements",
+    ["operation"],
+    buckets=DB_BUCKETS
+)
+DB_TRANSACTION_SECONDS = Timer(
+    "carpool_db_transaction_duration_seconds",
+    "Time from a session's first statement to its commit or rollback",
+    buckets=DB_BUCKETS
+)
+
+# utils/crypto.py (operation: derive_key, encrypt, decrypt, wrap_key, ...)
+ENCRYPTION_SECONDS = Timer(
+    "carpool_encryption_duration_seconds",
+    "Time spent in key derivation and AES-GCM operations",
+    ["operation"],
+    buckets=FAST_BUCKETS
+)
+
+
+_SQL_OPERATIONS = frozenset({"SELECT", "INSERT", "UPDATE", "DELETE"})
+_QUERY_STARTED = "_carpool_query_started"
+_TRANSACTION_STARTED = "metrics_transaction_started"
+
+
+def instrument_database(engine: Engine, session_factory: sessionmaker) -> None:
+    """
+    Time SQL statements (by operation) and session transactions.
+
+    Runs inside the worker threads that do the database work, so timings
+    include driver time but not time queued for a thread.
+    """
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def query_started(conn, cursor, statement, parameters, context, executemany) -> None:
+        if context is not None and sampled():
+            setattr(context, _QUERY_STARTED, time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def query_finished(conn, cursor, statement, parameters, context, executemany) -> None:
+        started = getattr(context, _QUERY_STARTED, None)
+        if started is not None:
+            words = statement.split(None, 1)
+            operation = words[0].upper() if words else ""
+            if operation not in _SQL_OPERATIONS:
+                operation = "other"
+            DB_QUERY_SECONDS.child((operation,)).observe(time.perf_counter() - started)
+
+    @event.listens_for(session_factory, "after_begin")
+    def transaction_started(session: Session, transaction, connection) -> None:
+        if _TRANSACTION_STARTED not in session.info and sampled():
+            session.info[_TRANSACTION_STARTED] = time.perf_counter()
+
+    @event.listens_for(session_factory, "after_transaction_end")
+    def transaction_finished(session: Session, transaction) -> None:
+        if transaction.parent is None:
+            started = session.info.pop(_TRANSACTION_STARTED, None)
+            if started is not None:
+                DB_TRANSACTION_SECONDS.child(()).observe(time.perf_counter() - started)
+
+
+def render() -> Tuple[bytes, str]:
+    """Every registered metric in the Prometheus text format, and its content type"""
+    return prometheus_client.generate_latest(), prometheus_client.CONTENT_TYPE_LATEST
@@ -0,0 +1,363 @@
+"""
+Tokenizer Utilities
+
+Lazy, offline-capable tiktoken loading.
+
+Encodings are loaded on first use (or warmed in a background thread at
+startup) instead of at import time. If a vendored BPE file exists in the
+asset directory it is parsed locally, so startup never needs network
+access; otherwise tiktoken's own loader/cache is used.
+Until the encoder is ready, callers can fall back to a cheap approximate
+count.
+
+TokenizerService is the single entry point for token counting (Lucidia
+and every adapter): encodings are resolved once per model and shared,
+texts can be counted in batches, very large texts are counted in a
+process pool, and providers whose exact tokenizer is only available over
+the network (Anthropic, Google) get a local estimate from the cl100k
+count, scaled by a per-provider ratio that can be calibrated against the
+usage the provider reports.
+
+The deploy workflow vendors the asset into backend/assets/tiktoken before
+packaging; elsewhere (a dev machine, the benchmarks) run once:
+
+    python utils/tokenizer.py
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+import asyncio
+import base64
+import hashlib
+import math
+import os
+import threading
+import time
+from pathlib import Path
+
+import tiktoken
+
+
+# Vendored BPE files live here as <encoding name>.tiktoken
+ASSET_DIR = Path(
+    os.getenv("TIKTOKEN_ASSET_DIR")
+    or Path(__file__).resolve().parent.parent / "assets" / "tiktoken"
+)
+
+# Everything needed to build an encoding without tiktoken_ext (which downloads)
+ENCODING_SPECS: Dict[str, Dict] = {
+    "cl100k_base": {
+        "url": "https://openaipublic.blob.core.windows.net/encodings/cl100k_base.tiktoken",
+        "sha256": "223921b76ee99bde995b7ff738513eef100fb51d18c93597a113bcffe865b2a7",
+        "pat_str": r"""(?i:'s|'t|'re|'ve|'m|'ll|'d)|[^\r\n\p{L}\p{N}]?\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]+[\r\n]*|\s*[\r\n]+|\s+(?!\S)|\s+""",
+        "special_tokens": {
+            "<|endoftext|>": 100257,
+            "<|fim_prefix|>": 100258,
+            "<|fim_middle|>": 100259,
+            "<|fim_suffix|>": 100260,
+            "<|endofprompt|>": 100276,
+        },
+    },
+}
+
+# Characters per token for the approximate counter (English prose / code)
+APPROX_CHARS_PER_TOKEN = 4.0
+
+# Seconds between background load attempts after a failure (e.g. offline)
+WARM_RETRY_SECONDS = 30.0
+
+# Encoding for models tiktoken does not know (Anthropic, Google, xAI, new OpenAI names)
+DEFAULT_ENCODING = "cl100k_base"
+
+# Provider tokens per cl100k token, for providers without a local tokenizer.
+# Starting points; calibrate() refines them from provider-reported usage.
+PROVIDER_TOKEN_RATIOS: Dict[str, float] = {
+    "anthropic": 1.10,
+    "google": 0.95,
+    "xai": 1.0,
+}
+
+# Smallest request calibrate() learns from: on shorter prompts the provider's
+# per-message framing overhead dominates the reported count
+CALIBRATION_MIN_TOKENS = 200
+
+# Texts at least this long are counted in a worker process by count_async()
+PROCESS_POOL_MIN_CHARS = 200_000
+
+
+def approximate_token_count(text: str, chars_per_token: float = APPROX_CHARS_PER_TOKEN) -> int:
+    """Cheap token estimate from character length"""
+    if not text:
+        return 0
+    return max(1, math.ceil(len(text) / chars_per_token))
+
+
+class LazyEncoding:
+    """
+    tiktoken encoding loaded on first use.
+
+    encode()/encode_batch() block until the encoding is loaded; count()
+    returns an approximate count instead while it is still loading.
+    """
+
+    def __init__(self, name: str = "cl100k_base", asset_dir: Path = ASSET_DIR):
+        self.name = name
+        self.asset_dir = Path(asset_dir)
+        self._encoding: Optional[tiktoken.Encoding] = None
+        self._lock = threading.Lock()
+        self._warming: Optional[threading.Thread] = None
+        self._retry_at = 0.0
+        self.load_error: Optional[BaseException] = None
+
+    @property
+    def ready(self) -> bool:
+        """Whether the real encoder is loaded"""
+        return self._encoding is not None
+
+    def load(self) -> tiktoken.Encoding:
+        """Load the encoding (once) and return it"""
+        if self._encoding is None:
+            with self._lock:
+                if self._encoding is None:
+                    self._encoding = self._load()
+        return self._encoding
+
+    def warm(self) -> None:
+        """Start loading in a background thread (no-op if loaded or loading)"""
+        if self.ready or time.monotonic() < self._retry_at:
+            return
+        if self._warming is not None and self._warming.is_alive():
+            return
+        self._warming = threading.Thread(
+            target=self._warm, name=f"tokenizer-warm-{self.name}", daemon=True
+        )
+        self._warming.start()
+
+    def encode(self, text: str) -> List[int]:
+        """Encode text (blocks until the encoding is loaded)"""
+        return self.load().encode(text)
+
+    def encode_batch(self, texts: List[str], num_threads: int = 8) -> List[List[int]]:
+        """Encode texts on tiktoken's thread pool (blocks until loaded)"""
+        return self.load().encode_batch(texts, num_threads=num_threads)
+
+    def count(self, text: str) -> int:
+        """Exact count when loaded, approximate count while loading"""
+        if self._encoding is None:
+            return approximate_token_count(text)
+        return len(self._encoding.encode(text))
+
+    def _warm(self) -> None:
+        try:
+            self.load()
+        except Exception as e:
+            # Keep approximating; warm() tries again after a back-off
+            self.load_error = e
+            self._retry_at = time.monotonic() + WARM_RETRY_SECONDS
+
+    def _load(self) -> tiktoken.Encoding:
+        spec = ENCODING_SPECS.get(self.name)
+        asset = self.asset_dir / f"{self.name}.tiktoken"
+        if spec is None or not asset.exists():
+            return tiktoken.get_encoding(self.name)
+
+        return tiktoken.Encoding(
+            name=self.name,
+            pat_str=spec["pat_str"],
+            mergeable_ranks=_read_bpe_ranks(asset, spec["sha256"]),
+            special_tokens=spec["special_tokens"],
+        )
+
+
+class TokenizerService:
+    """
+    Process-wide token counting.
+
+    Not thread-safe for calibration updates; counting is safe from any
+    thread once an encoding is loaded.
+    """
+
+    def __init__(
+        self,
+        provider_ratios: Optional[Dict[str, float]] = None,
+        process_pool_min_chars: int = PROCESS_POOL_MIN_CHARS,
+        max_workers: int = 2
+    ):
+        """
+        Initialize the service.
+
+        Args:
+            provider_ratios: Provider tokens per cl100k token (default:
+                PROVIDER_TOKEN_RATIOS)
+            process_pool_min_chars: Length from which count_async() counts
+                in a worker process
+            max_workers: Worker processes for large texts
+        """
+        self.provider_ratios = dict(PROVIDER_TOKEN_RATIOS if provider_ratios is None else provider_ratios)
+        self.process_pool_min_chars = process_pool_min_chars
+        self.max_workers = max_workers
+        self._encodings: Dict[str, LazyEncoding] = {}
+        self._model_encodings: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self.offloaded = 0
+
+    def encoding(self, name: str = DEFAULT_ENCODING) -> LazyEncoding:
+        """The shared LazyEncoding for an encoding name"""
+        encoding = self._encodings.get(name)
+        if encoding is None:
+            with self._lock:
+                encoding = self._encodings.setdefault(name, LazyEncoding(name))
+        return encoding
+
+    def encoding_for_model(self, model: Optional[str]) -> LazyEncoding:
+        """The encoding tiktoken uses for a model (DEFAULT_ENCODING if unknown)"""
+        if not model:
+            return self.encoding()
+        name = self._model_encodings.get(model)
+        if name is None:
+            name = _encoding_name_for_model(model)
+            self._model_encodings[model] = name
+        return self.encoding(name)
+
+    def count(self, text: str, model: Optional[str] = None, provider: Optional[str] = None) -> int:
+        """
+        Tokens in text for a model / provider.
+
+        Exact for tiktoken models; an estimate for providers in
+        provider_ratios. Approximate while the encoding is still loading.
+        """
+        encoding = self.encoding_for_model(model)
+        if not encoding.ready:
+            encoding.warm()
+            return self._scale(approximate_token_count(text), provider)
+        return self._scale(len(encoding.load().encode_ordinary(text)), provider)
+
+    def count_many(
+        self,
+        texts: List[str],
+        model: Optional[str] = None,
+        provider: Optional[str] = None,
+        num_threads: int = 8
+    ) -> List[int]:
+        """Token counts for several texts, encoded on tiktoken's thread pool"""
+        encoding = self.encoding_for_model(model)
+        if not encoding.ready:
+            encoding.warm()
+            return [self._scale(approximate_token_count(text), provider) for text in texts]
+        encoded = encoding.load().encode_ordinary_batch(list(texts), num_threads=num_threads)
+        return [self._scale(len(tokens), provider) for tokens in encoded]
+
+    async def count_async(
+        self,
+        text: str,
+        model: Optional[str] = None,
+        provider: Optional[str] = None
+    ) -> int:
+        """count() that moves very large texts off the event loop, to a worker process"""
+        encoding = self.encoding_for_model(model)
+        if len(text) < self.process_pool_min_chars or not encoding.ready:
+            return self.count(text, model, provider)
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        self.offloaded += 1
+        tokens = await asyncio.get_running_loop().run_in_executor(
+            self._pool, _count_in_worker, encoding.name, text
+        )
+        return self._scale(tokens, provider)
+
+    def calibrate(self, provider: str, estimated_tokens: int, reported_tokens: int, weight: float = 0.1) -> None:
+        """
+        Refine a provider's ratio from a request's reported usage.
+
+        Args:
+            provider: Provider name (a provider_ratios key)
+            estimated_tokens: cl100k count of what was sent (unscaled)
+            reported_tokens: Input tokens the provider billed
+            weight: Share of the new observation in the moving average
+        """
+        if provider not in self.provider_ratios or estimated_tokens < CALIBRATION_MIN_TOKENS or reported_tokens <= 0:
+            return
+        observed = reported_tokens / estimated_tokens
+        ratio = self.provider_ratios[provider]
+        self.provider_ratios[provider] = ratio + weight * (observed - ratio)
+
+    def close(self) -> None:
+        """Shut down the worker processes (app shutdown)"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Loaded encodings, provider ratios and offloaded counts"""
+        return {
+            "encodings": {name: encoding.ready for name, encoding in self._encodings.items()},
+            "provider_ratios": dict(self.provider_ratios),
+            "offloaded": self.offloaded,
+        }
+
+    def _scale(self, tokens: int, provider: Optional[str]) -> int:
+        ratio = self.provider_ratios.get(provider) if provider else None
+        if ratio is None or tokens == 0:
+            return tokens
+        return max(1, round(tokens * ratio))
+
+
+tokenizer_service = TokenizerService()
+
+
+def _encoding_name_for_model(model: str) -> str:
+    from tiktoken.model import MODEL_PREFIX_TO_ENCODING, MODEL_TO_ENCODING
+
+    if model in MODEL_TO_ENCODING:
+        return MODEL_TO_ENCODING[model]
+    for prefix, name in MODEL_PREFIX_TO_ENCODING.items():
+        if model.startswith(prefix):
+            return name
+    return DEFAULT_ENCODING
+
+
+# Worker-process side of TokenizerService.count_async
+_worker_encodings: Dict[str, LazyEncoding] = {}
+
+
+def _count_in_worker(name: str, text: str) -> int:
+    encoding = _worker_encodings.setdefault(name, LazyEncoding(name))
+    return len(encoding.load().encode_ordinary(text))
+
+
+def _read_bpe_ranks(path: Path, expected_sha256: str) -> Dict[bytes, int]:
+    """Parse a .tiktoken BPE file (one "<base64 token> <rank>" per line)"""
+    data = path.read_bytes()
+    if hashlib.sha256(data).hexdigest() != expected_sha256:
+        raise ValueError(f"Hash mismatch for tokenizer asset {path}")
+
+    ranks = {}
+    for line in data.splitlines():
+        if line:
+            token, rank = line.split()
+            ranks[base64.b64decode(token)] = int(rank)
+    return ranks
+
+
+def vendor_encoding(name: str = "cl100k_base", asset_dir: Path = ASSET_DIR) -> Path:
+    """Download an encoding's BPE file into the asset directory"""
+    from tiktoken.load import read_file
+
+    spec = ENCODING_SPECS[name]
+    contents = read_file(spec["url"])
+    if hashlib.sha256(contents).hexdigest() != spec["sha256"]:
+        raise ValueError(f"Hash mismatch downloading {spec['url']}")
+
+    asset_dir = Path(asset_dir)
+    asset_dir.mkdir(parents=True, exist_ok=True)
+    path = asset_dir / f"{name}.tiktoken"
+    path.write_bytes(contents)
+    return path
+
+
+if __name__ == "__main__":
+    print("Vendoring tokenizer assets...")
+    for encoding_name in ENCODING_SPECS:
+        print(f"✅ {vendor_encoding(encoding_name)}")